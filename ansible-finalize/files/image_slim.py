@@ -0,0 +1,176 @@
+import argparse
+import fnmatch
+import glob
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+KERNEL_DIRS = ["/boot", "/lib/modules"]
+
+
+def directory_sizes(depth):
+    """
+    Return path -> size in KB of the directories of the root filesystem up to depth.
+    """
+    output = subprocess.run(["du", "-x", "-k", "-d", str(depth), "/"], capture_output=True, text=True).stdout
+    sizes = {}
+    for line in output.splitlines():
+        size, path = line.split("\t", 1)
+        sizes[path] = int(size)
+    return sizes
+
+
+def paths_kb(paths):
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return 0
+    output = subprocess.run(["du", "-s", "-x", "-k", "-c"] + paths, capture_output=True, text=True).stdout
+    return int(output.splitlines()[-1].split()[0])
+
+
+def used_bytes(stat_result):
+    return stat_result.st_blocks * 512
+
+
+def is_allowed(path, allowlist):
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in allowlist)
+
+
+def remove_path(path, allowlist):
+    """
+    Remove a file or a directory tree, allowlisted paths and their parent
+    directories are kept. Returns the removed and kept bytes.
+    """
+    removed = kept = 0
+    if os.path.islink(path) or not os.path.isdir(path):
+        size = used_bytes(os.lstat(path))
+        if is_allowed(path, allowlist):
+            return 0, size
+        os.remove(path)
+        return size, 0
+
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            file_path = os.path.join(root, name)
+            size = used_bytes(os.lstat(file_path))
+            if is_allowed(file_path, allowlist):
+                kept += size
+                continue
+            os.remove(file_path)
+            removed += size
+        if not os.listdir(root) and not is_allowed(root, allowlist):
+            removed += used_bytes(os.lstat(root))
+            os.rmdir(root)
+    return removed, kept
+
+
+def version_key(version):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+def installed_kernels():
+    """
+    Return the kernel packages as (package, version) for dpkg and rpm based systems.
+    """
+    if os.path.exists("/usr/bin/dpkg-query"):
+        output = subprocess.run(["dpkg-query", "-W", "-f", "${Package} ${db:Status-Status}\n",
+                                 "linux-image-[0-9]*", "linux-modules-[0-9]*", "linux-modules-extra-[0-9]*",
+                                 "linux-headers-[0-9]*"], capture_output=True, text=True).stdout
+        kernels = []
+        for line in output.splitlines():
+            package, status = line.split()
+            match = re.search(r"-(\d+\.\d+\.\d+-\d+)", package)
+            if status == "installed" and match:
+                kernels.append((package, match.group(1)))
+        return kernels
+
+    output = subprocess.run(["rpm", "-q", "--qf", "%{NAME} %{VERSION}-%{RELEASE}\n", "linux", "linux-esx",
+                             "linux-secure", "linux-rt", "linux-devel", "linux-esx-devel"],
+                            capture_output=True, text=True).stdout
+    return [tuple(line.split()) for line in output.splitlines() if len(line.split()) == 2]
+
+
+def remove_old_kernels():
+    """
+    Remove the kernels other than the running and the newest installed one,
+    an updated kernel is not running before the first boot of the node.
+    """
+    kernels = installed_kernels()
+    if not kernels:
+        return []
+    running = platform.release()
+    newest = max((version for _, version in kernels), key=version_key)
+    old = sorted(package for package, version in kernels
+                 if version != newest and not running.startswith(version))
+    if not old:
+        return []
+    logging.info(f"Removing old kernels {', '.join(old)}")
+    if os.path.exists("/usr/bin/dpkg-query"):
+        subprocess.run(["apt-get", "-y", "purge"] + old, check=True, stdout=subprocess.DEVNULL)
+    else:
+        subprocess.run(["rpm", "-e"] + [f"{package}-{version}" for package, version in kernels
+                                        if package in old], check=True, stdout=subprocess.DEVNULL)
+    return old
+
+
+def slim(denylist, allowlist, old_kernels, depth):
+    before = directory_sizes(depth)
+    report = {"removed": [], "kept_bytes": 0}
+    for pattern in denylist:
+        paths = sorted(glob.glob(pattern))
+        entry = {"pattern": pattern, "paths": len(paths), "removed_bytes": 0, "kept_bytes": 0}
+        for path in paths:
+            if not os.path.lexists(path):
+                continue
+            removed, kept = remove_path(path, allowlist)
+            entry["removed_bytes"] += removed
+            entry["kept_bytes"] += kept
+        logging.info(f"{pattern}: removed {entry['removed_bytes']} bytes from {entry['paths']} paths")
+        report["removed"].append(entry)
+        report["kept_bytes"] += entry["kept_bytes"]
+
+    if old_kernels:
+        kernel_before = paths_kb(KERNEL_DIRS)
+        packages = remove_old_kernels()
+        kernel_after = paths_kb(KERNEL_DIRS)
+        report["removed"].append({"pattern": "old-kernels", "packages": packages,
+                                  "removed_bytes": (kernel_before - kernel_after) * 1024, "kept_bytes": 0})
+
+    after = directory_sizes(depth)
+    report["removed_bytes"] = sum(entry["removed_bytes"] for entry in report["removed"])
+    report["before_kb"] = before.get("/", 0)
+    report["after_kb"] = after.get("/", 0)
+    report["directories"] = sorted(
+        ({"path": path, "before_kb": size, "after_kb": after.get(path, 0), "removed_kb": size - after.get(path, 0)}
+         for path, size in before.items() if size != after.get(path, 0)),
+        key=lambda entry: entry["removed_kb"], reverse=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Script to remove build leftovers from the node image before it is exported')
+    parser.add_argument('--deny', nargs='*', default=[],
+                        help='Glob patterns of the files and directories to remove')
+    parser.add_argument('--allow', nargs='*', default=[],
+                        help='Glob patterns of the files and directories kept even when matched by --deny')
+    parser.add_argument('--old_kernels', action='store_true',
+                        help='Remove the kernel packages other than the running and the newest one')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Depth of the per directory size breakdown, default value is 3')
+    parser.add_argument('--output', required=True,
+                        help='Path of the JSON report')
+    args = parser.parse_args()
+
+    report = slim(args.deny, args.allow, args.old_kernels, args.depth)
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,37 +2,29 @@
 
 set -euo pipefail
 
+# Applies the CIS 4.1.1 permissions on the kubelet systemd drop-in files.
+# Triggered by cishardening.path whenever the drop-in folder changes, so the
+# script does not wait for the files and does not hold back kubelet.
+
+DROPIN_DIR="${KUBELET_DROPIN_DIR:-/usr/lib/systemd/system/kubelet.service.d}"
 # Dropin files to check
 TARGET_FILES=(
-  "/usr/lib/systemd/system/kubelet.service.d/10-kubeadm.conf"
-  "/usr/lib/systemd/system/kubelet.service.d/11-resource-sizing.conf"
+  "${DROPIN_DIR}/10-kubeadm.conf"
+  "${DROPIN_DIR}/11-resource-sizing.conf"
 )
-TIMEOUT=300  # total seconds to wait
-INTERVAL=2 
 
 log() {
   echo "[CIS 4.1.1] $1"
 }
 
-log "Starting permission hardening for kubelet systemd service files."
-
-# Wait until the first required file exists or timeout
-elapsed=0
-while [[ ! -f "${TARGET_FILES[0]}" && $elapsed -lt $TIMEOUT ]]; do
-  sleep $INTERVAL
-  elapsed=$((elapsed + INTERVAL))
+for file in "${TARGET_FILES[@]}"; do
+  if [[ ! -f "$file" ]]; then
+    log "File $file not found, skipping."
+    continue
+  fi
+  # Only change the mode when required, chmod triggers the path unit again.
+  if [[ "$(stat -c '%a' "$file")" != "600" ]]; then
+    chmod 600 "$file" || true
+    log "Permissions for $file set to 600."
+  fi
 done
-
-if [[ -f "${TARGET_FILES[0]}" ]]; then
-  log "Found ${TARGET_FILES[0]} after $elapsed seconds."
-  for file in "${TARGET_FILES[@]}"; do
-    if [[ -f "$file" ]]; then
-      chmod 600 "$file" || true
-      log "Permissions for $file set to 600."
-    else
-      log "File $file not found, skipping."
-    fi
-  done
-else
-  log "Timeout reached ($TIMEOUT). ${TARGET_FILES[0]} not found. Skipping permission fix."
-fi
\ No newline at end of file
@@ -1,4 +1,5 @@
 import argparse
+import fnmatch
 import json
 import subprocess
 
@@ -6,16 +7,27 @@ IMAGE_NAME = "docker.io/vmware/docker-registry"
 PAUSE_IMAGE_NAME = "localhost:5000/vmware.io/pause"
 LABEL = "io.cri-containerd.pinned=pinned"
 
-def get_image_version(image_name):
+def list_images():
+    """
+    List the images once, returns the images and an index of repo -> [(tag, image)].
+    """
     cp = subprocess.run(["crictl", "images", "-o", "json"], capture_output=True, text=True)
     cp.check_returncode()
     images = json.loads(cp.stdout)["images"]
+    index = {}
     for image in images:
         for repo_tag in image["repoTags"]:
-            if repo_tag.startswith(image_name):
-                return repo_tag.split(":")[-1]
-    else:
-        raise Exception(f"No image with name {image_name} found")
+            repo, tag = repo_tag.rsplit(":", 1)
+            index.setdefault(repo, []).append((tag, image))
+    return images, index
+
+def get_image_version(image_name, index=None):
+    if index is None:
+        _, index = list_images()
+    for repo, tags in index.items():
+        if repo.startswith(image_name):
+            return tags[0][0]
+    raise Exception(f"No image with name {image_name} found")
 
 def get_registry_version():
     return get_image_version(IMAGE_NAME)
@@ -26,12 +38,47 @@ def get_pause_version():
 def apply_label(image):
     subprocess.run(["ctr", "-n", "k8s.io", "images", "label", image, LABEL], check=True)
 
-def pin_image():
-    image_name_with_version = IMAGE_NAME + ":" + get_registry_version()
-    apply_label(image_name_with_version)
+def match_images(index, patterns):
+    """
+    Match repo or repo:tag glob patterns, returns the matched images by image id
+    with their references and the patterns that did not match any image.
+    """
+    matched = {}
+    unmatched = []
+    for pattern in patterns:
+        found = False
+        for repo, tags in index.items():
+            for tag, image in tags:
+                reference = repo + ":" + tag
+                if fnmatch.fnmatchcase(repo, pattern) or fnmatch.fnmatchcase(reference, pattern):
+                    entry = matched.setdefault(image["id"], {"image": image, "references": []})
+                    if reference not in entry["references"]:
+                        entry["references"].append(reference)
+                    found = True
+        if not found:
+            unmatched.append(pattern)
+    return matched, unmatched
 
-    pause_image_name_with_version = PAUSE_IMAGE_NAME + ":" + get_pause_version()
-    apply_label(pause_image_name_with_version)
+def pin_images(patterns):
+    """
+    The CRI reports an image as pinned when any of its references has the label,
+    so a single reference per image is labeled and pinned images are skipped.
+    """
+    _, index = list_images()
+    matched, unmatched = match_images(index, patterns)
+    if unmatched:
+        raise Exception(f"No image matching {', '.join(unmatched)} found")
+    report = {"pinned": [], "already_pinned": []}
+    for entry in matched.values():
+        if entry["image"].get("pinned"):
+            report["already_pinned"] += entry["references"]
+            continue
+        apply_label(entry["references"][0])
+        report["pinned"] += entry["references"]
+    return report
+
+def pin_image():
+    return pin_images([IMAGE_NAME, PAUSE_IMAGE_NAME])
 
 def main():
     parser = argparse.ArgumentParser(
@@ -40,14 +87,19 @@ def main():
                         action='store_true',
                         help='Print version of docker-registry image')
     parser.add_argument('--pin',
-                        action='store_true',
-                        help='Pin image by applying label io.cri-containerd.pinned=pinned')
+                        nargs='*',
+                        metavar='IMAGE',
+                        default=None,
+                        help='Pin images by applying label io.cri-containerd.pinned=pinned. IMAGE is a repository '
+                             'or repository:tag glob, e.g. "localhost:5000/vmware.io/kube-*", defaults to the '
+                             'docker-registry and pause images')
 
     args = parser.parse_args()
     if args.version:
         print(get_registry_version())
-    elif args.pin:
-        pin_image()
+    elif args.pin is not None:
+        report = pin_images(args.pin) if args.pin else pin_image()
+        print(json.dumps(report, indent=4))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,82 @@
+import argparse
+import fnmatch
+import json
+import logging
+import subprocess
+import time
+
+# The report is written to --output, the stdout of ansible.builtin.script also
+# holds stderr when the SSH connection allocates a tty
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+CTR_PREFIX = ["ctr", "-n", "k8s.io"]
+CONTAINERD_ROOT = "/var/lib/containerd"
+CONTROL_PLANE_IMAGES = ["etcd", "kube-apiserver", "kube-controller-manager", "kube-scheduler", "kube-proxy",
+                        "coredns", "pause"]
+
+
+def list_images(patterns):
+    """
+    Return the references of the images matching the patterns, one reference per digest.
+    """
+    output = subprocess.run(CTR_PREFIX + ["images", "ls"], check=True, capture_output=True, text=True).stdout
+    images = {}
+    # REF TYPE DIGEST SIZE PLATFORMS LABELS
+    for line in output.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 3 or fields[0].startswith("sha256:"):
+            continue
+        if any(fnmatch.fnmatchcase(fields[0], pattern) for pattern in patterns):
+            images.setdefault(fields[2], fields[0])
+    return images
+
+
+def snapshotter_bytes(snapshotter):
+    path = f"{CONTAINERD_ROOT}/io.containerd.snapshotter.v1.{snapshotter}"
+    output = subprocess.run(["du", "-sxb", path], check=True, capture_output=True, text=True).stdout
+    return int(output.split()[0])
+
+
+def unpack_images(snapshotter, patterns):
+    images = list_images(patterns)
+    report = {"snapshotter": snapshotter, "images": []}
+    before = snapshotter_bytes(snapshotter)
+    for digest, ref in sorted(images.items(), key=lambda item: item[1]):
+        size_before = snapshotter_bytes(snapshotter)
+        start = time.monotonic()
+        subprocess.run(CTR_PREFIX + ["images", "unpack", "--snapshotter", snapshotter, ref], check=True,
+                       stdout=subprocess.DEVNULL)
+        seconds = time.monotonic() - start
+        snapshot_bytes = snapshotter_bytes(snapshotter) - size_before
+        logging.info(f"Unpacked {ref} in {seconds:.2f}s, {snapshot_bytes} bytes")
+        report["images"].append({"ref": ref, "digest": digest, "unpack_seconds": seconds,
+                                 "snapshot_bytes": snapshot_bytes})
+
+    # The first kubeadm init or join of a node without snapshots spends the
+    # unpack time of the control plane images before the static pods start.
+    report["total_unpack_seconds"] = sum(image["unpack_seconds"] for image in report["images"])
+    report["total_snapshot_bytes"] = snapshotter_bytes(snapshotter) - before
+    report["control_plane_unpack_seconds"] = sum(
+        image["unpack_seconds"] for image in report["images"]
+        if image["ref"].split("/")[-1].split(":")[0] in CONTROL_PLANE_IMAGES)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Script to unpack the container images into the containerd snapshotter')
+    parser.add_argument('--snapshotter', default="overlayfs",
+                        help='Snapshotter of the CRI plugin, default value is overlayfs')
+    parser.add_argument('--images', nargs='*', default=["*"],
+                        help='Glob patterns of the image references to unpack, default value is all the images')
+    parser.add_argument('--output', required=True,
+                        help='Path of the JSON report')
+    args = parser.parse_args()
+
+    report = unpack_images(args.snapshotter, args.images)
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,36 +11,69 @@ image_builder_root=${IB_ROOT:-"/image-builder/images/capi"}
 default_packer_variables=${image_builder_root}/image/packer-variables/
 packer_configuration_folder=${image_builder_root}
 tkr_metadata_folder=${image_builder_root}/tkr-metadata/
+tkr_metadata_source=
 custom_ovf_properties_file=${image_builder_root}/custom_ovf_properties.json
 artifacts_output_folder=${image_builder_root}/artifacts
 ova_destination_folder=${artifacts_output_folder}/ovas
 ova_ts_suffix=$(date +%Y%m%d%H%M%S)
+packer_cache_dir=/image-builder/packer_cache
+packer_cache_wrapper=
+image_builder_target=build-node-ova-vsphere-${OS_TARGET}
+packer_var_files=${image_builder_root}/packer-variables.json
+build_stages_file=${artifacts_output_folder}/logs/build-stages-${OS_TARGET}-${ova_ts_suffix}.tsv
+build_downloads_file=${artifacts_output_folder}/logs/build-downloads-${OS_TARGET}-${ova_ts_suffix}.txt
+# Warm builder containers run prepare ahead of the job, its timings and downloads are kept
+# in the container and recorded with the build of the job
+prepare_stages_file=${image_builder_root}/prepare-stages.tsv
+prepare_downloads_file=${image_builder_root}/prepare-downloads.txt
 
 function copy_custom_image_builder_files() {
     cp image/hack/tkgs-image-build-ova.py hack/image-build-ova.py
     cp image/hack/tkgs_ovf_template.xml hack/ovf_template.xml
+    # Profiling hooks imported by image-build-ova.py
+    cp image/scripts/build_profiler.py hack/build_profiler.py
+}
+
+# Download a file into the current folder and count its size as downloaded by the build
+function download() {
+    wget -q "$1" || return 1
+    mkdir -p $(dirname ${build_downloads_file})
+    stat -c %s "$(basename "$1")" >> ${build_downloads_file} || true
 }
 
 function download_ovftool() {
-	wget -q  http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/vmware-ovftool.zip || (echo "VMware OVF Tool doesn't exist" && exit 1)
+	download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/vmware-ovftool.zip || (echo "VMware OVF Tool doesn't exist" && exit 1)
    unzip vmware-ovftool.zip -d /
 }
 
 function download_configuration_files() {
     # Download kubernetes configuration file
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/kubernetes_config.json
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/kubernetes_config.json
 
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/unified-tkr-vsphere.tar.gz
-    mkdir ${tkr_metadata_folder}
-    tar xzf unified-tkr-vsphere.tar.gz -C ${tkr_metadata_folder}
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/unified-tkr-vsphere.tar.gz
+    extract_tkr_metadata
 
     # Download compatibility files
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/compatibility/vmware-system.compatibilityoffering.json
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/compatibility/vmware-system.guest.kubernetes.distribution.image.version.json
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/compatibility/vmware-system.compatibilityoffering.json
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/compatibility/vmware-system.guest.kubernetes.distribution.image.version.json
 
     # Download VKr constraints files
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/vmware-system.kr.destination-semver-constraint.json || echo "override-semver-constraint.json don't exist"
-    wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/vmware-system.kr.override-semver-constraint.json || echo "override-semver-constraint.json don't exist"
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/vmware-system.kr.destination-semver-constraint.json || echo "override-semver-constraint.json don't exist"
+    download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/metadata/vmware-system.kr.override-semver-constraint.json || echo "override-semver-constraint.json don't exist"
+}
+
+# The builds of the same release share the pristine TKR metadata extracted once in the
+# artifacts folder, every build writes its renamed objects to its own tkr_metadata_folder.
+function extract_tkr_metadata() {
+    local tkr_metadata_cache=${artifacts_output_folder}/tkr-metadata-cache
+    tkr_metadata_source=${tkr_metadata_cache}/$(sha256sum unified-tkr-vsphere.tar.gz | cut -d' ' -f1)
+    if [[ ! -d ${tkr_metadata_source} ]]; then
+        mkdir -p ${tkr_metadata_cache}
+        local extract_folder=$(mktemp -d ${tkr_metadata_cache}/.extract.XXXXXX)
+        tar xzf unified-tkr-vsphere.tar.gz -C ${extract_folder}
+        # Another build of the release may have extracted it in the meantime
+        mv -T ${extract_folder} ${tkr_metadata_source} 2>/dev/null || rm -rf ${extract_folder}
+    fi
 }
 
 # Modify user data to pin kernel to given version for Ubuntu OS
@@ -80,6 +113,50 @@ EOF
     return 0
 }
 
+# Profile the python build scripts with cProfile and tracemalloc when BUILD_PROFILE is set.
+function build_profiling() {
+    if [[ "${BUILD_PROFILE}" != "true" ]]; then
+        return 0
+    fi
+    export BUILD_PROFILE_DIR="${artifacts_output_folder}/logs/python-profile-${OS_TARGET}-${ova_ts_suffix}"
+    mkdir -p ${BUILD_PROFILE_DIR}
+    echo "Writing python build script profiles to ${BUILD_PROFILE_DIR}"
+}
+
+# Rewrite a repository URL to go through the package proxy,
+# http(s)://<host>/<path> becomes <package_cache_url>/http(s)/<host>/<path>
+function proxied_repo_url() {
+    echo "$1" | sed -E "s#(https?)://#${package_cache_url}/\1/#g"
+}
+
+# Point the internal and override package repositories at the package proxy when PACKAGE_CACHE_PORT is set.
+function package_cache() {
+    if [[ -z "${PACKAGE_CACHE_PORT}" ]]; then
+        return 0
+    fi
+    package_cache_url="http://${HOST_IP}:${PACKAGE_CACHE_PORT}"
+    if ! wget -q -O /dev/null ${package_cache_url}/_stats; then
+        echo "Warning: Package proxy is not reachable at ${package_cache_url}, using the repositories directly"
+        return 0
+    fi
+    [[ -n "${PRIMARY_INTERNAL_REPO_URL}" ]] && export PRIMARY_INTERNAL_REPO_URL=$(proxied_repo_url "${PRIMARY_INTERNAL_REPO_URL}")
+    [[ -n "${SECURITY_INTERNAL_REPO_URL}" ]] && export SECURITY_INTERNAL_REPO_URL=$(proxied_repo_url "${SECURITY_INTERNAL_REPO_URL}")
+    [[ -n "${UPDATE_INTERNAL_REPO_URL}" ]] && export UPDATE_INTERNAL_REPO_URL=$(proxied_repo_url "${UPDATE_INTERNAL_REPO_URL}")
+
+    # Override repository files are mounted from the host, rewrite copies of them
+    if [[ -n "${OVERRIDE_PACKAGE_REPOS}" ]]; then
+        local repos_folder="${image_builder_root}/package-cache-repos"
+        local repo_files=""
+        mkdir -p ${repos_folder}
+        for repo_file in ${OVERRIDE_PACKAGE_REPOS//,/ }; do
+            sed -E "s#(https?)://#${package_cache_url}/\1/#g" ${repo_file} > ${repos_folder}/$(basename ${repo_file})
+            repo_files="${repo_files:+${repo_files},}${repos_folder}/$(basename ${repo_file})"
+        done
+        export OVERRIDE_PACKAGE_REPOS=${repo_files}
+    fi
+    echo "Using package proxy ${package_cache_url}"
+}
+
 # Generate packaer input variables based on packer-variables folder
 function generate_packager_configuration() {
     mkdir -p $ova_destination_folder
@@ -101,6 +178,7 @@ function generate_packager_configuration() {
     --default_config_folder ${default_packer_variables} \
     --dest_config ${packer_configuration_folder} \
     --tkr_metadata_folder ${tkr_metadata_folder} \
+    --tkr_metadata_source ${tkr_metadata_source} \
     ${TKR_SUFFIX_ARG} \
     --kubernetes_config ${image_builder_root}/kubernetes_config.json \
     --ova_destination_folder ${ova_destination_folder} \
@@ -113,10 +191,18 @@ function generate_packager_configuration() {
     cat ${packer_configuration_folder}/packer-variables.json
 }
 
+# The size of every encoded property is written to the logs, OVF_COMPACT enables
+# the compact and deterministic encoding of the addon YAML.
 function generate_custom_ovf_properties() {
+    local compact_arg=""
+    if [[ "${OVF_COMPACT}" == "true" ]]; then
+        compact_arg="--compact"
+    fi
     python3 image/scripts/utkg_custom_ovf_properties.py \
     --kubernetes_config ${image_builder_root}/kubernetes_config.json \
-    --outfile ${custom_ovf_properties_file}
+    --outfile ${custom_ovf_properties_file} \
+    --size_report ${artifacts_output_folder}/logs/ovf-properties-size-${OS_TARGET}-${ova_ts_suffix}.json \
+    ${compact_arg}
 }
 
 function apply_ib_patches() {
@@ -146,13 +232,13 @@ function download_stig_files() {
     mkdir -p "${image_builder_root}/image/tmp"
     if [ ${OS_TARGET} == "photon-3" ]
     then
-        wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/photon-3-stig-hardening.tar.gz
+        download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/photon-3-stig-hardening.tar.gz
         tar -xvf photon-3-stig-hardening.tar.gz -C "${image_builder_root}/image/tmp/"
         mv ${image_builder_root}/image/tmp/photon-3-stig-hardening-* "${stig_compliance_dir}"
         rm -rf photon-3-stig-hardening.tar.gz
     elif [ ${OS_TARGET} == "photon-5" ]
     then
-        wget -q http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/vmware-photon-5.0-stig-ansible-hardening.tar.gz
+        download http://${HOST_IP}:${ARTIFACTS_CONTAINER_PORT}/artifacts/vmware-photon-5.0-stig-ansible-hardening.tar.gz
         tar -xvf vmware-photon-5.0-stig-ansible-hardening.tar.gz -C "${image_builder_root}/image/tmp/"
         mv ${image_builder_root}/image/tmp/vmware-photon-5.0-stig-ansible-hardening-* "${stig_compliance_dir}"
         rm -rf vmware-photon-5.0-stig-ansible-hardening.tar.gz
@@ -161,7 +247,6 @@ function download_stig_files() {
 
 # Enable packer debug logging to the log file
 function packer_logging() {
-    mkdir /image-builder/packer_cache
     mkdir -p $artifacts_output_folder/logs
     export PACKER_LOG=10
     datetime=$(date '+%Y%m%d%H%M%S')
@@ -169,14 +254,159 @@ function packer_logging() {
     echo "Generating packer logs to $PACKER_LOG_PATH"
 }
 
+# Extract the build timeline from the packer log and compress the log
+function analyze_packer_log() {
+    if [[ ! -f "${PACKER_LOG_PATH}" ]]; then
+        return 0
+    fi
+    python3 image/scripts/packer_log_analyzer.py \
+    --log_file ${PACKER_LOG_PATH} \
+    --outfile ${PACKER_LOG_PATH%.log}-summary.json \
+    --compress \
+    || echo "Warning: packer log analysis failed"
+}
+
+# Enable pipelining, persistent SSH connections, fact caching and per task
+# timing of the ansible provisioners when ANSIBLE_ACCELERATION is set.
+function ansible_acceleration() {
+    if [[ "${ANSIBLE_ACCELERATION}" != "true" ]]; then
+        return 0
+    fi
+    export ANSIBLE_CONFIG="${image_builder_root}/ansible-profile/ansible.cfg"
+    export ANSIBLE_SSH_ARGS="-o ControlMaster=auto -o ControlPersist=600s -o ServerAliveInterval=30"
+    export ANSIBLE_LOG_PATH="${artifacts_output_folder}/logs/ansible-${OS_TARGET}-${ova_ts_suffix}.log"
+    # The packer VM is always the "default" host, keep the facts of every build apart
+    export ANSIBLE_CACHE_PLUGIN_CONNECTION="/image-builder/ansible_facts/${OS_TARGET}-${ova_ts_suffix}"
+    mkdir -p ${ANSIBLE_CACHE_PLUGIN_CONNECTION} /tmp/ansible-cp
+    echo "Using ansible acceleration profile ${ANSIBLE_CONFIG}, task timings are written to ${ANSIBLE_LOG_PATH}"
+}
+
+# The packer cache is mounted from the host when SHARED_PACKER_CACHE is set, packer
+# then runs through packer_cache.py which indexes, verifies and evicts the entries.
+function packer_cache() {
+    mkdir -p ${packer_cache_dir}
+    if [[ "${SHARED_PACKER_CACHE}" != "true" ]]; then
+        return 0
+    fi
+    packer_cache_wrapper="python3 image/scripts/packer_cache.py --cache_dir ${packer_cache_dir} \
+        --max_size_gb ${PACKER_CACHE_MAX_SIZE_GB:-50} --packer_log ${PACKER_LOG_PATH} \
+        --outfile ${artifacts_output_folder}/logs/packer-cache-${OS_TARGET}-${ova_ts_suffix}.json run --"
+    echo "Using shared packer cache ${packer_cache_dir}"
+}
+
+# The QEMU backend builds the node image on the local host instead of vSphere when
+# BUILD_BACKEND is set to qemu, it needs KVM and the QEMU tools in the container.
+function qemu_backend() {
+    if [[ "${BUILD_BACKEND}" != "qemu" ]]; then
+        return 0
+    fi
+    if [[ "${OS_TARGET}" == windows-* ]]; then
+        echo "QEMU backend is not supported for '${OS_TARGET}'" && exit 1
+    fi
+    if ! command -v qemu-system-x86_64 >/dev/null || ! command -v qemu-img >/dev/null; then
+        echo "QEMU backend requires qemu-system-x86_64 and qemu-img, build the image builder container with the QEMU_PACKAGES docker build argument" && exit 1
+    fi
+    if [[ ! -w /dev/kvm ]]; then
+        echo "QEMU backend requires /dev/kvm" && exit 1
+    fi
+    image_builder_target=build-qemu-${OS_TARGET}
+    # The qemu builder writes the disk to output_directory, keep it in the
+    # output folder of the build like the vSphere builders.
+    local output_dir=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1]))["output_dir"])' \
+        ${image_builder_root}/packer-variables.json)
+    echo "{\"output_directory\": \"${output_dir}\"}" > ${image_builder_root}/packer-variables-qemu.json
+    packer_var_files="${packer_var_files} ${image_builder_root}/packer-variables-qemu.json"
+    echo "Using QEMU backend ${image_builder_target}"
+}
+
+# The goss provisioner has no option for the number of checks validated
+# concurrently, add the --max-concurrent flag with the goss_max_concurrent packer
+# variable to the goss provisioners of the image builder packer templates.
+function goss_max_concurrent() {
+    if [[ -z "${GOSS_MAX_CONCURRENT}" ]]; then
+        return 0
+    fi
+    python3 - ${image_builder_root}/packer/*/packer*.json <<'EOF'
+import json
+import sys
+
+for template in sys.argv[1:]:
+    with open(template, 'r') as fp:
+        config = json.load(fp)
+    provisioners = [p for p in config.get("provisioners", []) if p.get("type") == "goss"]
+    if not provisioners:
+        continue
+    config.setdefault("variables", {}).setdefault("goss_max_concurrent", "50")
+    for provisioner in provisioners:
+        if "--max-concurrent" not in provisioner.get("format_options", ""):
+            provisioner["format_options"] = "{} --max-concurrent {{{{user `goss_max_concurrent`}}}}".format(
+                provisioner.get("format_options", "")).strip()
+    with open(template, 'w') as fp:
+        json.dump(config, fp, indent=2)
+    print("goss --max-concurrent enabled in {}".format(template))
+EOF
+}
+
 # Invokes kubernetes image builder for the corresponding OS target
 function trigger_image_builder() {
     EXTRA_ARGS=""
-    ON_ERROR_ASK=1 PATH=$PATH:/home/imgbuilder-ova/.local/bin PACKER_CACHE_DIR=/image-builder/packer_cache \
-    PACKER_VAR_FILES="${image_builder_root}/packer-variables.json"  \
+    ON_ERROR_ASK=1 PATH=$PATH:/home/imgbuilder-ova/.local/bin PACKER_CACHE_DIR=${packer_cache_dir} \
+    PACKER_VAR_FILES="${packer_var_files}"  \
     OVF_CUSTOM_PROPERTIES=${custom_ovf_properties_file} \
     PACKER_NO_COLOR=1 IB_OVFTOOL=1 ANSIBLE_TIMEOUT=180 IB_OVFTOOL_ARGS="--allowExtraConfig" \
-    make build-node-ova-vsphere-${OS_TARGET}
+    ${packer_cache_wrapper} make ${image_builder_target}
+}
+
+# QEMU builds only produce a qcow2 disk, convert it and build the OVA with the
+# same layout as the vSphere builds.
+function build_qemu_ova() {
+    if [[ "${BUILD_BACKEND}" != "qemu" ]]; then
+        return 0
+    fi
+    local packer_output_folder=$(get_packer_output_folder)
+    if [[ -z "${packer_output_folder}" ]]; then
+        echo "No packer output folder ${OS_TARGET}-kube-*-${ova_ts_suffix} found in ${image_builder_root}/output" && exit 1
+    fi
+    OVF_CUSTOM_PROPERTIES=${custom_ovf_properties_file} \
+    IB_OVFTOOL=1 IB_OVFTOOL_ARGS="--allowExtraConfig" \
+    python3 image/scripts/qemu_to_ova.py \
+    --image_builder_root ${image_builder_root} \
+    --os_type ${OS_TARGET} \
+    --output_dir ${packer_output_folder} \
+    --packer_var_files ${image_builder_root}/packer-variables.json
+}
+
+# Packer output folder of the build, empty when packer did not create it
+function get_packer_output_folder() {
+    ls -d ${image_builder_root}/output/${OS_TARGET}-kube-*-${ova_ts_suffix} 2>/dev/null | head -n 1
+}
+
+# Extract the goss results with the duration of every check from the packer log
+# into the packer output folder, copy_ova publishes them next to the OVA. The
+# results of failed builds are extracted into the given folder by on_exit.
+function goss_results() {
+    local output_folder=${1:-$(get_packer_output_folder)}
+    if [[ -z "${output_folder}" || ! -f "${PACKER_LOG_PATH}" ]]; then
+        echo "Skipping goss results as packer output folder or log was not found"
+        return 0
+    fi
+    python3 image/scripts/goss_results.py \
+    --log_file ${PACKER_LOG_PATH} \
+    --output_dir ${output_folder} \
+    || echo "Warning: goss results extraction failed"
+}
+
+# Report the allocated, zero and compressed space of the VMDKs generated by packer
+function analyze_vmdk() {
+    local packer_output_folder=$(get_packer_output_folder)
+    if [[ -z "${packer_output_folder}" ]]; then
+        echo "Skipping VMDK analysis as packer output folder was not found"
+        return 0
+    fi
+    python3 image/scripts/vmdk_analyzer.py \
+    --output_dir ${packer_output_folder} \
+    --outfile ${artifacts_output_folder}/logs/disk-analysis-${OS_TARGET}-${ova_ts_suffix}.json \
+    || echo "Warning: VMDK analysis failed"
 }
 
 # Packer generates OVA with a different name so change the OVA name to OSImage/VMI and
@@ -184,27 +414,113 @@ function trigger_image_builder() {
 function copy_ova() {
     TKR_SUFFIX_ARG=
     [[ -n "$TKR_SUFFIX" ]] && TKR_SUFFIX_ARG="--tkr_suffix ${TKR_SUFFIX}"
+    # Add the OVA and its sidecar files to the content addressed store
+    ARTIFACTS_STORE_ARG=
+    [[ "${ARTIFACTS_STORE}" == "true" ]] && ARTIFACTS_STORE_ARG="--artifacts_store ${artifacts_output_folder}/store"
     python3 image/scripts/tkg_byoi.py copy_ova \
     --kubernetes_config ${image_builder_root}/kubernetes_config.json \
     --tkr_metadata_folder ${tkr_metadata_folder} \
     ${TKR_SUFFIX_ARG} \
     --os_type ${OS_TARGET} \
     --ova_destination_folder ${ova_destination_folder} \
-    --ova_ts_suffix ${ova_ts_suffix}
+    --ova_ts_suffix ${ova_ts_suffix} \
+    ${ARTIFACTS_STORE_ARG}
+}
+
+# Run a build step and append its duration in milliseconds to the stage timings file
+function run_stage() {
+    local start=$(date +%s%N)
+    "$@"
+    mkdir -p ${artifacts_output_folder}/logs
+    echo -e "$1\t$(( ($(date +%s%N) - start) / 1000000 ))" >> ${build_stages_file}
+}
+
+# Append the stage durations, packer phases, OVA and VMDK sizes and the downloaded
+# bytes of the build to the build performance database on the artifacts volume. The
+# builder containers share the network of the host, so the downloads are counted from
+# the files the build downloaded instead of the interface counters.
+function record_build_performance() {
+    local status=$1
+    local packer_output_folder=$(get_packer_output_folder)
+    local packer_summary_arg=
+    [[ -n "${PACKER_LOG_PATH}" ]] && packer_summary_arg="--packer_summary ${PACKER_LOG_PATH%.log}-summary.json"
+    python3 image/scripts/build_perf_db.py --db ${artifacts_output_folder}/build-performance.db record \
+    --ova_ts_suffix ${ova_ts_suffix} \
+    --os_target ${OS_TARGET} \
+    --kubernetes_version ${KUBERNETES_VERSION} \
+    --status ${status} \
+    --stages_file ${build_stages_file} \
+    ${packer_summary_arg} \
+    --output_dir "${packer_output_folder}" \
+    --downloads_file ${build_downloads_file} \
+    --build_start ${build_start} \
+    --image_builder_commit "$(git -C ${image_builder_root} rev-parse HEAD 2>/dev/null)" \
+    || echo "Warning: recording the build performance failed"
+}
+
+# Analyze the packer log and record the build performance also when the build fails
+function on_exit() {
+    local rc=$?
+    if [[ ${rc} -ne 0 ]]; then
+        # Keep the goss results of a failed validation with the logs, before the packer log is compressed
+        goss_results ${artifacts_output_folder}/logs/goss-${OS_TARGET}-${ova_ts_suffix}
+    fi
+    analyze_packer_log
+    if [[ ${rc} -eq 0 ]]; then
+        record_build_performance success
+    else
+        record_build_performance failed
+    fi
+}
+
+# Steps that only depend on the Kubernetes version, used to warm up builder
+# containers ahead of the build.
+function prepare() {
+    run_stage copy_custom_image_builder_files
+    run_stage download_ovftool
+    run_stage apply_ib_patches
+}
+
+function build() {
+    build_start=$(date +%s)
+    trap on_exit EXIT
+    mkdir -p ${artifacts_output_folder}/logs
+    [[ -f ${prepare_stages_file} ]] && cat ${prepare_stages_file} >> ${build_stages_file}
+    [[ -f ${prepare_downloads_file} ]] && cat ${prepare_downloads_file} >> ${build_downloads_file}
+    run_stage build_profiling
+    run_stage package_cache
+    run_stage download_configuration_files
+    run_stage generate_packager_configuration
+    run_stage modify_user_data
+    run_stage generate_custom_ovf_properties
+    run_stage download_stig_files
+    run_stage packer_logging
+    run_stage ansible_acceleration
+    run_stage packer_cache
+    run_stage qemu_backend
+    run_stage goss_max_concurrent
+    run_stage trigger_image_builder
+    run_stage build_qemu_ova
+    run_stage goss_results
+    run_stage analyze_vmdk
+    run_stage copy_ova
 }
 
 function main() {
-    copy_custom_image_builder_files
-    download_configuration_files
-    download_ovftool
-    generate_packager_configuration
-    modify_user_data
-    generate_custom_ovf_properties
-    download_stig_files
-    apply_ib_patches
-    packer_logging
-    trigger_image_builder
-    copy_ova
-}
-
-main
+    case "${1:-all}" in
+        prepare)
+            build_stages_file=${prepare_stages_file}
+            build_downloads_file=${prepare_downloads_file}
+            prepare
+            ;;
+        build)
+            build
+            ;;
+        *)
+            prepare
+            build
+            ;;
+    esac
+}
+
+main "$@"
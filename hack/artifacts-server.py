@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: artifacts-server.py --source SOURCE [FLAGS]
+#  Stand-in for the artifacts container. Serves the /artifacts/... tree of the
+#  artifacts container from SOURCE, either a folder or an uncompressed tar
+#  bundle which is served in place without unpacking it.
+#
+#  GET and HEAD requests are supported with single byte ranges, ETag and
+#  If-None-Match/If-Range. File contents are sent with sendfile and every
+#  request is logged with its throughput.
+################################################################################
+
+import argparse
+import asyncio
+import email.utils
+import mimetypes
+import os
+import posixpath
+import re
+import tarfile
+import time
+import urllib.parse
+
+range_regex = re.compile(r'^bytes=(\d*)-(\d*)$')
+reasons = {200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request",
+           404: "Not Found", 405: "Method Not Allowed", 416: "Range Not Satisfiable"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serves the artifacts container layout from a folder or a tar bundle")
+    parser.add_argument('--source', required=True,
+                        help='Folder or uncompressed tar file containing the artifacts/ tree')
+    parser.add_argument('--listen', default='0.0.0.0:8081',
+                        help='Address of the server, default value is 0.0.0.0:8081')
+    return parser.parse_args()
+
+
+class Entry():
+    """
+    A file served from the source, offset is the start of the data in path.
+    """
+    def __init__(self, name, path, offset, size, mtime):
+        self.name = name
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.mtime = int(mtime)
+        self.etag = '"{:x}-{:x}-{:x}"'.format(size, self.mtime, offset)
+
+
+class FolderSource():
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def lookup(self, path):
+        full_path = os.path.join(self.root, path)
+        if not os.path.isfile(full_path):
+            return None
+        stat = os.stat(full_path)
+        return Entry(path, full_path, 0, stat.st_size, stat.st_mtime)
+
+
+class TarSource():
+    def __init__(self, tar_path):
+        self.entries = {}
+        with tarfile.open(tar_path, 'r:') as tar:
+            for member in tar:
+                if member.isfile():
+                    name = posixpath.normpath(member.name).lstrip('/')
+                    self.entries[name] = Entry(name, tar_path, member.offset_data, member.size, member.mtime)
+        print("artifacts-server: indexed {} files of {}".format(len(self.entries), tar_path))
+
+    def lookup(self, path):
+        return self.entries.get(path)
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) of a single byte range, None when the header is
+    not a single range and False when the range cannot be satisfied.
+    """
+    match = range_regex.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '':
+        length = int(match.group(2))
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class ArtifactsServer():
+    def __init__(self, source):
+        self.source = source
+
+    async def handle(self, reader, writer):
+        try:
+            while await self.handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer):
+        request_line = await reader.readline()
+        if not request_line:
+            return False
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        start = time.monotonic()
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            await self.send_error(writer, 400, "HTTP/1.0")
+            return False
+        method, target, version = parts
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        if method not in ("GET", "HEAD"):
+            code = await self.send_error(writer, 405, version)
+        else:
+            path = posixpath.normpath(urllib.parse.unquote(urllib.parse.urlsplit(target).path)).lstrip('/')
+            entry = None if path.startswith('..') else self.source.lookup(path)
+            if entry is None:
+                code = await self.send_error(writer, 404, version)
+            else:
+                code, sent = await self.send_entry(writer, method, version, entry, headers, keep_alive)
+                duration = time.monotonic() - start
+                print("artifacts-server: {} {} {} {} bytes in {:.3f}s ({:.1f} MB/s)".format(
+                    method, target, code, sent, duration, sent / duration / 1024 ** 2 if duration else 0))
+                return keep_alive
+        print("artifacts-server: {} {} {}".format(method, target, code))
+        return keep_alive
+
+    async def send_error(self, writer, code, version):
+        body = "{} {}\n".format(code, reasons[code]).encode()
+        writer.write("{} {} {}\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n\r\n".format(
+            version, code, reasons[code], len(body)).encode() + body)
+        await writer.drain()
+        return code
+
+    async def send_entry(self, writer, method, version, entry, headers, keep_alive):
+        offset, count, code = 0, entry.size, 200
+        response_headers = {
+            "Content-Type": mimetypes.guess_type(entry.name)[0] or "application/octet-stream",
+            "ETag": entry.etag,
+            "Last-Modified": email.utils.formatdate(entry.mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+
+        if headers.get("if-none-match") in (entry.etag, "*"):
+            code, count = 304, 0
+        elif "range" in headers and headers.get("if-range", entry.etag) == entry.etag:
+            byte_range = parse_range(headers["range"], entry.size)
+            if byte_range is False:
+                response_headers["Content-Range"] = "bytes */{}".format(entry.size)
+                response_headers["Content-Length"] = "0"
+                await self.send_headers(writer, version, 416, response_headers)
+                return 416, 0
+            if byte_range is not None:
+                code = 206
+                offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                response_headers["Content-Range"] = "bytes {}-{}/{}".format(byte_range[0], byte_range[1], entry.size)
+
+        if code != 304:
+            response_headers["Content-Length"] = str(count)
+        await self.send_headers(writer, version, code, response_headers)
+        if method == "HEAD" or count == 0:
+            return code, 0
+        with open(entry.path, 'rb') as fp:
+            await asyncio.get_running_loop().sendfile(writer.transport, fp, entry.offset + offset, count)
+        return code, count
+
+    async def send_headers(self, writer, version, code, headers):
+        lines = ["{} {} {}".format(version, code, reasons[code])]
+        lines += ["{}: {}".format(key, value) for key, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+
+async def serve(args):
+    if os.path.isdir(args.source):
+        source = FolderSource(args.source)
+    else:
+        try:
+            source = TarSource(args.source)
+        except tarfile.ReadError as e:
+            raise SystemExit("artifacts-server: {} is not an uncompressed tar file: {}".format(args.source, e))
+    server = ArtifactsServer(source)
+    host, port = args.listen.rsplit(':', 1)
+    listener = await asyncio.start_server(server.handle, host, int(port))
+    print("artifacts-server: serving {} on http://{}".format(args.source, args.listen))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
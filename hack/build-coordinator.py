@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: build-coordinator.py --worker NAME=URL [--worker ...] [FLAGS]
+#  Coordinator of node image builds over a pool of build hosts. Every build
+#  host runs build-scheduler.py as its agent. Jobs (Kubernetes version x OS
+#  target) are routed to the host that already has the builder container image,
+#  then to the one with the artifacts server and warm builder containers of the
+#  version, then to the least loaded one. The job logs are streamed into the
+#  state folder and the OVAs and sidecar files of the finished jobs are added
+#  to the central artifacts store.
+#
+#  Workers are reached over HTTP, e.g. w1=http://10.0.0.5:8090, or through an
+#  SSH tunnel to the agent listening on localhost of the build host, e.g.
+#  w2=ssh://builder@10.0.0.6 or w3=ssh://builder@10.0.0.7:2222.
+#
+#  API:
+#    POST   /jobs           submit jobs, kubernetes_version and os_target are
+#                           a value or a list, a job is created per combination:
+#                           {"kubernetes_version": ["...", "..."],
+#                            "os_target": ["...", "..."],
+#                            "artifacts_container_port": 8081 or
+#                                                        {"<version>": 8081},
+#                            "tkr_suffix": "...", "env": {"KEY": "VALUE"}}
+#    GET    /jobs           list jobs
+#    GET    /jobs/<id>      job status
+#    GET    /jobs/<id>/log  last lines of the job log, with ?offset=N the log
+#                           bytes from offset N
+#    DELETE /jobs/<id>      cancel a queued job
+#    GET    /status         queue depth and the last status of every worker
+#
+#  build-coordinator.py --follow <id> prints the log of a job until it ends.
+################################################################################
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+import artifacts_store  # noqa: E402
+
+JOB_QUEUED = "queued"
+JOB_DISPATCHED = "dispatched"
+JOB_COLLECTING = "collecting"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED = [JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Coordinator of node image builds over a pool of build hosts")
+    parser.add_argument('--worker', action='append', default=[],
+                        help='Build host as NAME=URL, URL is http://host:port or ssh://[user@]host[:port]')
+    parser.add_argument('--image_artifacts_path',
+                        help='Central folder of the artifacts store, in its store folder, of the collected builds')
+    parser.add_argument('--state_dir', default=os.path.expanduser('~/.byoi-coordinator'),
+                        help='Folder where the jobs and their logs are persisted')
+    parser.add_argument('--listen', default='127.0.0.1:8091',
+                        help='Address of the HTTP API, default value is 127.0.0.1:8091')
+    parser.add_argument('--agent_port', type=int, default=8090,
+                        help='Port of the build-scheduler.py agent on the SSH workers, default value is 8090')
+    parser.add_argument('--worker_queue', type=int, default=1,
+                        help='Jobs queued on a worker in addition to the running ones, default value is 1')
+    parser.add_argument('--poll_interval', type=int, default=10,
+                        help='Seconds between coordination rounds')
+    parser.add_argument('--route_timeout', type=int, default=1800,
+                        help='Seconds after which a queued job fails when no reachable worker has the builder '
+                             'image of its version, default value is 1800')
+    parser.add_argument('--follow', default=None,
+                        help='Print the log of the job with this id from the coordinator at --listen and exit')
+    args = parser.parse_args()
+    if not args.follow and (not args.worker or not args.image_artifacts_path):
+        parser.error("--worker and --image_artifacts_path are required")
+    return args
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Worker():
+    """
+    Client of the build-scheduler.py agent of a build host.
+    """
+    def __init__(self, name, url, agent_port, queue_limit):
+        self.name = name
+        self.url = url
+        self.agent_port = agent_port
+        self.queue_limit = queue_limit
+        self.tunnel = None
+        self.status = None
+
+    def base_url(self):
+        location = urllib.parse.urlsplit(self.url)
+        if location.scheme != "ssh":
+            return self.url.rstrip('/')
+        if self.tunnel is None or self.tunnel.poll() is not None:
+            self.local_port = get_free_port()
+            ssh_args = ["ssh", "-N", "-o", "BatchMode=yes", "-o", "ExitOnForwardFailure=yes",
+                        "-o", "ServerAliveInterval=30",
+                        "-L", "127.0.0.1:{}:127.0.0.1:{}".format(self.local_port, self.agent_port)]
+            if location.port:
+                ssh_args += ["-p", str(location.port)]
+            destination = location.hostname
+            if location.username:
+                destination = location.username + "@" + destination
+            self.tunnel = subprocess.Popen(ssh_args + [destination], stdin=subprocess.DEVNULL)
+            self.wait_tunnel()
+        return "http://127.0.0.1:{}".format(self.local_port)
+
+    def wait_tunnel(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.tunnel.poll() is None:
+            try:
+                socket.create_connection(("127.0.0.1", self.local_port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+
+    def open(self, path, body=None, method=None, timeout=30):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url() + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        return urllib.request.urlopen(request, timeout=timeout)
+
+    def call(self, path, body=None, method=None):
+        with self.open(path, body, method) as response:
+            return json.load(response)
+
+    def refresh(self):
+        try:
+            self.status = self.call("/status")
+            self.status["reachable"] = True
+        except (OSError, ValueError) as e:
+            self.status = {"reachable": False, "error": str(e)}
+        return self.status
+
+
+def expand(request):
+    """
+    Return the jobs of a request, one per Kubernetes version and OS target.
+    """
+    for key in ["kubernetes_version", "os_target", "artifacts_container_port"]:
+        if key not in request:
+            raise ValueError("{} is required".format(key))
+    versions = request["kubernetes_version"]
+    targets = request["os_target"]
+    versions = versions if isinstance(versions, list) else [versions]
+    targets = targets if isinstance(targets, list) else [targets]
+    ports = request["artifacts_container_port"]
+    jobs = []
+    for version, target in itertools.product(versions, targets):
+        port = ports.get(version) if isinstance(ports, dict) else ports
+        if port is None:
+            raise ValueError("artifacts_container_port is missing for {}".format(version))
+        jobs.append({
+            "id": uuid.uuid4().hex[:12],
+            "kubernetes_version": version,
+            "os_target": target,
+            "artifacts_container_port": str(port),
+            "tkr_suffix": request.get("tkr_suffix", ""),
+            "env": request.get("env", {}),
+            "status": JOB_QUEUED,
+            "submitted": time.time(),
+        })
+    return jobs
+
+
+def route(job, workers, assigned):
+    """
+    Return the worker for the job, None when no worker can take it now. Only
+    the workers with the builder image of the version are considered, the
+    artifacts server and the warm builder containers avoid the download and
+    preparation steps on the worker.
+    """
+    version = job["kubernetes_version"]
+    candidates = []
+    for worker in workers:
+        status = worker.status
+        if not status or not status.get("reachable"):
+            continue
+        if version not in status.get("builder_images", []):
+            continue
+        if status["queue_depth"] + assigned.get(worker.name, 0) >= worker.queue_limit:
+            continue
+        score = (version in status.get("artifacts_servers", []),
+                 len(status.get("warm_pool", {}).get(version, [])) > 0,
+                 -(len(status["running"]) + status["queue_depth"] + assigned.get(worker.name, 0)))
+        candidates.append((score, worker.name, worker))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: candidate[:2])[2]
+
+
+def has_builder_image(version, workers):
+    """
+    Checks if a reachable worker has the builder image of the version, the
+    job of the version can be routed once one of them has a free queue slot.
+    """
+    return any(worker.status and worker.status.get("reachable") and
+               version in worker.status.get("builder_images", []) for worker in workers)
+
+
+class Coordinator():
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.state_file = os.path.join(args.state_dir, 'jobs.json')
+        self.store = os.path.join(args.image_artifacts_path, "store")
+        self.workers = []
+        for worker in args.worker:
+            name, url = worker.split('=', 1)
+            self.workers.append(Worker(name, url, args.agent_port, args.worker_queue))
+        self.jobs = {}
+        os.makedirs(args.state_dir, exist_ok=True)
+        os.makedirs(args.image_artifacts_path, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """
+        Restore the jobs, the collection of the artifacts of a job is started
+        again after a restart.
+        """
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as fp:
+                self.jobs = json.load(fp).get("jobs", {})
+        for job in self.jobs.values():
+            if job["status"] == JOB_COLLECTING:
+                job["status"] = JOB_DISPATCHED
+            elif job["status"] == JOB_DISPATCHED and not job.get("worker_job_id"):
+                # Stopped while submitting the job to the worker
+                job.update({"status": JOB_QUEUED, "worker": None})
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as fp:
+            json.dump({"jobs": self.jobs}, fp, indent=4)
+        os.replace(tmp_file, self.state_file)
+
+    def worker(self, name):
+        return next((worker for worker in self.workers if worker.name == name), None)
+
+    def submit(self, request):
+        jobs = expand(request)
+        with self.lock:
+            for job in jobs:
+                self.jobs[job["id"]] = job
+            self.save()
+        return jobs
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs[job_id]
+            if job["status"] != JOB_QUEUED:
+                raise ValueError("Only queued jobs can be cancelled")
+            job["status"] = JOB_CANCELLED
+            self.save()
+        return job
+
+    def queued_jobs(self):
+        return sorted([job for job in self.jobs.values() if job["status"] == JOB_QUEUED],
+                      key=lambda job: job["submitted"])
+
+    def job(self, job_id):
+        """
+        Return a copy of the job, None when the job is unknown.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def status(self):
+        with self.lock:
+            return {
+                "queue_depth": len(self.queued_jobs()),
+                "dispatched": [job["id"] for job in self.jobs.values() if job["status"] == JOB_DISPATCHED],
+                "collecting": [job["id"] for job in self.jobs.values() if job["status"] == JOB_COLLECTING],
+                "workers": {worker.name: dict(worker.status or {}, url=worker.url) for worker in self.workers},
+            }
+
+    def dispatch(self):
+        """
+        Route the queued jobs under the lock, they are submitted to the workers
+        outside of it so the API is not blocked by the network calls.
+        """
+        submissions = []
+        assigned = {}
+        with self.lock:
+            for job in self.queued_jobs():
+                worker = route(job, self.workers, assigned)
+                if worker is None and has_builder_image(job["kubernetes_version"], self.workers):
+                    job["waiting"] = "No free queue slot on the workers with the builder image of {}".format(
+                        job["kubernetes_version"])
+                    continue
+                if worker is None:
+                    error = "No reachable worker with the builder image of {}".format(job["kubernetes_version"])
+                    if time.time() - job["submitted"] > self.args.route_timeout:
+                        job.update({"status": JOB_FAILED, "error": error, "finished": time.time()})
+                        job.pop("waiting", None)
+                        print("build-coordinator: job {} failed: {}".format(job["id"], error))
+                    else:
+                        job["waiting"] = error
+                    continue
+                assigned[worker.name] = assigned.get(worker.name, 0) + 1
+                job.pop("waiting", None)
+                job.update({"status": JOB_DISPATCHED, "worker": worker.name, "worker_job_id": None})
+                submissions.append((job, worker))
+            self.save()
+
+        for job, worker in submissions:
+            env = {"ARTIFACTS_STORE": "true"}
+            env.update(job["env"])
+            try:
+                worker_job = worker.call("/jobs", {
+                    "kubernetes_version": job["kubernetes_version"],
+                    "os_target": job["os_target"],
+                    "artifacts_container_port": job["artifacts_container_port"],
+                    "tkr_suffix": job["tkr_suffix"],
+                    "env": env,
+                })
+            except (OSError, ValueError) as e:
+                print("build-coordinator: failed to submit job {} to {}: {}".format(job["id"], worker.name, e))
+                with self.lock:
+                    job.update({"status": JOB_QUEUED, "worker": None})
+                continue
+            with self.lock:
+                job.update({"worker_job_id": worker_job["id"], "dispatched": time.time(), "log_offset": 0})
+            print("build-coordinator: dispatched job {} ({} {}) to {}".format(
+                job["id"], job["kubernetes_version"], job["os_target"], worker.name))
+
+    def poll(self, job, worker):
+        """
+        Return the job of the worker, the new log bytes and the update of the job.
+        """
+        try:
+            # The log is read after the status, the agent copies the complete log
+            # of a job before it publishes its final status
+            worker_job = worker.call("/jobs/{}".format(job["worker_job_id"]))
+            with worker.open("/jobs/{}/log?offset={}".format(job["worker_job_id"], job["log_offset"])) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None, b"", {"status": JOB_FAILED, "finished": time.time(),
+                                   "error": "Job {} is unknown to {}".format(job["worker_job_id"], worker.name)}
+            return None, b"", {"worker_error": str(e)}
+        except (OSError, ValueError) as e:
+            # The job keeps running on the worker, it is checked again in the next round
+            return None, b"", {"worker_error": str(e)}
+        update = {"worker_error": None, "worker_status": worker_job["status"]}
+        if worker_job["status"] in [JOB_FAILED, JOB_CANCELLED]:
+            update.update({"status": JOB_FAILED, "finished": time.time(),
+                           "error": worker_job.get("error", "Build failed on {}".format(worker.name))})
+        return worker_job, data, update
+
+    def check_dispatched_jobs(self):
+        with self.lock:
+            dispatched = [dict(job) for job in self.jobs.values()
+                          if job["status"] == JOB_DISPATCHED and job.get("worker_job_id")]
+        for snapshot in dispatched:
+            worker = self.worker(snapshot["worker"])
+            if worker is None:
+                worker_job, data = None, b""
+                update = {"status": JOB_FAILED, "finished": time.time(),
+                          "error": "Worker {} is not configured".format(snapshot["worker"])}
+            else:
+                worker_job, data, update = self.poll(snapshot, worker)
+            with self.lock:
+                job = self.jobs[snapshot["id"]]
+                if data:
+                    with open(os.path.join(self.args.state_dir, "{}.log".format(job["id"])), 'ab') as fp:
+                        fp.write(data)
+                    job["log_offset"] += len(data)
+                job.update(update)
+                if job.get("worker_error") is None:
+                    job.pop("worker_error", None)
+                if worker_job and worker_job["status"] == JOB_SUCCEEDED:
+                    job["status"] = JOB_COLLECTING
+                    threading.Thread(target=self.collect, args=(job, worker), daemon=True).start()
+                elif job["status"] == JOB_FAILED:
+                    print("build-coordinator: job {} failed on {}".format(job["id"], snapshot["worker"]))
+
+    def download(self, worker, job, name, entry, folder):
+        """
+        Download an artifact of the job into folder and verify its checksum.
+        """
+        path = os.path.join(folder, name)
+        m = hashlib.sha256()
+        with worker.open("/jobs/{}/artifacts/{}".format(job["worker_job_id"], urllib.parse.quote(name)),
+                         timeout=300) as response, open(path, 'wb') as fp:
+            while True:
+                data = response.read(1024 * 1024)
+                if not data:
+                    break
+                m.update(data)
+                fp.write(data)
+        if m.hexdigest() != entry["sha256"]:
+            raise ValueError("Checksum mismatch of {} downloaded from {}".format(name, worker.name))
+        return path
+
+    def collect(self, job, worker):
+        """
+        Add the OVA and the sidecar files of a finished job to the central artifacts store.
+        Every job downloads into its own folder, on the file system of the store.
+        """
+        download_folder = tempfile.mkdtemp(prefix=".collect-{}-".format(job["id"]),
+                                           dir=self.args.image_artifacts_path)
+        try:
+            build = worker.call("/jobs/{}/artifacts".format(job["worker_job_id"]))
+            files = [self.download(worker, job, name, entry, download_folder)
+                     for name, entry in sorted(build["files"].items())]
+            metadata = dict(build["metadata"], job_id=job["id"], worker=worker.name,
+                            worker_job_id=job["worker_job_id"])
+            artifacts_store.add_build(self.store, build["build_id"], files, metadata)
+            update = {"status": JOB_SUCCEEDED, "build_id": build["build_id"], "finished": time.time()}
+            print("build-coordinator: job {} succeeded, added build {} to {}".format(
+                job["id"], build["build_id"], self.store))
+        except (OSError, ValueError, KeyError) as e:
+            update = {"status": JOB_FAILED, "error": "Collecting the artifacts failed: {}".format(e),
+                      "finished": time.time()}
+            print("build-coordinator: job {} failed to collect artifacts from {}: {}".format(
+                job["id"], worker.name, e))
+        finally:
+            shutil.rmtree(download_folder, ignore_errors=True)
+        with self.lock:
+            job.update(update)
+            self.save()
+
+    def job_log(self, job_id, lines=200):
+        log_file = os.path.join(self.args.state_dir, "{}.log".format(job_id))
+        if not os.path.exists(log_file):
+            return ""
+        with open(log_file, 'r', errors='replace') as fp:
+            return "".join(fp.readlines()[-lines:])
+
+    def job_log_from(self, job_id, offset):
+        log_file = os.path.join(self.args.state_dir, "{}.log".format(job_id))
+        if not os.path.exists(log_file):
+            return b""
+        with open(log_file, 'rb') as fp:
+            fp.seek(offset)
+            return fp.read()
+
+    def run(self):
+        while True:
+            for worker in self.workers:
+                worker.refresh()
+            self.check_dispatched_jobs()
+            self.dispatch()
+            with self.lock:
+                self.save()
+            time.sleep(self.args.poll_interval)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    coordinator = None
+
+    def send_json(self, code, data):
+        self.send_bytes(code, json.dumps(data, indent=4).encode('utf-8'), "application/json")
+
+    def send_bytes(self, code, body, content_type="text/plain"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def path_parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def query(self):
+        return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+
+    def do_GET(self):
+        parts = self.path_parts()
+        job = self.coordinator.job(parts[1]) if len(parts) > 1 and parts[0] == "jobs" else None
+        if parts == ["status"]:
+            self.send_json(200, self.coordinator.status())
+        elif parts == ["jobs"]:
+            self.send_json(200, self.coordinator.list_jobs())
+        elif len(parts) == 2 and parts[0] == "jobs" and job:
+            self.send_json(200, job)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "log" and job:
+            if "offset" in self.query():
+                self.send_bytes(200, self.coordinator.job_log_from(parts[1], int(self.query()["offset"])),
+                                "application/octet-stream")
+            else:
+                self.send_bytes(200, self.coordinator.job_log(parts[1]).encode('utf-8'))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path_parts() != ["jobs"]:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            jobs = self.coordinator.submit(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(201, jobs)
+
+    def do_DELETE(self):
+        parts = self.path_parts()
+        if len(parts) != 2 or parts[0] != "jobs" or self.coordinator.job(parts[1]) is None:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            self.send_json(200, self.coordinator.cancel(parts[1]))
+        except ValueError as e:
+            self.send_json(409, {"error": str(e)})
+
+
+def follow(args):
+    url = "http://{}/jobs/{}".format(args.listen, args.follow)
+    offset = 0
+    while True:
+        with urllib.request.urlopen(url) as response:
+            job = json.load(response)
+        with urllib.request.urlopen("{}/log?offset={}".format(url, offset)) as response:
+            data = response.read()
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+        offset += len(data)
+        if job["status"] in FINISHED and not data:
+            print("build-coordinator: job {} {}".format(job["id"], job["status"]))
+            sys.exit(0 if job["status"] == JOB_SUCCEEDED else 1)
+        if not data:
+            time.sleep(args.poll_interval)
+
+
+def main():
+    args = parse_args()
+    if args.follow:
+        follow(args)
+        return
+    args.image_artifacts_path = os.path.abspath(args.image_artifacts_path)
+    coordinator = Coordinator(args)
+    RequestHandler.coordinator = coordinator
+
+    host, port = args.listen.rsplit(':', 1)
+    server = ThreadingHTTPServer((host, int(port)), RequestHandler)
+    print("build-coordinator: serving API on http://%s" % args.listen)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    coordinator.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: build-scheduler.py [FLAGS]
+#  Long running scheduler for node image builds. Build jobs (Kubernetes version
+#  x OS target) are submitted through a local HTTP API, queued on disk and
+#  started in pre-warmed builder containers when the host has enough CPU,
+#  memory, disk and a free Packer HTTP port.
+#
+#  API:
+#    POST   /jobs           submit a job, body:
+#                           {"kubernetes_version": "...", "os_target": "...",
+#                            "artifacts_container_port": 8081,
+#                            "tkr_suffix": "...", "env": {"KEY": "VALUE"}}
+#    GET    /jobs           list jobs
+#    GET    /jobs/<id>      job status
+#    GET    /jobs/<id>/log  last lines of the job log, with ?offset=N the log
+#                           bytes from offset N for log streaming
+#    GET    /jobs/<id>/artifacts        artifacts store entry of a job built
+#                                       with ARTIFACTS_STORE=true
+#    GET    /jobs/<id>/artifacts/<name> content of an artifact of the job
+#    DELETE /jobs/<id>      cancel a queued job
+#    GET    /status         queue depth, running jobs, resources, pool and the
+#                           builder images and artifacts servers of the host
+#
+#  The scheduler is also the agent of the build hosts of build-coordinator.py.
+################################################################################
+
+import argparse
+import json
+import os
+import shutil
+import socketserver
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CONTAINER_WORKDIR = "/image-builder/images/capi"
+WARM_MARKER = "/image-builder/warm"
+JOB_LOG = "/image-builder/job.log"
+JOB_RC = "/image-builder/job.rc"
+BUILDER_IMAGE_PREFIX = "vsphere-tanzu-byoi-"
+ARTIFACTS_SERVER_SUFFIX = "-artifacts-server"
+ARTIFACTS_SERVER_STATE_DIR = os.path.expanduser("~/.byoi-artifacts-server")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# Repository folders mounted into the builder containers, same as build-node-image.sh
+REPO_MOUNTS = ["ansible", "ansible-finalize", "ansible-windows", "goss", "hack", "packer-variables", "scripts"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Scheduler for node image builds with a local job API")
+    parser.add_argument('--host_ip', required=True,
+                        help='IP Address of host where the artifacts containers are running')
+    parser.add_argument('--image_artifacts_path', required=True,
+                        help='Node image OVA and packer logs output folder shared by all jobs')
+    parser.add_argument('--state_dir', default=os.path.expanduser('~/.byoi-scheduler'),
+                        help='Folder where the job queue is persisted')
+    parser.add_argument('--listen', default='127.0.0.1:8090',
+                        help='Address of the HTTP API, default value is 127.0.0.1:8090')
+    parser.add_argument('--socket', default=None,
+                        help='Serve the API on this UNIX socket instead of --listen')
+    parser.add_argument('--pool_size', type=int, default=1,
+                        help='Number of warm builder containers kept per Kubernetes version')
+    parser.add_argument('--port_range', default='8082-8099',
+                        help='Packer HTTP ports available to the jobs, default value is 8082-8099')
+    parser.add_argument('--job_cpus', type=float, default=2,
+                        help='CPUs reserved per running job')
+    parser.add_argument('--job_memory_mb', type=int, default=4096,
+                        help='Free memory required to start a job')
+    parser.add_argument('--job_disk_gb', type=int, default=40,
+                        help='Free disk space on the artifacts folder required to start a job')
+    parser.add_argument('--poll_interval', type=int, default=10,
+                        help='Seconds between scheduling rounds')
+    parser.add_argument('--packer_cache_path', default=None,
+                        help='Host folder used as packer cache shared by all the jobs')
+    return parser.parse_args()
+
+
+def docker(*args, check=True):
+    return subprocess.run(["docker"] + list(args), capture_output=True, text=True, check=check)
+
+
+def get_image_builder_container_image_name(kubernetes_version):
+    # Keep in sync with get_image_builder_container_image_name in make-helpers/utils.sh
+    return BUILDER_IMAGE_PREFIX + kubernetes_version.replace('+', '---')
+
+
+def get_builder_image_versions():
+    """
+    Return the Kubernetes versions whose builder container image is present on the host.
+    """
+    result = docker("images", "--filter", "reference={}*".format(BUILDER_IMAGE_PREFIX),
+                    "--format", "{{.Repository}}", check=False)
+    return sorted({line[len(BUILDER_IMAGE_PREFIX):].replace('---', '+')
+                   for line in result.stdout.split() if line.startswith(BUILDER_IMAGE_PREFIX)})
+
+
+def get_artifacts_server_versions():
+    """
+    Return the Kubernetes versions with a running artifacts container or
+    artifacts server, see run-artifacts-container.sh.
+    """
+    result = docker("ps", "--filter", "label=byoi_artifacts", "--format", "{{.Names}}", check=False)
+    names = result.stdout.split()
+    if os.path.isdir(ARTIFACTS_SERVER_STATE_DIR):
+        for pid_file in os.listdir(ARTIFACTS_SERVER_STATE_DIR):
+            if not pid_file.endswith(".pid"):
+                continue
+            with open(os.path.join(ARTIFACTS_SERVER_STATE_DIR, pid_file), 'r') as fp:
+                pid = fp.read().strip()
+            if pid.isdigit() and os.path.exists("/proc/{}".format(pid)):
+                names.append(pid_file[:-len(".pid")])
+    return sorted({name[:-len(ARTIFACTS_SERVER_SUFFIX)].replace('---', '+')
+                   for name in names if name.endswith(ARTIFACTS_SERVER_SUFFIX)})
+
+
+def get_free_memory_mb():
+    with open('/proc/meminfo', 'r') as fp:
+        for line in fp:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+class Scheduler():
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.state_file = os.path.join(args.state_dir, 'jobs.json')
+        port_min, port_max = args.port_range.split('-')
+        self.ports = list(range(int(port_min), int(port_max) + 1))
+        self.jobs = {}
+        self.pool = {}
+        os.makedirs(args.state_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """
+        Restore the queue. Running jobs are monitored again through their
+        container, jobs whose container is gone are marked as failed.
+        """
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as fp:
+                state = json.load(fp)
+            self.jobs = state.get("jobs", {})
+            self.pool = state.get("pool", {})
+        for job in self.jobs.values():
+            if job["status"] == JOB_RUNNING and not self.container_exists(job["container"]):
+                job["status"] = JOB_FAILED
+                job["error"] = "Builder container is gone after scheduler restart"
+        for version in list(self.pool):
+            self.pool[version] = [name for name in self.pool[version] if self.container_exists(name)]
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as fp:
+            json.dump({"jobs": self.jobs, "pool": self.pool}, fp, indent=4)
+        os.replace(tmp_file, self.state_file)
+
+    def container_exists(self, name):
+        return docker("inspect", name, check=False).returncode == 0
+
+    def submit(self, request):
+        for key in ["kubernetes_version", "os_target", "artifacts_container_port"]:
+            if key not in request:
+                raise ValueError("{} is required".format(key))
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "kubernetes_version": request["kubernetes_version"],
+            "os_target": request["os_target"],
+            "artifacts_container_port": str(request["artifacts_container_port"]),
+            "tkr_suffix": request.get("tkr_suffix", ""),
+            "env": request.get("env", {}),
+            "status": JOB_QUEUED,
+            "submitted": time.time(),
+        }
+        with self.lock:
+            self.jobs[job["id"]] = job
+            self.save()
+        return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs[job_id]
+            if job["status"] != JOB_QUEUED:
+                raise ValueError("Only queued jobs can be cancelled")
+            job["status"] = JOB_CANCELLED
+            self.save()
+        return job
+
+    def queued_jobs(self):
+        return sorted([job for job in self.jobs.values() if job["status"] == JOB_QUEUED],
+                      key=lambda job: job["submitted"])
+
+    def running_jobs(self):
+        return [job for job in self.jobs.values() if job["status"] == JOB_RUNNING]
+
+    def job(self, job_id):
+        """
+        Return a copy of the job, None when the job is unknown.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def status(self):
+        with self.lock:
+            running = self.running_jobs()
+            status = {
+                "queue_depth": len(self.queued_jobs()),
+                "running": [job["id"] for job in running],
+                "free_ports": len(self.free_ports()),
+                "reserved_cpus": len(running) * self.args.job_cpus,
+                "warm_pool": {version: list(names) for version, names in self.pool.items()},
+            }
+        # docker is called outside of the lock, it would block the API during a scheduling round
+        status.update({
+            "free_memory_mb": get_free_memory_mb(),
+            "free_disk_gb": shutil.disk_usage(self.args.image_artifacts_path).free // (1024 ** 3),
+            "cpus": os.cpu_count(),
+            "builder_images": get_builder_image_versions(),
+            "artifacts_servers": get_artifacts_server_versions(),
+        })
+        return status
+
+    def free_ports(self):
+        used = [job["packer_http_port"] for job in self.running_jobs()]
+        return [port for port in self.ports if port not in used]
+
+    def can_admit(self, started=0):
+        """
+        Checks the CPU, memory, disk and port budget for one more job. The
+        memory and disk of the jobs started in the same round are not in use
+        yet, so their reservations are subtracted from what is free.
+        """
+        if (len(self.running_jobs()) + 1) * self.args.job_cpus > os.cpu_count():
+            return False
+        if get_free_memory_mb() - started * self.args.job_memory_mb < self.args.job_memory_mb:
+            return False
+        free_disk = shutil.disk_usage(self.args.image_artifacts_path).free
+        if free_disk - started * self.args.job_disk_gb * (1024 ** 3) < self.args.job_disk_gb * (1024 ** 3):
+            return False
+        return len(self.free_ports()) > 0
+
+    def container_args(self, name, kubernetes_version, artifacts_container_port):
+        args = ["run", "-d", "--name", name, "--network", "host", "--platform", "linux/amd64",
+                "-l", "byoi", "-l", "byoi_image_builder", "-l", "byoi_warm", "-l", kubernetes_version]
+        for folder in REPO_MOUNTS:
+            args += ["-v", "{}:{}/image/{}".format(os.path.join(ROOT, folder), CONTAINER_WORKDIR, folder)]
+        if self.args.packer_cache_path:
+            args += ["-v", "{}:/image-builder/packer_cache".format(self.args.packer_cache_path),
+                     "-e", "SHARED_PACKER_CACHE=true"]
+        args += ["-v", "{}:{}/artifacts".format(self.args.image_artifacts_path, CONTAINER_WORKDIR),
+                 "-w", CONTAINER_WORKDIR,
+                 "-e", "HOST_IP=" + self.args.host_ip,
+                 "-e", "ARTIFACTS_CONTAINER_PORT=" + artifacts_container_port,
+                 "-e", "KUBERNETES_VERSION=" + kubernetes_version,
+                 get_image_builder_container_image_name(kubernetes_version),
+                 "bash", "-c", "./build-ova.sh prepare && touch {} && sleep infinity".format(WARM_MARKER)]
+        return args
+
+    def warm_up(self):
+        """
+        Keep pool_size warm builder containers for every Kubernetes version
+        with queued jobs. The pool is only changed by the scheduling thread,
+        the containers are started outside of the lock.
+        """
+        with self.lock:
+            versions = {}
+            for job in self.queued_jobs():
+                versions.setdefault(job["kubernetes_version"], job["artifacts_container_port"])
+            pools = {version: list(self.pool.get(version, [])) for version in versions}
+        for version, artifacts_container_port in versions.items():
+            pool = pools[version]
+            # A container whose prepare failed has exited and never gets warm
+            for name in [name for name in pool if not self.is_running(name)]:
+                print("build-scheduler: removing warm container {}, prepare failed".format(name))
+                docker("rm", "-f", name, check=False)
+                pool.remove(name)
+            while len(pool) < self.args.pool_size:
+                name = "{}-warm-{}-image-builder".format(version.replace('+', '---'), uuid.uuid4().hex[:6])
+                result = docker(*self.container_args(name, version, artifacts_container_port), check=False)
+                if result.returncode != 0:
+                    print("build-scheduler: failed to start warm container for {}: {}".format(version, result.stderr))
+                    break
+                print("build-scheduler: started warm container {}".format(name))
+                pool.append(name)
+            with self.lock:
+                self.pool[version] = pool
+
+    def is_running(self, name):
+        result = docker("inspect", "-f", "{{.State.Running}}", name, check=False)
+        return result.returncode == 0 and result.stdout.strip() == "true"
+
+    def is_warm(self, name):
+        return docker("exec", name, "test", "-f", WARM_MARKER, check=False).returncode == 0
+
+    def start_jobs(self):
+        """
+        Admit the queued jobs under the lock, they are marked as running so
+        they cannot be cancelled anymore, then start them outside of it.
+        """
+        with self.lock:
+            pools = {version: list(names) for version, names in self.pool.items()}
+        warm = {version: [name for name in names if self.is_warm(name)] for version, names in pools.items()}
+
+        admitted = []
+        with self.lock:
+            for job in self.queued_jobs():
+                if not self.can_admit(len(admitted)):
+                    break
+                container = next(iter(warm.get(job["kubernetes_version"], [])), None)
+                if container is None:
+                    continue
+                warm[job["kubernetes_version"]].remove(container)
+                self.pool[job["kubernetes_version"]].remove(container)
+                job.update({"status": JOB_RUNNING, "container": container, "packer_http_port": self.free_ports()[0],
+                            "started": time.time()})
+                admitted.append(dict(job))
+            self.save()
+
+        for job in admitted:
+            env = {
+                "OS_TARGET": job["os_target"],
+                "TKR_SUFFIX": job["tkr_suffix"],
+                "PACKER_HTTP_PORT": str(job["packer_http_port"]),
+                # The warm container was created with the port of the job that requested it
+                "ARTIFACTS_CONTAINER_PORT": job["artifacts_container_port"],
+                # Recorded in the artifacts store metadata of the build
+                "BUILD_JOB_ID": job["id"],
+            }
+            env.update(job["env"])
+            exec_args = ["exec", "-d"]
+            for key, value in env.items():
+                exec_args += ["-e", "{}={}".format(key, value)]
+            # The exit code is renamed into place so it is never read half written
+            exec_args += [job["container"], "bash", "-c",
+                          "./build-ova.sh build > {log} 2>&1; echo $? > {rc}.tmp && mv {rc}.tmp {rc}".format(
+                              log=JOB_LOG, rc=JOB_RC)]
+            try:
+                docker(*exec_args)
+            except subprocess.CalledProcessError as e:
+                docker("rm", "-f", job["container"], check=False)
+                with self.lock:
+                    self.jobs[job["id"]].update({"status": JOB_FAILED, "finished": time.time(),
+                                                 "error": "Failed to start the build: {}".format(e.stderr.strip())})
+                print("build-scheduler: failed to start job {} in {}: {}".format(job["id"], job["container"], e.stderr))
+                continue
+            print("build-scheduler: started job {} in {}".format(job["id"], job["container"]))
+
+    def check_job(self, job):
+        """
+        Return the update of a running job, None while it is running. The log
+        is copied out of the builder container before the job is finished, the
+        log of a finished job is only read from the state folder.
+        """
+        result = docker("exec", job["container"], "cat", JOB_RC, check=False)
+        if result.returncode != 0 or not result.stdout.strip():
+            if not self.container_exists(job["container"]):
+                return {"status": JOB_FAILED, "error": "Builder container is gone", "finished": time.time()}
+            return None
+        exit_code = int(result.stdout.strip())
+        log_file = os.path.join(self.args.state_dir, "{}.log".format(job["id"]))
+        copy = docker("cp", "{}:{}".format(job["container"], JOB_LOG), log_file + ".tmp", check=False)
+        if copy.returncode == 0:
+            os.replace(log_file + ".tmp", log_file)
+        else:
+            print("build-scheduler: failed to copy the log of job {}: {}".format(job["id"], copy.stderr))
+        return {"exit_code": exit_code, "status": JOB_SUCCEEDED if exit_code == 0 else JOB_FAILED,
+                "finished": time.time()}
+
+    def check_running_jobs(self):
+        with self.lock:
+            running = [dict(job) for job in self.running_jobs()]
+        for job in running:
+            update = self.check_job(job)
+            if update is None:
+                continue
+            with self.lock:
+                self.jobs[job["id"]].update(update)
+                self.save()
+            if update.get("error") is None:
+                docker("rm", "-f", job["container"], check=False)
+            print("build-scheduler: job {} {}".format(job["id"], update["status"]))
+
+    def job_log(self, job_id, lines=200):
+        job = self.job(job_id)
+        log_file = os.path.join(self.args.state_dir, "{}.log".format(job_id))
+        if os.path.exists(log_file):
+            with open(log_file, 'r', errors='replace') as fp:
+                return "".join(fp.readlines()[-lines:])
+        if job["status"] == JOB_RUNNING:
+            return docker("exec", job["container"], "tail", "-n", str(lines), JOB_LOG, check=False).stdout
+        return ""
+
+    def job_log_from(self, job_id, offset):
+        """
+        Return the bytes of the job log from offset, the log is read from the
+        builder container while the job is running.
+        """
+        job = self.job(job_id)
+        log_file = os.path.join(self.args.state_dir, "{}.log".format(job_id))
+        if os.path.exists(log_file):
+            with open(log_file, 'rb') as fp:
+                fp.seek(offset)
+                return fp.read()
+        if job["status"] == JOB_RUNNING:
+            return subprocess.run(["docker", "exec", job["container"], "tail", "-c", "+{}".format(offset + 1), JOB_LOG],
+                                  capture_output=True).stdout
+        return b""
+
+    def job_artifacts(self, job_id):
+        """
+        Return the artifacts store entry of the build of the job, None when
+        the job did not add a build to the store.
+        """
+        index_file = os.path.join(self.args.image_artifacts_path, "store", "index.json")
+        if not os.path.exists(index_file):
+            return None
+        with open(index_file, 'r') as fp:
+            builds = json.load(fp)["builds"]
+        return next((build for build in builds.values() if build["metadata"].get("job_id") == job_id), None)
+
+    def job_artifact_path(self, job_id, name):
+        build = self.job_artifacts(job_id)
+        if build is None or name not in build["files"]:
+            return None
+        return os.path.join(self.args.image_artifacts_path, "store", "builds", build["build_id"], name)
+
+    def run(self):
+        # The lock is only held to read and update the jobs, never during the docker calls
+        while True:
+            self.check_running_jobs()
+            self.warm_up()
+            self.start_jobs()
+            with self.lock:
+                self.save()
+            time.sleep(self.args.poll_interval)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    scheduler = None
+
+    def send_json(self, code, data):
+        body = json.dumps(data, indent=4).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, code, text):
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_bytes(self, code, data):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_file(self, path):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as fp:
+            shutil.copyfileobj(fp, self.wfile, 1024 * 1024)
+
+    def path_parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def query(self):
+        return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+
+    def do_GET(self):
+        parts = self.path_parts()
+        job = self.scheduler.job(parts[1]) if len(parts) > 1 and parts[0] == "jobs" else None
+        if parts == ["status"]:
+            self.send_json(200, self.scheduler.status())
+        elif parts == ["jobs"]:
+            self.send_json(200, self.scheduler.list_jobs())
+        elif len(parts) == 2 and parts[0] == "jobs" and job:
+            self.send_json(200, job)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "log" and job:
+            if "offset" in self.query():
+                self.send_bytes(200, self.scheduler.job_log_from(parts[1], int(self.query()["offset"])))
+            else:
+                self.send_text(200, self.scheduler.job_log(parts[1]))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "artifacts" and job:
+            build = self.scheduler.job_artifacts(parts[1])
+            if build is None:
+                self.send_json(404, {"error": "No artifacts for job {}".format(parts[1])})
+            else:
+                self.send_json(200, build)
+        elif len(parts) == 4 and parts[0] == "jobs" and parts[2] == "artifacts" and job:
+            path = self.scheduler.job_artifact_path(parts[1], urllib.parse.unquote(parts[3]))
+            if path is None:
+                self.send_json(404, {"error": "Not found"})
+            else:
+                self.send_file(path)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path_parts() != ["jobs"]:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = self.scheduler.submit(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(201, job)
+
+    def do_DELETE(self):
+        parts = self.path_parts()
+        if len(parts) != 2 or parts[0] != "jobs" or self.scheduler.job(parts[1]) is None:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            self.send_json(200, self.scheduler.cancel(parts[1]))
+        except ValueError as e:
+            self.send_json(409, {"error": str(e)})
+
+    def address_string(self):
+        # client_address is empty for UNIX sockets
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    args = parse_args()
+    args.image_artifacts_path = os.path.abspath(args.image_artifacts_path)
+    if args.packer_cache_path:
+        args.packer_cache_path = os.path.abspath(args.packer_cache_path)
+        os.makedirs(args.packer_cache_path, exist_ok=True)
+    scheduler = Scheduler(args)
+    RequestHandler.scheduler = scheduler
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, RequestHandler)
+        print("build-scheduler: serving API on unix socket %s" % args.socket)
+    else:
+        host, port = args.listen.rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), RequestHandler)
+        print("build-scheduler: serving API on http://%s" % args.listen)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
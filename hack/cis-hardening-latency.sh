@@ -0,0 +1,78 @@
+#!/bin/bash
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# Measures the time between a kubelet drop-in file appearing and the CIS
+# hardening script setting its permissions to 600, for the systemd path unit
+# and for the previous 2 second polling loop. Both are emulated in a temporary
+# drop-in folder: the path unit with inotifywait (inotify-tools) watching the
+# same events as PathChanged=, the polling loop with a loop running the script
+# every 2 seconds. The real path unit is not exercised.
+#
+# Usage: hack/cis-hardening-latency.sh [iterations]
+
+set -euo pipefail
+
+ROOT=$(dirname "${BASH_SOURCE[0]}")/..
+ITERATIONS=${1:-20}
+
+command -v inotifywait >/dev/null || { echo "inotifywait (inotify-tools) is required"; exit 1; }
+
+export KUBELET_DROPIN_DIR=$(mktemp -d)
+watcher_pid=
+
+function stop_watcher() {
+    if [[ -n "${watcher_pid}" ]]; then
+        { pkill -P ${watcher_pid}; kill ${watcher_pid}; wait ${watcher_pid}; } 2>/dev/null || true
+        watcher_pid=
+    fi
+}
+trap 'stop_watcher; rm -rf "${KUBELET_DROPIN_DIR}"' EXIT
+
+function path_unit_emulation() {
+    inotifywait -q -m -e attrib,close_write,create,delete,moved_to,moved_from "${KUBELET_DROPIN_DIR}" | \
+    while read -r _; do
+        bash "${ROOT}/ansible/files/scripts/cis_hardening.sh" >/dev/null
+    done
+}
+
+function polling_loop_emulation() {
+    while true; do
+        bash "${ROOT}/ansible/files/scripts/cis_hardening.sh" >/dev/null
+        sleep 2
+    done
+}
+
+# Runs the given watcher in the background and prints the average and maximum
+# latency in microseconds
+function measure() {
+    local label=$1 watcher=$2
+    $watcher >/dev/null 2>&1 &
+    watcher_pid=$!
+    sleep 1
+
+    local total=0 max=0 start latency
+    for i in $(seq 1 "${ITERATIONS}"); do
+        for file in 10-kubeadm.conf 11-resource-sizing.conf; do
+            start=$(date +%s%N)
+            echo "[Service]" > "${KUBELET_DROPIN_DIR}/${file}"
+            chmod 644 "${KUBELET_DROPIN_DIR}/${file}"
+            until [[ "$(stat -c '%a' "${KUBELET_DROPIN_DIR}/${file}")" == "600" ]]; do
+                sleep 0.001
+            done
+            latency=$(( ($(date +%s%N) - start) / 1000 ))
+            total=$((total + latency))
+            [[ ${latency} -gt ${max} ]] && max=${latency}
+            rm -f "${KUBELET_DROPIN_DIR}/${file}"
+        done
+    done
+
+    stop_watcher
+    echo "${label}: average $((total / (ITERATIONS * 2)))us, max ${max}us"
+}
+
+samples=$((ITERATIONS * 2))
+echo "Drop-in hardening latency over ${samples} samples, emulated in ${KUBELET_DROPIN_DIR}"
+measure "Path unit (inotifywait emulation)" path_unit_emulation
+measure "Previous 2 second polling loop (emulation)" polling_loop_emulation
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: sudo hack/containerd-pull-benchmark.py --registry_store <folder> [options]
+#  Measures the cold pull and unpack time of the images of an embedded registry
+#  store under each combination of the image pull tuning packer variables.
+#
+#  For every setting the containerd and registry configuration templates of the
+#  ansible role are rendered, the embedded registry binary serves the store and
+#  a private containerd instance pulls the images through the CRI API with
+#  crictl, so the pulls go through the same path as kubelet. Every run starts
+#  from an empty containerd root. The images are pulled one at a time and then
+#  all at once, like the pods of a node joining during a cluster scale-out.
+#
+#  Requires root, containerd, crictl, the registry binary and python3-jinja2.
+#  The store is the content of the registry store archive of the build, e.g.
+#  /storage/container-registry on a node.
+################################################################################
+
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from jinja2 import Environment, FileSystemLoader
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TEMPLATES = os.path.join(ROOT, "ansible", "templates")
+CONTAINERD_READY = os.path.join(ROOT, "ansible", "files", "usr", "local", "bin", "containerd-ready")
+REGISTRY = "localhost:5000"
+
+
+def list_images(store, patterns):
+    """
+    Return the image references of the registry store matching the glob patterns.
+    """
+    repositories = os.path.join(store, "docker", "registry", "v2", "repositories")
+    images = []
+    for root, dirs, _ in os.walk(repositories):
+        if os.path.basename(root) == "tags" and os.path.basename(os.path.dirname(root)) == "_manifests":
+            repository = os.path.relpath(os.path.dirname(os.path.dirname(root)), repositories)
+            for tag in dirs:
+                reference = "{}/{}:{}".format(REGISTRY, repository, tag)
+                if any(fnmatch.fnmatchcase(reference, pattern) for pattern in patterns):
+                    images.append(reference)
+            dirs.clear()
+    return sorted(images)
+
+
+def render(template, variables):
+    # Same block handling as the ansible template module
+    env = Environment(loader=FileSystemLoader(TEMPLATES), trim_blocks=True)
+    return env.get_template(template).render(variables)
+
+
+def write_configs(workdir, store, port, setting):
+    variables = {
+        "pause_image": "{}/vmware.io/pause:benchmark".format(REGISTRY),
+        "registry_root_directory": store,
+        "containerd_image_pull_progress_timeout": "",
+    }
+    variables.update(setting)
+
+    registry_config = render("etc/registry/config.yml", variables)
+    registry_config = registry_config.replace("addr: :5000", "addr: 127.0.0.1:{}".format(port))
+    registry_config = registry_config.replace("addr: localhost:5001", "addr: 127.0.0.1:{}".format(port + 1))
+
+    # Private root, state and socket, the localhost:5000 mirror points to the benchmark registry
+    containerd_config = render("etc/containerd/config_v2.toml", variables)
+    containerd_config = re.sub(r'^root = ".*"', 'root = "{}/root"'.format(workdir), containerd_config, flags=re.M)
+    containerd_config = re.sub(r'^state = ".*"', 'state = "{}/state"'.format(workdir), containerd_config, flags=re.M)
+    containerd_config = containerd_config.replace('"/run/containerd/containerd.sock"',
+                                                  '"{}/containerd.sock"'.format(workdir))
+    containerd_config = containerd_config.replace('endpoint = ["http://localhost:5000"]',
+                                                  'endpoint = ["http://127.0.0.1:{}"]'.format(port))
+
+    with open(os.path.join(workdir, "registry.yml"), "w") as fp:
+        fp.write(registry_config)
+    with open(os.path.join(workdir, "containerd.toml"), "w") as fp:
+        fp.write(containerd_config)
+
+
+def wait_registry(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen("http://127.0.0.1:{}/v2/".format(port), timeout=1)
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise Exception("registry did not start on port {}".format(port))
+
+
+class Instance():
+    """
+    Embedded registry and containerd processes of a single benchmark run.
+    """
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.args = args
+        self.processes = []
+        self.socket = os.path.join(workdir, "containerd.sock")
+
+    def start(self):
+        logs = open(os.path.join(self.workdir, "processes.log"), "a")
+        self.processes.append(subprocess.Popen([self.args.registry, "serve", os.path.join(self.workdir, "registry.yml")],
+                                               stdout=logs, stderr=logs))
+        wait_registry(self.args.port)
+        self.processes.append(subprocess.Popen([self.args.containerd, "--config",
+                                                os.path.join(self.workdir, "containerd.toml")],
+                                               stdout=logs, stderr=logs))
+        subprocess.run([sys.executable, CONTAINERD_READY, "--socket", self.socket, "--timeout", "30"],
+                       check=True, capture_output=True)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+            process.wait()
+        self.processes = []
+        # containerd leaves the overlayfs snapshots mounted on exit
+        subprocess.run("grep -o ' {}/root[^ ]*' /proc/mounts | xargs -r umount".format(self.workdir), shell=True)
+        shutil.rmtree(os.path.join(self.workdir, "root"), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.workdir, "state"), ignore_errors=True)
+
+    def pull(self, image):
+        start = time.monotonic()
+        subprocess.run([self.args.crictl, "--runtime-endpoint", "unix://" + self.socket, "pull", image],
+                       check=True, capture_output=True)
+        return time.monotonic() - start
+
+
+def pull_or_record(instance, image, failed):
+    try:
+        instance.pull(image)
+    except subprocess.CalledProcessError:
+        failed.append(image)
+
+
+def run_setting(setting, images, args):
+    with tempfile.TemporaryDirectory(prefix="containerd-pull-benchmark-") as workdir:
+        write_configs(workdir, args.registry_store, args.port, setting)
+        instance = Instance(workdir, args)
+        sequential = {image: [] for image in images}
+        concurrent = []
+        try:
+            for _ in range(args.iterations):
+                instance.start()
+                for image in images:
+                    sequential[image].append(instance.pull(image))
+                instance.stop()
+
+                instance.start()
+                start = time.monotonic()
+                failed = []
+                threads = [threading.Thread(target=pull_or_record, args=(instance, image, failed)) for image in images]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                if failed:
+                    raise Exception("concurrent pull of {} failed".format(", ".join(failed)))
+                concurrent.append(time.monotonic() - start)
+                instance.stop()
+        finally:
+            instance.stop()
+
+    return {
+        "setting": setting,
+        "images": {image: statistics.median(durations) for image, durations in sequential.items()},
+        "sequential_seconds": statistics.median([sum(durations) for durations in zip(*sequential.values())]),
+        "concurrent_seconds": statistics.median(concurrent),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the containerd and embedded registry pull settings')
+    parser.add_argument('--registry_store', required=True,
+                        help='Registry store folder served by the embedded registry')
+    parser.add_argument('--images', nargs='*', default=["*"],
+                        help='Glob patterns of the image references to pull, default value is all the images')
+    parser.add_argument('--max_concurrent_downloads', nargs='*', default=["", "6", "10"],
+                        help='Values of containerd_max_concurrent_downloads, empty is the containerd default')
+    parser.add_argument('--blobdescriptor_cache', nargs='*', default=["", "inmemory"],
+                        help='Values of registry_blobdescriptor_cache, empty disables the cache')
+    parser.add_argument('--log_level', nargs='*', default=["debug", "info"],
+                        help='Values of registry_log_level')
+    parser.add_argument('--iterations', type=int, default=3,
+                        help='Number of cold pulls of every setting, default value is 3')
+    parser.add_argument('--port', type=int, default=15000,
+                        help='Port of the benchmark registry, the next port is used for its debug server')
+    parser.add_argument('--containerd', default="containerd", help='containerd binary')
+    parser.add_argument('--registry', default="registry", help='Embedded registry binary')
+    parser.add_argument('--crictl', default="crictl", help='crictl binary')
+    parser.add_argument('--outfile', help='Path to the JSON report')
+    args = parser.parse_args()
+
+    images = list_images(args.registry_store, args.images)
+    if not images:
+        print("containerd-pull-benchmark: no image matching {} in {}".format(args.images, args.registry_store))
+        sys.exit(1)
+    print("containerd-pull-benchmark: {} images, {} iterations per setting".format(len(images), args.iterations))
+
+    results = []
+    for downloads, cache, level in itertools.product(args.max_concurrent_downloads, args.blobdescriptor_cache,
+                                                     args.log_level):
+        setting = {"containerd_max_concurrent_downloads": downloads, "registry_blobdescriptor_cache": cache,
+                   "registry_log_level": level}
+        result = run_setting(setting, images, args)
+        results.append(result)
+        print("max_concurrent_downloads={:<8} blobdescriptor_cache={:<9} log_level={:<6} "
+              "sequential {:.2f}s concurrent {:.2f}s".format(downloads or "default", cache or "none", level,
+                                                             result["sequential_seconds"],
+                                                             result["concurrent_seconds"]))
+
+    best = min(results, key=lambda result: result["concurrent_seconds"])
+    print("containerd-pull-benchmark: fastest concurrent pull with {}".format(json.dumps(best["setting"])))
+    if args.outfile:
+        with open(args.outfile, "w") as fp:
+            json.dump({"images": images, "results": results}, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
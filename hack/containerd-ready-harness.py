@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: hack/containerd-ready-harness.py [--iterations N]
+#  Runs ansible/files/usr/local/bin/containerd-ready against a fake containerd
+#  socket in a temporary folder and checks the scenarios of a node boot:
+#
+#  late_socket    the socket appears after a delay and serves the CRI API
+#  plugin_loading the socket answers with gRPC errors before the CRI API is up
+#  never_ready    nothing listens on the socket, the helper has to time out
+#
+#  The latency between the fake containerd becoming ready and the helper
+#  returning is reported, the previous crictl loop polled once per second.
+################################################################################
+
+import argparse
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HELPER = os.path.join(ROOT, "ansible", "files", "usr", "local", "bin", "containerd-ready")
+PREFACE_LENGTH = 24
+
+
+def frame(frame_type, flags, stream_id, payload=b""):
+    return struct.pack(">I", len(payload))[1:] + bytes([frame_type, flags]) + struct.pack(">I", stream_id) + payload
+
+
+class FakeContainerd():
+    """
+    Serves just enough HTTP/2 for a unary gRPC call, the header blocks are not
+    HPACK encoded as the helper only looks at the frames.
+    """
+    def __init__(self, socket_path, errors_before_ready=0):
+        self.socket_path = socket_path
+        self.errors_before_ready = errors_before_ready
+        self.ready_at = None
+        self.server = None
+
+    def start(self):
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        self.server.listen(16)
+        if self.errors_before_ready == 0:
+            self.ready_at = time.monotonic()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def stop(self):
+        self.server.close()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    self.handle(conn)
+                except OSError:
+                    pass
+
+    def handle(self, conn):
+        data = b""
+        while len(data) < PREFACE_LENGTH:
+            data += conn.recv(PREFACE_LENGTH - len(data))
+        conn.sendall(frame(0x4, 0, 0))
+        while True:
+            header = conn.recv(9, socket.MSG_WAITALL)
+            if len(header) < 9:
+                return
+            length = struct.unpack(">I", b"\x00" + header[:3])[0]
+            if length:
+                conn.recv(length, socket.MSG_WAITALL)
+            # End of the request stream
+            if header[3] == 0x0 and header[4] & 0x1:
+                break
+        if self.errors_before_ready > 0:
+            self.errors_before_ready -= 1
+            if self.errors_before_ready == 0:
+                self.ready_at = time.monotonic()
+            # Trailers only response, e.g. grpc-status UNIMPLEMENTED
+            conn.sendall(frame(0x1, 0x5, 1, b"\x88"))
+            return
+        message = b"\x0a\x050.1.0"
+        conn.sendall(frame(0x1, 0x4, 1, b"\x88")
+                     + frame(0x0, 0, 1, b"\x00" + struct.pack(">I", len(message)) + message)
+                     + frame(0x1, 0x5, 1, b"\x88"))
+
+
+def run_helper(socket_path, timeout):
+    start = time.monotonic()
+    result = subprocess.run([sys.executable, HELPER, "--socket", socket_path, "--timeout", str(timeout)],
+                            capture_output=True, text=True)
+    return result.returncode, time.monotonic(), time.monotonic() - start
+
+
+def late_socket(folder, delay):
+    socket_path = os.path.join(folder, "late.sock")
+    fake = FakeContainerd(socket_path)
+    threading.Timer(delay, fake.start).start()
+    rc, end, _ = run_helper(socket_path, 15)
+    fake.stop()
+    return rc == 0, end - fake.ready_at
+
+
+def plugin_loading(folder, errors):
+    socket_path = os.path.join(folder, "loading.sock")
+    fake = FakeContainerd(socket_path, errors_before_ready=errors)
+    fake.start()
+    rc, end, _ = run_helper(socket_path, 15)
+    fake.stop()
+    return rc == 0, end - fake.ready_at
+
+
+def never_ready(folder, timeout):
+    rc, _, duration = run_helper(os.path.join(folder, "missing.sock"), timeout)
+    return rc != 0 and duration >= timeout, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test harness of containerd-ready with a fake containerd socket')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='Number of runs of every scenario, default value is 5')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        scenarios = [
+            ("late_socket", lambda i: late_socket(folder, 0.1 + 0.13 * i)),
+            ("plugin_loading", lambda i: plugin_loading(folder, 1 + i)),
+        ]
+        for name, scenario in scenarios:
+            latencies = []
+            passed = True
+            for i in range(args.iterations):
+                result, latency = scenario(i)
+                passed &= result
+                latencies.append(latency * 1000)
+                for path in os.listdir(folder):
+                    os.remove(os.path.join(folder, path))
+            failed |= not passed
+            print("{:<16} {} latency after ready: average {:.0f}ms, max {:.0f}ms".format(
+                name, "PASS" if passed else "FAIL", sum(latencies) / len(latencies), max(latencies)))
+        passed, duration = never_ready(folder, 1)
+        failed |= not passed
+        print("{:<16} {} gave up after {:.0f}ms".format("never_ready", "PASS" if passed else "FAIL", duration * 1000))
+    print("Previous crictl loop: up to 1000ms latency after ready, plus a crictl fork per attempt")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -39,6 +39,19 @@ function build_node_image() {
     AUTO_UNATTEND_ANSWER_FILE_BIND=
     [ -n "$AUTO_UNATTEND_ANSWER_FILE_PATH" ] && AUTO_UNATTEND_ANSWER_FILE_BIND="-v ${AUTO_UNATTEND_ANSWER_FILE_PATH}:/image-builder/images/capi/packer/ova/windows/${OS_TARGET}/autounattend.xml"
 
+    # packer cache shared by all the builds of the host
+    PACKER_CACHE_MOUNT=
+    if [ -n "$PACKER_CACHE_PATH" ]; then
+        mkdir -p $PACKER_CACHE_PATH
+        PACKER_CACHE_MOUNT="-v ${PACKER_CACHE_PATH}:/image-builder/packer_cache -e SHARED_PACKER_CACHE=true"
+    fi
+
+    # QEMU builds run the VM inside the image builder container
+    QEMU_BACKEND_DEVICE=
+    if [ "$BUILD_BACKEND" == "qemu" ]; then
+        QEMU_BACKEND_DEVICE="--device /dev/kvm -e BUILD_BACKEND=qemu"
+    fi
+
     # additional_jinja_args
     ADDITIONAL_PACKER_VAR_FILES_MOUNTS=
     INCONTAINER_ADDITIONAL_PACKER_VAR_ENV=
@@ -89,10 +102,18 @@ function build_node_image() {
         ${INCONTAINER_ADDITIONAL_PACKER_VAR_ENV} \
         ${INCONTAINER_OVERRIDE_REPO_ENV} \
         ${AUTO_UNATTEND_ANSWER_FILE_BIND} \
+        ${PACKER_CACHE_MOUNT} \
+        ${QEMU_BACKEND_DEVICE} \
         -w /image-builder/images/capi/ \
         -e HOST_IP=$HOST_IP -e ARTIFACTS_CONTAINER_PORT=$ARTIFACTS_CONTAINER_PORT -e OS_TARGET=$OS_TARGET -e PRIMARY_INTERNAL_REPO_URL="$PRIMARY_INTERNAL_REPO_URL" -e SECURITY_INTERNAL_REPO_URL="$SECURITY_INTERNAL_REPO_URL" -e UPDATE_INTERNAL_REPO_URL="$UPDATE_INTERNAL_REPO_URL" \
         -e TKR_SUFFIX=$TKR_SUFFIX -e KUBERNETES_VERSION=$KUBERNETES_VERSION \
         -e PACKER_HTTP_PORT=$PACKER_HTTP_PORT \
+        -e DISK_ZERO_FILL=$DISK_ZERO_FILL -e BOOT_PROFILE=$BOOT_PROFILE -e UNPACK_IMAGES=$UNPACK_IMAGES \
+        -e ANSIBLE_ACCELERATION=$ANSIBLE_ACCELERATION -e BUILD_PROFILE=$BUILD_PROFILE \
+        -e PACKAGE_CACHE_PORT=$PACKAGE_CACHE_PORT -e PACKER_CACHE_MAX_SIZE_GB=$PACKER_CACHE_MAX_SIZE_GB \
+        -e ARTIFACTS_STORE=$ARTIFACTS_STORE -e GOSS_MAX_CONCURRENT=$GOSS_MAX_CONCURRENT -e OVF_COMPACT=$OVF_COMPACT \
+        -e PERFORMANCE_PROFILE=$PERFORMANCE_PROFILE \
+        -e IMAGE_SLIM=$IMAGE_SLIM -e IMAGE_SLIM_DENYLIST="$IMAGE_SLIM_DENYLIST" -e IMAGE_SLIM_ALLOWLIST="$IMAGE_SLIM_ALLOWLIST" \
         -p $PACKER_HTTP_PORT:$PACKER_HTTP_PORT \
         --platform linux/amd64 \
         $(get_image_builder_container_image_name $KUBERNETES_VERSION)
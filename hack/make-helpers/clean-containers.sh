@@ -12,4 +12,13 @@ fi
 
 if [ "$(docker ps -a -q -f "label=$LABEL")" != '' ]; then
     docker rm -f $(docker ps -a -q -f "label=$LABEL")
-fi
\ No newline at end of file
+fi
+
+# Artifacts servers started from ARTIFACTS_SOURCE, named like the artifacts containers
+for pid_file in $(get_artifacts_server_state_dir)/*.pid; do
+    [ -f "$pid_file" ] || continue
+    server_name=$(basename $pid_file .pid)
+    if [[ "$LABEL" == "byoi" || "$LABEL" == "byoi_artifacts" || "$server_name" == "$(get_artifacts_container_name "$LABEL")" ]]; then
+        stop_artifacts_server $server_name
+    fi
+done
\ No newline at end of file
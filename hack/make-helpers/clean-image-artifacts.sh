@@ -10,6 +10,19 @@ is_argument_set "IMAGE_ARTIFACTS_PATH argument is required" $IMAGE_ARTIFACTS_PAT
 
 log_folder=$IMAGE_ARTIFACTS_PATH/logs
 ovas_folder=$IMAGE_ARTIFACTS_PATH/ovas
+store_folder=$IMAGE_ARTIFACTS_PATH/store
+tkr_metadata_cache_folder=$IMAGE_ARTIFACTS_PATH/tkr-metadata-cache
+
+# Apply the retention policy on the artifacts store instead of removing everything
+if [ -n "$KEEP_LAST" ] || [ -n "$MAX_BYTES" ]; then
+    GC_ARGS=
+    [ -n "$KEEP_LAST" ] && GC_ARGS="--keep_last $KEEP_LAST"
+    [ -n "$MAX_BYTES" ] && GC_ARGS="$GC_ARGS --max_bytes $MAX_BYTES"
+    python3 $(dirname "${BASH_SOURCE[0]}")/../../scripts/artifacts_store.py --store $store_folder gc $GC_ARGS --ovas_dir $ovas_folder
+    exit 0
+fi
 
 rm -r -f $log_folder
-rm -r -f $ovas_folder
\ No newline at end of file
+rm -r -f $ovas_folder
+rm -r -f $store_folder
+rm -r -f $tkr_metadata_cache_folder
\ No newline at end of file
@@ -16,16 +16,55 @@ if [ -z "$ARTIFACTS_CONTAINER_PORT" ]; then
     echo "Using default port for artifacts container $DEFAULT_ARTIFACTS_CONTAINER_PORT"
 fi
 
-artifacts_container_image_url=$(jq -r '.artifacts_image' $SUPPORTED_CONTEXT_JSON)
-if [ "$artifacts_container_image_url" == "null" ]; then
-    print_error 'Missing artifact server container image url'
-    exit 1
-fi
-
 container_name=$(get_artifacts_container_name "$KUBERNETES_VERSION")
 
-docker rm -f $container_name
-docker run -d --name $container_name $(get_artifacts_container_labels $KUBERNETES_VERSION) -p $ARTIFACTS_CONTAINER_PORT:80 --platform linux/amd64 $artifacts_container_image_url
+if [ -n "$ARTIFACTS_SOURCE" ]; then
+    # Serve a local mirror folder or artifacts tar bundle instead of running the artifacts container
+    stop_artifacts_server $container_name
+    state_dir=$(get_artifacts_server_state_dir)
+    mkdir -p $state_dir
+    nohup python3 $(dirname "${BASH_SOURCE[0]}")/../artifacts-server.py --source $ARTIFACTS_SOURCE \
+        --listen 0.0.0.0:$ARTIFACTS_CONTAINER_PORT > $state_dir/$container_name.log 2>&1 &
+    echo $! > $state_dir/$container_name.pid
+    echo "Started artifacts server for $ARTIFACTS_SOURCE on port $ARTIFACTS_CONTAINER_PORT, logs are written to $state_dir/$container_name.log"
+else
+    artifacts_container_image_url=$(jq -r '.artifacts_image' $SUPPORTED_CONTEXT_JSON)
+    if [ "$artifacts_container_image_url" == "null" ]; then
+        print_error 'Missing artifact server container image url'
+        exit 1
+    fi
+
+    docker rm -f $container_name
+    docker run -d --name $container_name $(get_artifacts_container_labels $KUBERNETES_VERSION) -p $ARTIFACTS_CONTAINER_PORT:80 --platform linux/amd64 $artifacts_container_image_url
+fi
+
+# The package proxy is shared by all the Kubernetes versions so an already running proxy is kept.
+if [ -n "$PACKAGE_CACHE_DIR" ]; then
+    PACKAGE_CACHE_PORT=${PACKAGE_CACHE_PORT:-$DEFAULT_PACKAGE_CACHE_PORT}
+    mkdir -p $PACKAGE_CACHE_DIR
+    package_cache_pid_file=$PACKAGE_CACHE_DIR/package-cache.pid
+    # Only the hosts of the internal and override repositories are fetched by the proxy, the running
+    # proxy reads the file again so the repositories of every build of the host are added to it.
+    allowed_hosts_file=$PACKAGE_CACHE_DIR/allowed_hosts
+    touch $allowed_hosts_file
+    repo_urls="$PRIMARY_INTERNAL_REPO_URL $SECURITY_INTERNAL_REPO_URL $UPDATE_INTERNAL_REPO_URL"
+    for repo_file in ${OVERRIDE_PACKAGE_REPOS//,/ }; do
+        repo_urls="$repo_urls $(cat $repo_file)"
+    done
+    for host in $(echo "$repo_urls" | grep -oE 'https?://[^/[:space:]"]+' | sed -E 's#https?://([^@]*@)?##') ${PACKAGE_CACHE_ALLOW_HOSTS//,/ }; do
+        grep -qxF "$host" $allowed_hosts_file || echo "$host" >> $allowed_hosts_file
+    done
+    if [ -f $package_cache_pid_file ] && kill -0 $(cat $package_cache_pid_file) 2>/dev/null; then
+        echo "Package proxy is already running with PID $(cat $package_cache_pid_file)"
+    else
+        nohup python3 $(dirname "${BASH_SOURCE[0]}")/../package-cache.py --cache_dir $PACKAGE_CACHE_DIR \
+            --listen ${HOST_IP:-0.0.0.0}:$PACKAGE_CACHE_PORT --allow_hosts_file $allowed_hosts_file \
+            $PACKAGE_CACHE_ARGS >> $PACKAGE_CACHE_DIR/package-cache.log 2>&1 &
+        echo $! > $package_cache_pid_file
+        echo "Started package proxy on port $PACKAGE_CACHE_PORT, logs are written to $PACKAGE_CACHE_DIR/package-cache.log"
+    fi
+    next_hint_msg "Add \"PACKAGE_CACHE_PORT=${PACKAGE_CACHE_PORT}\" to \"make build-node-image\" to fetch the OS packages through the package proxy"
+fi
 
 next_hint_msg "Use \"make build-node-image OS_TARGET=<os_target> KUBERNETES_VERSION=${KUBERNETES_VERSION} TKR_SUFFIX=<tkr_suffix> HOST_IP=<host_ip> IMAGE_ARTIFACTS_PATH=<image_artifacts_path> ARTIFACTS_CONTAINER_PORT=${ARTIFACTS_CONTAINER_PORT} PACKER_HTTP_PORT=${DEFAULT_PACKER_HTTP_PORT}\" to build node image"
 next_hint_msg "Change PACKER_HTTP_PORT if the ${DEFAULT_PACKER_HTTP_PORT} port is already in use or not opened"
\ No newline at end of file
@@ -0,0 +1,75 @@
+#!/bin/bash
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# Starts local build workers for build-coordinator.py. Every worker is a docker:dind
+# container with its own docker daemon, so its builder images and artifacts containers
+# are cached like on a separate build host, and a build-scheduler.py agent using it.
+# The builder image of KUBERNETES_VERSION and its artifacts container are only set up
+# on the first LOCAL_WORKERS_SEEDED workers to exercise the routing.
+
+set -e
+source $(dirname "${BASH_SOURCE[0]}")/utils.sh
+ROOT=$(cd $(dirname "${BASH_SOURCE[0]}")/../.. && pwd)
+
+enable_debugging
+
+LOCAL_WORKERS=${LOCAL_WORKERS:-2}
+LOCAL_WORKERS_SEEDED=${LOCAL_WORKERS_SEEDED:-1}
+LOCAL_WORKERS_DIR=${LOCAL_WORKERS_DIR:-${HOME}/.byoi-local-workers}
+LOCAL_WORKERS_AGENT_PORT=${LOCAL_WORKERS_AGENT_PORT:-8190}
+ARTIFACTS_CONTAINER_PORT=${ARTIFACTS_CONTAINER_PORT:-$DEFAULT_ARTIFACTS_CONTAINER_PORT}
+
+function stop_workers() {
+    for pid_file in ${LOCAL_WORKERS_DIR}/*/agent.pid; do
+        [ -f "$pid_file" ] || continue
+        kill $(cat $pid_file) 2>/dev/null || true
+        rm -f $pid_file
+    done
+    if [ "$(docker ps -a -q -f "label=byoi_worker")" != '' ]; then
+        docker rm -f $(docker ps -a -q -f "label=byoi_worker")
+    fi
+}
+
+if [ "$1" == "stop" ]; then
+    stop_workers
+    exit 0
+fi
+
+stop_workers
+build_workers=
+for i in $(seq 1 $LOCAL_WORKERS); do
+    name=byoi-worker-$i
+    worker_dir=${LOCAL_WORKERS_DIR}/worker-$i
+    mkdir -p $worker_dir/artifacts $worker_dir/state
+    rm -f $worker_dir/docker.sock
+
+    # The repository and the worker folder are mounted at the same path so the bind
+    # mounts of the builder containers resolve inside the worker
+    docker run -d --privileged --name $name -l byoi -l byoi_worker \
+        -v $ROOT:$ROOT -v $worker_dir:$worker_dir \
+        docker:dind --host=unix://$worker_dir/docker.sock
+    export DOCKER_HOST=unix://$worker_dir/docker.sock
+    until docker info > /dev/null 2>&1; do sleep 1; done
+    worker_ip=$(DOCKER_HOST= docker inspect -f '{{range .NetworkSettings.Networks}}{{.IPAddress}}{{end}}' $name)
+
+    if [ -n "$KUBERNETES_VERSION" ] && [ $i -le $LOCAL_WORKERS_SEEDED ]; then
+        image_name=$(get_image_builder_container_image_name $KUBERNETES_VERSION)
+        echo "Loading $image_name into $name"
+        DOCKER_HOST= docker save $image_name | docker load
+        make -C $ROOT run-artifacts-container KUBERNETES_VERSION=$KUBERNETES_VERSION \
+            ARTIFACTS_CONTAINER_PORT=$ARTIFACTS_CONTAINER_PORT
+    fi
+
+    agent_port=$((LOCAL_WORKERS_AGENT_PORT + i))
+    nohup python3 $ROOT/hack/build-scheduler.py --host_ip $worker_ip \
+        --image_artifacts_path $worker_dir/artifacts --state_dir $worker_dir/state \
+        --listen 127.0.0.1:$agent_port > $worker_dir/agent.log 2>&1 &
+    echo $! > $worker_dir/agent.pid
+    unset DOCKER_HOST
+    echo "Started $name with agent on port $agent_port, logs are written to $worker_dir/agent.log"
+    build_workers="$build_workers $name=http://127.0.0.1:$agent_port"
+done
+
+next_hint_msg "Run the coordinator with 'make run-build-coordinator IMAGE_ARTIFACTS_PATH=<folder> BUILD_WORKERS=\"${build_workers# }\"'"
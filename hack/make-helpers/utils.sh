@@ -40,6 +40,19 @@ function get_artifacts_container_labels() {
     echo "-l byoi -l byoi_artifacts -l $kubernetes_version"
 }
 
+# Folder holding the PID and log files of the artifacts servers started from ARTIFACTS_SOURCE
+function get_artifacts_server_state_dir() {
+    echo "${HOME}/.byoi-artifacts-server"
+}
+
+function stop_artifacts_server() {
+    pid_file="$(get_artifacts_server_state_dir)/${1}.pid"
+    if [ -f "$pid_file" ]; then
+        kill $(cat $pid_file) 2>/dev/null || true
+        rm -f $pid_file
+    fi
+}
+
 function get_node_image_builder_container_name() {
     kubernetes_version=$1
     os_target=$2
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: package-cache.py [FLAGS]
+#  Caching proxy for the apt and tdnf package repositories used during node
+#  image builds. Repository URLs are rewritten to
+#    http://<host_ip>:<port>/<scheme>/<host>/<path>
+#  and the proxy fetches https://<host>/<path> once, then serves it from the
+#  cache folder to every following build.
+#
+#  Packages (.deb/.rpm) and apt by-hash files never change, they are stored by
+#  the SHA256 of their content and kept until evicted. Repository metadata
+#  (Release, Packages, repomd.xml, ...) is revalidated once it is older than
+#  --metadata_ttl and the cached copy is served when the upstream fails.
+#  The least recently used files are evicted above --max_size_gb.
+#
+#  --mirror_dir serves <mirror_dir>/<host>/<path> before the cache and
+#  --offline never contacts the upstream, which allows using a pre-seeded
+#  local mirror without network access.
+#
+#  Only the hosts of --allow_host and --allow_hosts_file are fetched, the
+#  proxy never reaches other hosts of the network on behalf of a client.
+#
+#  GET /_stats returns the hit, miss and size counters.
+################################################################################
+
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_FLUSH_INTERVAL = 30
+
+package_regex = re.compile(r'\.(deb|udeb|ddeb|rpm)$')
+by_hash_regex = re.compile(r'/by-hash/SHA256/([0-9a-f]{64})$')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Caching proxy for the OS package repositories used by the node image builds")
+    parser.add_argument('--cache_dir', required=True,
+                        help='Folder where the cached packages and repository metadata are stored')
+    parser.add_argument('--listen', default='0.0.0.0:8093',
+                        help='Address of the proxy, default value is 0.0.0.0:8093')
+    parser.add_argument('--max_size_gb', type=float, default=20,
+                        help='Maximum size of the cache, default value is 20')
+    parser.add_argument('--metadata_ttl', type=int, default=300,
+                        help='Seconds after which repository metadata is revalidated, default value is 300')
+    parser.add_argument('--mirror_dir', default=None,
+                        help='Local mirror served before the cache, laid out as <mirror_dir>/<host>/<path>')
+    parser.add_argument('--offline', action='store_true',
+                        help='Never contact the upstream repositories')
+    parser.add_argument('--allow_host', action='append', default=[],
+                        help='Upstream repository host, as host or host:port, fetched by the proxy. Can be repeated')
+    parser.add_argument('--allow_hosts_file', default=None,
+                        help='File with an upstream repository host per line, read again when it changes')
+    parser.add_argument('--timeout', type=int, default=60,
+                        help='Upstream request timeout in seconds')
+    return parser.parse_args()
+
+
+def is_immutable(path):
+    return bool(package_regex.search(path) or by_hash_regex.search(path))
+
+
+class PackageCache():
+    def __init__(self, args):
+        self.args = args
+        self.max_size = int(args.max_size_gb * 1024 ** 3)
+        self.blobs_dir = os.path.join(args.cache_dir, "blobs")
+        self.tmp_dir = os.path.join(args.cache_dir, "tmp")
+        self.index_file = os.path.join(args.cache_dir, "index.json")
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        # url -> {"sha256", "size", "fetched", "atime", "content_type", "last_modified"}
+        self.index = {}
+        self.stats = {"hits": 0, "misses": 0, "revalidations": 0, "stale": 0, "mirror": 0,
+                      "errors": 0, "evictions": 0, "bytes_served": 0, "bytes_fetched": 0}
+        self.last_flush = 0
+        self.allowed_hosts = set()
+        self.allowed_hosts_mtime = None
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r') as fp:
+                self.index = json.load(fp)
+        # Drop entries whose blob is gone
+        self.index = {url: entry for url, entry in self.index.items()
+                      if os.path.exists(self.blob_path(entry["sha256"]))}
+
+    def is_allowed(self, host):
+        """
+        Checks host against the allowed upstream hosts, the hosts file is read
+        again when it changed so repositories can be added while running.
+        """
+        with self.lock:
+            if self.args.allow_hosts_file:
+                try:
+                    mtime = os.path.getmtime(self.args.allow_hosts_file)
+                except OSError:
+                    mtime = None
+                if mtime != self.allowed_hosts_mtime:
+                    self.allowed_hosts = set()
+                    if mtime is not None:
+                        with open(self.args.allow_hosts_file, 'r') as fp:
+                            self.allowed_hosts = {line.strip().lower() for line in fp if line.strip()}
+                    self.allowed_hosts_mtime = mtime
+            # Credentials of the repository URL are not part of the host
+            host = host.rsplit('@', 1)[-1].lower()
+            return host in self.allowed_hosts or host in self.args.allow_host
+
+    def save(self):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w') as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_file, self.index_file)
+        self.last_flush = time.time()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blobs_dir, sha256[:2], sha256)
+
+    def size(self):
+        return sum({entry["sha256"]: entry["size"] for entry in self.index.values()}.values())
+
+    def url_lock(self, url):
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def lookup(self, url):
+        """
+        Return the cache entry of the url if it can be served without contacting the upstream.
+        """
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            if not self.args.offline and not is_immutable(url) and \
+                    time.time() - entry["fetched"] > self.args.metadata_ttl:
+                return None
+            entry["atime"] = time.time()
+            if time.time() - self.last_flush > INDEX_FLUSH_INTERVAL:
+                self.save()
+            return dict(entry)
+
+    def stale(self, url):
+        with self.lock:
+            entry = self.index.get(url)
+            return dict(entry) if entry else None
+
+    def store(self, url, tmp_file, sha256, size, content_type, last_modified):
+        with self.lock:
+            blob = self.blob_path(sha256)
+            if os.path.exists(blob):
+                os.remove(tmp_file)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(tmp_file, blob)
+            previous = self.index.get(url)
+            now = time.time()
+            self.index[url] = {"sha256": sha256, "size": size, "fetched": now, "atime": now,
+                               "content_type": content_type, "last_modified": last_modified}
+            if previous and previous["sha256"] != sha256:
+                self.remove_unused_blob(previous["sha256"])
+            self.evict(keep=url)
+            self.save()
+
+    def remove_unused_blob(self, sha256):
+        if any(entry["sha256"] == sha256 for entry in self.index.values()):
+            return False
+        os.remove(self.blob_path(sha256))
+        return True
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits in max_size.
+        """
+        total = self.size()
+        for url, entry in sorted(self.index.items(), key=lambda item: item[1]["atime"]):
+            if total <= self.max_size:
+                break
+            if url == keep:
+                continue
+            del self.index[url]
+            self.stats["evictions"] += 1
+            if self.remove_unused_blob(entry["sha256"]):
+                total -= entry["size"]
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.index), size_bytes=self.size(), max_size_bytes=self.max_size)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    cache = None
+
+    def send_json(self, code, data):
+        body = json.dumps(data, indent=4).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_headers(self, size, content_type, last_modified=None, cache_status=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type or "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        if cache_status:
+            self.send_header("X-Cache", cache_status)
+        self.end_headers()
+
+    def send_file(self, path, content_type, last_modified=None, cache_status=None):
+        size = os.path.getsize(path)
+        self.send_headers(size, content_type, last_modified, cache_status)
+        if self.command == "HEAD":
+            return
+        with open(path, 'rb') as fp:
+            shutil.copyfileobj(fp, self.wfile, CHUNK_SIZE)
+        self.cache.count("bytes_served", size)
+
+    def upstream_url(self):
+        """
+        Map /<scheme>/<host>/<path> to <scheme>://<host>/<path>.
+        """
+        parts = self.path.split('?', 1)[0].lstrip('/').split('/', 2)
+        if len(parts) < 3 or parts[0] not in ("http", "https") or not parts[1] or \
+                any(segment in ('.', '..') for segment in '/'.join(parts[1:]).split('/')):
+            return None, None, None
+        return "{}://{}/{}".format(*parts), parts[1], parts[2]
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            self.send_json(200, self.cache.status())
+            return
+        url, host, path = self.upstream_url()
+        if url is None:
+            self.send_json(404, {"error": "Expected /<http|https>/<host>/<path>"})
+            return
+
+        if self.cache.args.mirror_dir:
+            mirror_dir = os.path.realpath(self.cache.args.mirror_dir)
+            mirror_file = os.path.realpath(os.path.join(mirror_dir, host, path))
+            # The proxy listens on all the interfaces, never serve files outside the mirror
+            if os.path.commonpath([mirror_dir, mirror_file]) == mirror_dir and os.path.isfile(mirror_file):
+                self.cache.count("mirror")
+                self.send_file(mirror_file, mimetypes.guess_type(mirror_file)[0], cache_status="MIRROR")
+                return
+
+        if not self.cache.is_allowed(host):
+            self.send_json(403, {"error": "{} is not an allowed repository host".format(host)})
+            return
+
+        entry = self.cache.lookup(url)
+        if entry is None:
+            # Only one request fetches a url, the others wait and are served from the cache
+            with self.cache.url_lock(url):
+                entry = self.cache.lookup(url)
+                if entry is None:
+                    if self.cache.args.offline:
+                        self.serve_stale(url, 404, "Not cached and running offline")
+                    else:
+                        self.fetch(url)
+                    return
+        self.cache.count("hits")
+        self.send_file(self.cache.blob_path(entry["sha256"]), entry["content_type"],
+                       entry["last_modified"], "HIT")
+
+    def serve_stale(self, url, code, error):
+        entry = self.cache.stale(url)
+        if entry is None:
+            self.send_json(code, {"error": error, "url": url})
+            return
+        self.cache.count("stale")
+        self.send_file(self.cache.blob_path(entry["sha256"]), entry["content_type"],
+                       entry["last_modified"], "STALE")
+
+    def fetch(self, url):
+        """
+        Stream the upstream response to the client and the cache at the same time.
+        """
+        revalidation = self.cache.stale(url) is not None
+        try:
+            response = urllib.request.urlopen(url, timeout=self.cache.args.timeout)
+        except urllib.error.HTTPError as e:
+            self.cache.count("errors")
+            self.serve_stale(url, e.code, str(e))
+            return
+        except (urllib.error.URLError, OSError) as e:
+            self.cache.count("errors")
+            self.serve_stale(url, 502, str(e))
+            return
+
+        self.cache.count("revalidations" if revalidation else "misses")
+        with response:
+            content_type = response.headers.get("Content-Type")
+            last_modified = response.headers.get("Last-Modified")
+            length = response.headers.get("Content-Length")
+            client_connected = length is not None
+            if client_connected:
+                self.send_headers(length, content_type, last_modified, "MISS")
+                client_connected = self.command != "HEAD"
+
+            sha256 = hashlib.sha256()
+            size = 0
+            fd, tmp_file = tempfile.mkstemp(dir=self.cache.tmp_dir)
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    while True:
+                        data = response.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        fp.write(data)
+                        sha256.update(data)
+                        size += len(data)
+                        if client_connected:
+                            try:
+                                self.wfile.write(data)
+                            except OSError:
+                                # Keep filling the cache when the client goes away
+                                client_connected = False
+            except (urllib.error.URLError, OSError) as e:
+                os.remove(tmp_file)
+                self.cache.count("errors")
+                print("package-cache: failed to fetch %s: %s" % (url, e))
+                self.close_connection = True
+                return
+
+        digest = sha256.hexdigest()
+        match = by_hash_regex.search(url)
+        if match and match.group(1) != digest:
+            os.remove(tmp_file)
+            self.cache.count("errors")
+            print("package-cache: checksum mismatch for %s, got %s" % (url, digest))
+            self.close_connection = True
+            return
+        self.cache.count("bytes_fetched", size)
+        self.cache.store(url, tmp_file, digest, size, content_type, last_modified)
+        if length is None:
+            # Upstream did not send the length, serve the complete file from the cache
+            self.send_file(self.cache.blob_path(digest), content_type, last_modified, "MISS")
+        elif client_connected:
+            self.cache.count("bytes_served", size)
+
+
+def main():
+    args = parse_args()
+    args.cache_dir = os.path.abspath(args.cache_dir)
+    args.allow_host = [host.lower() for host in args.allow_host]
+    RequestHandler.cache = PackageCache(args)
+    host, port = args.listen.rsplit(':', 1)
+    server = ThreadingHTTPServer((host, int(port)), RequestHandler)
+    server.daemon_threads = True
+    print("package-cache: serving %s on http://%s%s" % (args.cache_dir, args.listen,
+                                                        " (offline)" if args.offline else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with RequestHandler.cache.lock:
+            RequestHandler.cache.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/bin/bash
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# Measures the time between the kubelet starting and the control plane static
+# pods running on a node cloned from the node image. Run it on a control plane
+# node as soon as it boots, once with an image built with UNPACK_IMAGES=true and
+# once with an image built without it, and compare the results.
+#
+# Usage: hack/static-pods-startup.sh [timeout_seconds]
+
+set -euo pipefail
+
+TIMEOUT=${1:-900}
+PODS="etcd kube-apiserver kube-controller-manager kube-scheduler"
+
+command -v crictl >/dev/null || { echo "crictl is required"; exit 1; }
+
+uptime_ms() {
+    awk '{ printf "%d", $1 * 1000 }' /proc/uptime
+}
+
+echo "Snapshots in the k8s.io namespace: $(ctr -n k8s.io snapshots ls 2>/dev/null | tail -n +2 | wc -l)"
+
+deadline=$(( $(uptime_ms) + TIMEOUT * 1000 ))
+kubelet_start=0
+until [[ ${kubelet_start} -gt 0 ]]; do
+    [[ $(uptime_ms) -gt ${deadline} ]] && { echo "kubelet did not start"; exit 1; }
+    kubelet_start=$(( $(systemctl show kubelet -p ActiveEnterTimestampMonotonic --value) / 1000 ))
+    sleep 0.1
+done
+
+declare -A running
+while [[ ${#running[@]} -lt $(wc -w <<< "${PODS}") ]]; do
+    [[ $(uptime_ms) -gt ${deadline} ]] && { echo "Static pods did not start in ${TIMEOUT}s"; exit 1; }
+    for pod in ${PODS}; do
+        if [[ -z "${running[${pod}]:-}" && -n "$(crictl ps --name "^${pod}$" --state Running -q 2>/dev/null)" ]]; then
+            running[${pod}]=$(( $(uptime_ms) - kubelet_start ))
+        fi
+    done
+    sleep 0.1
+done
+
+last=0
+for pod in ${PODS}; do
+    echo "${pod} running $(( running[${pod}] ))ms after kubelet start"
+    [[ ${running[${pod}]} -gt ${last} ]] && last=${running[${pod}]}
+done
+echo "All static pods running ${last}ms after kubelet start"
@@ -15,9 +15,15 @@ import io
 import json
 import os
 import subprocess
+import sys
 from string import Template
 import tarfile
 
+# build-ova.sh copies build_profiler.py next to this script in the builder
+# container, it is in scripts/ when run from the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import build_profiler  # noqa: E402
+
 def main():
     parser = argparse.ArgumentParser(
         description="Builds an OVA using the artifacts from a Packer build")
@@ -184,7 +190,7 @@ def main():
 
 def sha256(path):
     m = hashlib.sha256()
-    with open(path, 'rb') as f:
+    with open(path, 'rb') as f, build_profiler.span("sha256 %s" % path):
         while True:
             data = f.read(65536)
             if not data:
@@ -199,12 +205,13 @@ def create_ova(ova_path, ovf_path, ovftool_args=None, ova_files=None):
 
         print("image-build-ova: creating OVA from %s using ovftool" %
               ovf_path)
-        subprocess.run(cmd.split(), check=True)
+        with build_profiler.span("ovftool %s" % ova_path):
+            subprocess.run(cmd.split(), check=True)
     else:
         infile_paths = [ovf_path]
         infile_paths.extend(ova_files)
         print("image-build-ova: creating OVA using tar")
-        with open(ova_path, 'wb') as f:
+        with open(ova_path, 'wb') as f, build_profiler.span("tar %s" % ova_path):
             with tarfile.open(fileobj=f, mode='w|') as tar:
                 for infile_path in infile_paths:
                     tar.add(infile_path)
@@ -250,10 +257,11 @@ def stream_optimize_vmdk_files(inlist):
         ]
         print("image-build-ova: stream optimize %s --> %s (1-2 minutes)" %
               (infile, outfile))
-        subprocess.check_call(args)
+        with build_profiler.span("stream optimize %s" % infile):
+            subprocess.check_call(args)
         f['stream_name'] = outfile
         f['stream_size'] = os.path.getsize(outfile)
 
 
 if __name__ == "__main__":
-    main()
+    build_profiler.run(main, "image-build-ova")
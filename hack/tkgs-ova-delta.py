@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: tkgs-ova-delta.py {create,apply} [FLAGS]
+#  This program creates a compact delta between two OVAs generated by
+#  tkgs-image-build-ova.py and rebuilds the newer OVA from the older one.
+#
+#  The OVA is split into chunks. The grains of the stream-optimized VMDK are
+#  used as chunk boundaries, every other part of the OVA (tar headers, OVF,
+#  manifest) is split into fixed size chunks. The delta only carries the chunks
+#  that are not present in the base OVA together with the recipe that lists
+#  the chunks of the new OVA in order.
+################################################################################
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import struct
+import tarfile
+import tempfile
+
+SECTOR_SIZE = 512
+RAW_CHUNK_SIZE = 65536
+VMDK_MAGIC = b'KDMV'
+# Header layout of a sparse extent, see the VMware Virtual Disk Format 5.0
+# specification. Only the fields required to locate the grain stream are used.
+VMDK_HEADER_FORMAT = '<4sIIQQQQIQQQ'
+VMDK_MARKER_FORMAT = '<QII'
+# Grain markers only carry the LBA and the compressed size
+VMDK_GRAIN_MARKER_SIZE = 12
+VMDK_MARKER_EOS = 0
+
+DELTA_RECIPE_NAME = 'recipe.json'
+DELTA_CHUNKS_NAME = 'chunks.bin'
+DELTA_FORMAT_VERSION = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Creates or applies a block level delta between two OVAs")
+    sub_parsers = parser.add_subparsers(dest='subparser_name')
+
+    create_group = sub_parsers.add_parser('create')
+    create_group.add_argument('--base', required=True,
+                              help='Previously distributed OVA')
+    create_group.add_argument('--target', required=True,
+                              help='Newly built OVA')
+    create_group.add_argument('--output', required=True,
+                              help='Path of the delta file to create')
+
+    apply_group = sub_parsers.add_parser('apply')
+    apply_group.add_argument('--base', required=True,
+                             help='Previously distributed OVA the delta was created against')
+    apply_group.add_argument('--delta', required=True,
+                             help='Delta file generated by the create command')
+    apply_group.add_argument('--output', required=True,
+                             help='Path of the OVA to rebuild')
+    args = parser.parse_args()
+
+    if args.subparser_name == 'create':
+        create_delta(args.base, args.target, args.output)
+    elif args.subparser_name == 'apply':
+        apply_delta(args.base, args.delta, args.output)
+    else:
+        parser.print_help()
+        exit(1)
+
+
+def sha256(path):
+    m = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(65536)
+            if not data:
+                break
+            m.update(data)
+    return m.hexdigest()
+
+
+def get_chunk_boundaries(ova_path):
+    """
+    Returns a sorted list of (offset, length) tuples covering the whole OVA.
+    """
+    vmdk_regions = []
+    with tarfile.open(ova_path, mode='r:') as tar:
+        for member in tar.getmembers():
+            if member.isfile() and member.name.endswith('.vmdk'):
+                vmdk_regions.append((member.offset_data, member.size))
+
+    ova_size = os.path.getsize(ova_path)
+    chunks = []
+    position = 0
+    with open(ova_path, 'rb') as f:
+        for offset, size in vmdk_regions:
+            chunks.extend(get_raw_chunks(position, offset))
+            chunks.extend(get_vmdk_chunks(f, offset, size))
+            position = offset + size
+    chunks.extend(get_raw_chunks(position, ova_size))
+    return chunks
+
+
+def get_raw_chunks(start, end):
+    chunks = []
+    while start < end:
+        length = min(RAW_CHUNK_SIZE, end - start)
+        chunks.append((start, length))
+        start += length
+    return chunks
+
+
+def get_vmdk_chunks(f, offset, size):
+    """
+    Splits a stream-optimized VMDK in one chunk per grain or metadata marker.
+    Falls back to fixed size chunks when the file is not a stream-optimized
+    sparse extent.
+    """
+    f.seek(offset)
+    header = f.read(struct.calcsize(VMDK_HEADER_FORMAT))
+    if len(header) < struct.calcsize(VMDK_HEADER_FORMAT) or header[:4] != VMDK_MAGIC:
+        print("tkgs-ova-delta: VMDK at offset %d is not a sparse extent, using fixed size chunks" % offset)
+        return get_raw_chunks(offset, offset + size)
+    overhead = struct.unpack(VMDK_HEADER_FORMAT, header)[10]
+
+    end = offset + size
+    chunks = [(offset, min(overhead * SECTOR_SIZE, size))]
+    position = chunks[0][0] + chunks[0][1]
+    marker_size = struct.calcsize(VMDK_MARKER_FORMAT)
+    while position + marker_size <= end:
+        f.seek(position)
+        value, data_size, marker_type = struct.unpack(VMDK_MARKER_FORMAT, f.read(marker_size))
+        if data_size > 0:
+            # Grain marker, compressed data follows the 12 byte marker.
+            length = VMDK_GRAIN_MARKER_SIZE + data_size
+        elif marker_type == VMDK_MARKER_EOS:
+            break
+        else:
+            # Metadata marker sector followed by <value> sectors of metadata.
+            length = SECTOR_SIZE + value * SECTOR_SIZE
+        length = -(-length // SECTOR_SIZE) * SECTOR_SIZE
+        length = min(length, end - position)
+        chunks.append((position, length))
+        position += length
+    chunks.extend(get_raw_chunks(position, end))
+    return chunks
+
+
+def fingerprint_chunks(ova_path):
+    """
+    Returns the list of (sha256, offset, length) for every chunk of the OVA.
+    """
+    fingerprints = []
+    with open(ova_path, 'rb') as f:
+        for offset, length in get_chunk_boundaries(ova_path):
+            f.seek(offset)
+            fingerprints.append((hashlib.sha256(f.read(length)).hexdigest(), offset, length))
+    return fingerprints
+
+
+def create_delta(base_path, target_path, output_path):
+    print("tkgs-ova-delta: fingerprinting base OVA %s" % base_path)
+    base_chunks = set(digest for digest, _, _ in fingerprint_chunks(base_path))
+    print("tkgs-ova-delta: fingerprinting target OVA %s" % target_path)
+    target_chunks = fingerprint_chunks(target_path)
+
+    recipe = {
+        'version': DELTA_FORMAT_VERSION,
+        'base_sha256': sha256(base_path),
+        'target_name': os.path.basename(target_path),
+        'target_sha256': sha256(target_path),
+        'target_size': os.path.getsize(target_path),
+        'chunks': [],
+        'new_chunks': [],
+    }
+    new_chunks = {}
+    reused_bytes = 0
+    # New chunks are spooled to disk since they can add up to several GB.
+    with tempfile.TemporaryFile() as chunk_data, open(target_path, 'rb') as f:
+        for digest, offset, length in target_chunks:
+            recipe['chunks'].append([digest, length])
+            if digest in base_chunks:
+                reused_bytes += length
+                continue
+            if digest in new_chunks:
+                continue
+            f.seek(offset)
+            new_chunks[digest] = (chunk_data.tell(), length)
+            recipe['new_chunks'].append([digest, chunk_data.tell(), length])
+            chunk_data.write(f.read(length))
+
+        recipe_data = json.dumps(recipe).encode('utf-8')
+        chunk_data_size = chunk_data.tell()
+        chunk_data.seek(0)
+        with tarfile.open(output_path, mode='w') as tar:
+            write_tar_member(tar, DELTA_RECIPE_NAME, io.BytesIO(recipe_data), len(recipe_data))
+            write_tar_member(tar, DELTA_CHUNKS_NAME, chunk_data, chunk_data_size)
+
+    print("tkgs-ova-delta: %d of %d chunks reused, %d bytes reused, %d new bytes" %
+          (len(target_chunks) - len(recipe['new_chunks']), len(target_chunks),
+           reused_bytes, sum(length for _, _, length in recipe['new_chunks'])))
+    print("tkgs-ova-delta: created delta %s (%d bytes)" % (output_path, os.path.getsize(output_path)))
+
+
+def write_tar_member(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    tar.addfile(info, fileobj)
+
+
+def apply_delta(base_path, delta_path, output_path):
+    with tarfile.open(delta_path, mode='r:') as tar:
+        recipe = json.load(tar.extractfile(DELTA_RECIPE_NAME))
+        chunks_member = tar.getmember(DELTA_CHUNKS_NAME)
+        chunks_offset = chunks_member.offset_data
+
+    if recipe['version'] != DELTA_FORMAT_VERSION:
+        raise Exception("Unsupported delta format version {}".format(recipe['version']))
+    if sha256(base_path) != recipe['base_sha256']:
+        raise Exception("Base OVA {} does not match the OVA the delta was created against".format(base_path))
+
+    print("tkgs-ova-delta: fingerprinting base OVA %s" % base_path)
+    base_chunks = {}
+    for digest, offset, length in fingerprint_chunks(base_path):
+        base_chunks.setdefault(digest, offset)
+    new_chunks = {digest: offset for digest, offset, _ in recipe['new_chunks']}
+
+    print("tkgs-ova-delta: rebuilding %s" % output_path)
+    with open(base_path, 'rb') as base, open(delta_path, 'rb') as delta, open(output_path, 'wb') as out:
+        for digest, length in recipe['chunks']:
+            if digest in new_chunks:
+                delta.seek(chunks_offset + new_chunks[digest])
+                data = delta.read(length)
+            else:
+                base.seek(base_chunks[digest])
+                data = base.read(length)
+            out.write(data)
+
+    checksum = sha256(output_path)
+    if checksum != recipe['target_sha256']:
+        os.remove(output_path)
+        raise Exception("Rebuilt OVA checksum {} does not match the recorded checksum {}".format(
+            checksum, recipe['target_sha256']))
+
+    chksum_path = "%s.sha256" % output_path
+    print("tkgs-ova-delta: create ova checksum %s" % chksum_path)
+    with open(chksum_path, 'w') as f:
+        f.write(checksum)
+
+
+if __name__ == "__main__":
+    main()
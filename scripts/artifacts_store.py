@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: artifacts_store.py --store DIR {add,list,show,gc} [FLAGS]
+#  Content addressed store for the node image build outputs.
+#
+#  DIR/objects/<sha256[:2]>/<sha256>   file contents, read-only
+#  DIR/builds/<build_id>/<file>        hardlinks to the objects of a build
+#  DIR/index.json                      builds with their metadata and files
+#
+#  Identical files of different builds (and the copies in the ovas folder)
+#  share the same inode, gc removes builds according to the retention policy
+#  and the objects that are no longer linked from any build.
+################################################################################
+
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+import uuid
+
+import file_index
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to manage the content addressed store of node image builds')
+    parser.add_argument('--store', required=True,
+                        help='Store folder, for example <IMAGE_ARTIFACTS_PATH>/store')
+    sub_parsers = parser.add_subparsers(dest='subparser_name')
+
+    add_group = sub_parsers.add_parser("add")
+    add_group.add_argument('--build_id', required=True,
+                           help='Unique identifier of the build')
+    add_group.add_argument('--metadata', required=False, default="{}",
+                           help='JSON object stored with the build, e.g. the OS type and Kubernetes version')
+    add_group.add_argument('files', nargs='+',
+                           help='Files of the build, they are replaced by hardlinks to the store objects')
+
+    list_group = sub_parsers.add_parser("list")
+    list_group.add_argument('--filter', action='append', default=[],
+                            help='Only list builds whose metadata matches KEY=VALUE, can be repeated')
+
+    show_group = sub_parsers.add_parser("show")
+    show_group.add_argument('build_id')
+
+    gc_group = sub_parsers.add_parser("gc")
+    gc_group.add_argument('--keep_last', type=int, default=None,
+                          help='Number of most recent builds kept per group')
+    gc_group.add_argument('--group_by', default="os_type,kubernetes_version",
+                          help='Comma separated metadata keys grouping the builds for --keep_last')
+    gc_group.add_argument('--max_bytes', type=int, default=None,
+                          help='Remove the oldest builds until the store uses at most this many bytes')
+    gc_group.add_argument('--ovas_dir', default=None,
+                          help='Folder with hardlinked copies of the build files, e.g. the ovas folder, copies '
+                               'of removed builds are removed as well')
+    gc_group.add_argument('--dry_run', action='store_true',
+                          help='Only print the builds that would be removed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.subparser_name == "add":
+        build = add_build(args.store, args.build_id, args.files, json.loads(args.metadata))
+        print(json.dumps(build, indent=4))
+    elif args.subparser_name == "list":
+        filters = dict(item.split('=', 1) for item in args.filter)
+        print(json.dumps(list_builds(args.store, filters), indent=4))
+    elif args.subparser_name == "show":
+        build = load_index(args.store)["builds"].get(args.build_id)
+        if build is None:
+            print("Build {} not found".format(args.build_id))
+            sys.exit(1)
+        print(json.dumps(build, indent=4))
+    elif args.subparser_name == "gc":
+        removed = gc(args.store, args.keep_last, args.group_by.split(','), args.max_bytes, args.ovas_dir,
+                     args.dry_run)
+        print(json.dumps(removed, indent=4))
+    else:
+        print("Missing command, use --help for details")
+        sys.exit(2)
+
+
+class StoreLock(file_index.FileLock):
+    def __init__(self, store):
+        os.makedirs(store, exist_ok=True)
+        super().__init__(os.path.join(store, LOCK_FILE))
+
+
+def load_index(store):
+    return file_index.load_json(os.path.join(store, INDEX_FILE), {"builds": {}})
+
+
+def save_index(store, index):
+    file_index.save_json(os.path.join(store, INDEX_FILE), index)
+
+
+def object_path(store, digest):
+    return os.path.join(store, "objects", digest[:2], digest)
+
+
+def link(src, dst):
+    """
+    Atomically replace dst with a hardlink to src.
+    """
+    # Builder containers have their own pid namespace, the pid is not unique between concurrent builds
+    tmp = "{}.{}.tmp".format(dst, uuid.uuid4().hex)
+    os.link(src, tmp)
+    os.replace(tmp, dst)
+
+
+def add_object(store, path, digest):
+    """
+    Move the content of path into the store and replace path with a hardlink to the object.
+    """
+    obj = object_path(store, digest)
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    if os.path.exists(obj):
+        if not os.path.samefile(obj, path):
+            try:
+                link(obj, path)
+            except OSError:
+                # Different file system than the store, path is left as is
+                pass
+    else:
+        try:
+            os.link(path, obj)
+        except OSError:
+            # Different file system than the store, keep a copy
+            shutil.copyfile(path, obj + ".tmp")
+            os.replace(obj + ".tmp", obj)
+        os.chmod(obj, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return os.path.getsize(obj)
+
+
+def add_build(store, build_id, files, metadata):
+    """
+    Add the files of a build to the store, returns the index entry of the build.
+    files is a list of paths or a dict of the file names in the build to their paths.
+    """
+    if not isinstance(files, dict):
+        files = {os.path.basename(path): path for path in files}
+    # Hash outside of the lock, OVAs are several GB
+    digests = {name: (path, file_index.sha256(path)) for name, path in files.items()}
+    with StoreLock(store):
+        index = load_index(store)
+        build_dir = os.path.join(store, "builds", build_id)
+        os.makedirs(build_dir, exist_ok=True)
+        build_files = {}
+        for name, (path, digest) in digests.items():
+            build_files[name] = {"sha256": digest, "size": add_object(store, path, digest)}
+            link(object_path(store, digest), os.path.join(build_dir, name))
+        build = {
+            "build_id": build_id,
+            "created": time.time(),
+            "metadata": metadata,
+            "files": build_files,
+        }
+        index["builds"][build_id] = build
+        save_index(store, index)
+    return build
+
+
+def list_builds(store, filters):
+    builds = sorted(load_index(store)["builds"].values(), key=lambda build: build["created"])
+    return [build for build in builds
+            if all(str(build["metadata"].get(key)) == value for key, value in filters.items())]
+
+
+def store_size(builds):
+    objects = {}
+    for build in builds:
+        for entry in build["files"].values():
+            objects[entry["sha256"]] = entry["size"]
+    return sum(objects.values())
+
+
+def select_builds(builds, keep_last, group_by, max_bytes):
+    """
+    Return the ids of the builds removed by the retention policy, builds are sorted oldest first.
+    """
+    removed = []
+    if keep_last is not None:
+        groups = {}
+        for build in builds:
+            key = tuple(build["metadata"].get(name) for name in group_by)
+            groups.setdefault(key, []).append(build)
+        for group in groups.values():
+            removed += [build["build_id"] for build in group[:max(len(group) - keep_last, 0)]]
+    if max_bytes is not None:
+        remaining = [build for build in builds if build["build_id"] not in removed]
+        while remaining and store_size(remaining) > max_bytes:
+            removed.append(remaining.pop(0)["build_id"])
+    return removed
+
+
+def gc(store, keep_last, group_by, max_bytes, ovas_dir, dry_run):
+    with StoreLock(store):
+        index = load_index(store)
+        builds = sorted(index["builds"].values(), key=lambda build: build["created"])
+        removed = select_builds(builds, keep_last, group_by, max_bytes)
+        result = {"builds": removed, "objects": 0, "bytes": 0, "dry_run": dry_run}
+        if dry_run:
+            return result
+        for build_id in removed:
+            shutil.rmtree(os.path.join(store, "builds", build_id), ignore_errors=True)
+            del index["builds"][build_id]
+        save_index(store, index)
+
+        if ovas_dir and os.path.isdir(ovas_dir):
+            kept = {entry["sha256"] for build in index["builds"].values() for entry in build["files"].values()}
+            orphaned = set()
+            for build in builds:
+                for entry in build["files"].values():
+                    obj = object_path(store, entry["sha256"])
+                    if build["build_id"] in removed and entry["sha256"] not in kept and os.path.exists(obj):
+                        orphaned.add((os.stat(obj).st_dev, os.stat(obj).st_ino))
+            for name in os.listdir(ovas_dir):
+                path = os.path.join(ovas_dir, name)
+                path_stat = os.stat(path)
+                if (path_stat.st_dev, path_stat.st_ino) in orphaned:
+                    os.remove(path)
+
+        # Objects are only linked from the store when no build or ovas copy refers to them
+        objects_dir = os.path.join(store, "objects")
+        for subdir, _, files in os.walk(objects_dir):
+            for name in files:
+                path = os.path.join(subdir, name)
+                path_stat = os.stat(path)
+                if path_stat.st_nlink == 1:
+                    os.remove(path)
+                    result["objects"] += 1
+                    result["bytes"] += path_stat.st_size
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: build_perf_db.py --db FILE {record,report} [FLAGS]
+#  SQLite database of the node image build performance.
+#
+#  record  appends a build with its stage durations, packer phases, OVA and
+#          VMDK sizes, downloaded bytes and host information.
+#  report  prints the recent builds of every OS target and Kubernetes version
+#          and flags the builds slower or larger than the rolling baseline of
+#          the builds before them (mean + threshold * standard deviation).
+################################################################################
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+
+schema = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ova_ts_suffix TEXT NOT NULL,
+    os_target TEXT NOT NULL,
+    kubernetes_version TEXT NOT NULL,
+    recorded REAL NOT NULL,
+    status TEXT NOT NULL,
+    total_seconds REAL,
+    ova_bytes INTEGER,
+    vmdk_bytes INTEGER,
+    downloaded_bytes INTEGER,
+    image_builder_commit TEXT,
+    hostname TEXT,
+    cpus INTEGER,
+    memory_mb INTEGER,
+    kernel TEXT,
+    UNIQUE (ova_ts_suffix, os_target, kubernetes_version)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (build_id, name)
+);
+"""
+
+# Build columns compared against the baseline, the stages are compared as well
+metrics = ["total_seconds", "ova_bytes", "vmdk_bytes", "downloaded_bytes"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to record and report the node image build performance')
+    parser.add_argument('--db', required=True,
+                        help='SQLite database file')
+    sub_parsers = parser.add_subparsers(dest='subparser_name')
+
+    record_group = sub_parsers.add_parser("record")
+    record_group.add_argument('--ova_ts_suffix', required=True,
+                              help='Timestamp suffix of the build')
+    record_group.add_argument('--os_target', required=True,
+                              help='OS target of the build')
+    record_group.add_argument('--kubernetes_version', required=True,
+                              help='Kubernetes version of the build')
+    record_group.add_argument('--status', required=True,
+                              help='Result of the build, e.g. success or failed')
+    record_group.add_argument('--stages_file', required=False, default=None,
+                              help='Tab separated file with the stage names and durations in milliseconds')
+    record_group.add_argument('--packer_summary', required=False, default=None,
+                              help='Summary JSON of packer_log_analyzer.py, its phases are recorded as stages')
+    record_group.add_argument('--output_dir', required=False, default=None,
+                              help='Packer output folder containing the OVA and VMDK files')
+    record_group.add_argument('--downloads_file', required=False, default=None,
+                              help='File with the size of every file downloaded by the build, one per line')
+    record_group.add_argument('--build_start', required=False, type=float, default=None,
+                              help='Start time of the build, files of the packer summary modified since then '
+                                   'were downloaded by packer during the build')
+    record_group.add_argument('--image_builder_commit', required=False, default=None,
+                              help='Image builder commit used by the build')
+
+    report_group = sub_parsers.add_parser("report")
+    report_group.add_argument('--os_target', required=False, default=None,
+                              help='Only report this OS target')
+    report_group.add_argument('--kubernetes_version', required=False, default=None,
+                              help='Only report this Kubernetes version')
+    report_group.add_argument('--last', type=int, default=10,
+                              help='Number of builds reported per OS target and Kubernetes version, default value is 10')
+    report_group.add_argument('--window', type=int, default=10,
+                              help='Number of previous successful builds used as baseline, default value is 10')
+    report_group.add_argument('--threshold', type=float, default=2.0,
+                              help='Standard deviations above the baseline mean flagged as regression, default value is 2')
+    report_group.add_argument('--min_change', type=float, default=0.05,
+                              help='Minimum relative change over the baseline mean flagged as regression, default value is 0.05')
+    report_group.add_argument('--json', action='store_true',
+                              help='Print the report as JSON')
+    report_group.add_argument('--fail_on_regression', action='store_true',
+                              help='Exit with an error when the latest build of a group is flagged')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn = connect(args.db)
+    if args.subparser_name == "record":
+        build_id = record(conn, args)
+        print("build_perf_db: recorded build {} in {}".format(build_id, args.db))
+    elif args.subparser_name == "report":
+        report = build_report(conn, args)
+        if args.json:
+            print(json.dumps(report, indent=4))
+        else:
+            print_report(report)
+        if args.fail_on_regression and any(group["builds"] and group["builds"][-1]["regressions"]
+                                           for group in report):
+            sys.exit(1)
+    else:
+        print("Missing command, use --help for details")
+        sys.exit(2)
+
+
+def connect(db):
+    conn = sqlite3.connect(db, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(schema)
+    return conn
+
+
+def get_memory_mb():
+    try:
+        with open('/proc/meminfo', 'r') as fp:
+            for line in fp:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def read_stages(stages_file, packer_summary):
+    stages = {}
+    if stages_file and os.path.exists(stages_file):
+        with open(stages_file, 'r') as fp:
+            for line in fp:
+                parts = line.strip().split('\t')
+                if len(parts) == 2:
+                    stages[parts[0]] = stages.get(parts[0], 0) + int(parts[1]) / 1000
+    if packer_summary and os.path.exists(packer_summary):
+        with open(packer_summary, 'r') as fp:
+            for phase, seconds in json.load(fp)["phases"].items():
+                stages["packer." + phase] = seconds
+    return stages
+
+
+def downloaded_bytes(downloads_file, packer_summary, build_start):
+    """
+    Bytes downloaded by the build itself, the files fetched by the build
+    scripts and the files packer fetched into its cache during the build.
+    """
+    if not downloads_file or not os.path.exists(downloads_file):
+        return None
+    with open(downloads_file, 'r') as fp:
+        total = sum(int(line) for line in fp if line.strip().isdigit())
+    if packer_summary and os.path.exists(packer_summary) and build_start is not None:
+        with open(packer_summary, 'r') as fp:
+            for path in json.load(fp).get("downloads", []):
+                if os.path.isfile(path) and os.path.getmtime(path) >= build_start:
+                    total += os.path.getsize(path)
+    return total
+
+
+def files_size(output_dir, pattern):
+    if not output_dir:
+        return None
+    files = glob.glob(os.path.join(output_dir, pattern))
+    return sum(os.path.getsize(path) for path in files) if files else None
+
+
+def record(conn, args):
+    stages = read_stages(args.stages_file, args.packer_summary)
+    values = {
+        "ova_ts_suffix": args.ova_ts_suffix,
+        "os_target": args.os_target,
+        "kubernetes_version": args.kubernetes_version,
+        "recorded": time.time(),
+        "status": args.status,
+        "total_seconds": sum(seconds for name, seconds in stages.items() if not name.startswith("packer.")),
+        "ova_bytes": files_size(args.output_dir, "*.ova"),
+        "vmdk_bytes": files_size(args.output_dir, "*.vmdk"),
+        "downloaded_bytes": downloaded_bytes(args.downloads_file, args.packer_summary, args.build_start),
+        "image_builder_commit": args.image_builder_commit or None,
+        "hostname": platform.node(),
+        "cpus": os.cpu_count(),
+        "memory_mb": get_memory_mb(),
+        "kernel": platform.release(),
+    }
+    with conn:
+        # A build recorded again, e.g. a retried container, replaces the previous record
+        conn.execute("DELETE FROM builds WHERE ova_ts_suffix = ? AND os_target = ? AND kubernetes_version = ?",
+                     (args.ova_ts_suffix, args.os_target, args.kubernetes_version))
+        cursor = conn.execute("INSERT INTO builds ({}) VALUES ({})".format(
+            ", ".join(values), ", ".join("?" * len(values))), list(values.values()))
+        build_id = cursor.lastrowid
+        conn.executemany("INSERT INTO stages (build_id, name, seconds) VALUES (?, ?, ?)",
+                         [(build_id, name, seconds) for name, seconds in stages.items()])
+    return build_id
+
+
+def compare(value, baseline, threshold, min_change):
+    """
+    Return the baseline statistics when value is above the baseline, None otherwise.
+    """
+    if value is None or len(baseline) < 3:
+        return None
+    mean = statistics.mean(baseline)
+    stdev = statistics.stdev(baseline)
+    if value > mean + threshold * stdev and value > mean * (1 + min_change):
+        return {"value": value, "mean": mean, "stdev": stdev}
+    return None
+
+
+def build_report(conn, args):
+    query = "SELECT * FROM builds WHERE 1 = 1"
+    params = []
+    if args.os_target:
+        query += " AND os_target = ?"
+        params.append(args.os_target)
+    if args.kubernetes_version:
+        query += " AND kubernetes_version = ?"
+        params.append(args.kubernetes_version)
+    rows = conn.execute(query + " ORDER BY recorded", params).fetchall()
+
+    groups = {}
+    for row in rows:
+        build = dict(row)
+        build["stages"] = {stage["name"]: stage["seconds"] for stage in conn.execute(
+            "SELECT name, seconds FROM stages WHERE build_id = ?", (row["id"],))}
+        groups.setdefault((row["os_target"], row["kubernetes_version"]), []).append(build)
+
+    report = []
+    for (os_target, kubernetes_version), builds in sorted(groups.items()):
+        for position, build in enumerate(builds):
+            previous = [other for other in builds[:position] if other["status"] == "success"][-args.window:]
+            build["regressions"] = {}
+            if build["status"] != "success":
+                continue
+            for metric in metrics:
+                result = compare(build[metric], [other[metric] for other in previous if other[metric] is not None],
+                                 args.threshold, args.min_change)
+                if result:
+                    build["regressions"][metric] = result
+            for stage, seconds in build["stages"].items():
+                result = compare(seconds, [other["stages"][stage] for other in previous if stage in other["stages"]],
+                                 args.threshold, args.min_change)
+                if result:
+                    build["regressions"]["stage " + stage] = result
+        report.append({"os_target": os_target, "kubernetes_version": kubernetes_version,
+                       "builds": builds[-args.last:]})
+    return report
+
+
+def print_report(report):
+    for group in report:
+        print("{} {}".format(group["os_target"], group["kubernetes_version"]))
+        print("  {:<16} {:<8} {:>10} {:>12} {:>12} {:>12}  {}".format(
+            "build", "status", "seconds", "ova MB", "vmdk MB", "download MB", "commit"))
+        for build in group["builds"]:
+            print("  {:<16} {:<8} {:>10} {:>12} {:>12} {:>12}  {}".format(
+                build["ova_ts_suffix"], build["status"], format_number(build["total_seconds"]),
+                format_number(build["ova_bytes"], 1024 ** 2), format_number(build["vmdk_bytes"], 1024 ** 2),
+                format_number(build["downloaded_bytes"], 1024 ** 2), (build["image_builder_commit"] or "")[:12]))
+            for name, result in build["regressions"].items():
+                print("    REGRESSION {}: {:.1f} vs baseline {:.1f} +/- {:.1f}".format(
+                    name, result["value"], result["mean"], result["stdev"]))
+
+
+def format_number(value, unit=1):
+    return "-" if value is None else "{:.0f}".format(value / unit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# Profiling hooks shared by the python build scripts. Profiling is enabled by
+# setting BUILD_PROFILE_DIR, build-ova.sh sets it when BUILD_PROFILE is true.
+# When it is not set run() calls main() directly and span() returns a shared
+# no-op context manager, the profiling modules are only imported when enabled.
+#
+# usage:
+#   import build_profiler
+#   with build_profiler.span("render {}".format(name)):
+#       ...
+#   if __name__ == '__main__':
+#       build_profiler.run(main, "tkg_byoi")
+################################################################################
+
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+profile_dir = os.environ.get("BUILD_PROFILE_DIR")
+top_entries = 25
+
+_null_span = nullcontext()
+# Span name -> [count, total seconds, max seconds], None when profiling is disabled
+_spans = None
+
+
+class _Span():
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        entry = _spans.setdefault(self.name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+        return False
+
+
+def span(name):
+    """
+    Time the enclosed block under the given name, a no-op when profiling is disabled.
+    """
+    if _spans is None:
+        return _null_span
+    return _Span(name)
+
+
+def run(main, name):
+    """
+    Run main() under cProfile and tracemalloc when profiling is enabled and
+    write <name>-<pid>.prof and <name>-<pid>-profile.json to the profile folder.
+    """
+    global _spans
+
+    if not profile_dir:
+        return main()
+
+    import cProfile
+    import tracemalloc
+
+    _spans = {}
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    error = None
+    try:
+        return profiler.runcall(main)
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        wall_seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        try:
+            write_profile(name, profiler, snapshot, {
+                "script": name,
+                "argv": sys.argv,
+                "error": error,
+                "wall_seconds": wall_seconds,
+                "cpu_seconds": cpu_seconds,
+                "memory_current_bytes": current,
+                "memory_peak_bytes": peak,
+            })
+        except OSError as e:
+            print("build_profiler: failed to write the profile of {}: {}".format(name, e))
+
+
+def write_profile(name, profiler, snapshot, summary):
+    import io
+    import pstats
+
+    os.makedirs(profile_dir, exist_ok=True)
+    prefix = os.path.join(profile_dir, "{}-{}".format(name, os.getpid()))
+    profiler.dump_stats(prefix + ".prof")
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    functions = []
+    for (filename, lineno, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        functions.append({
+            "function": "{}:{}({})".format(filename, lineno, function),
+            "calls": ncalls,
+            "total_seconds": tottime,
+            "cumulative_seconds": cumtime,
+        })
+    functions.sort(key=lambda entry: entry["cumulative_seconds"], reverse=True)
+
+    summary["spans"] = {span_name: {"count": count, "total_seconds": total, "max_seconds": longest}
+                        for span_name, (count, total, longest) in _spans.items()}
+    summary["functions"] = functions[:top_entries]
+    summary["allocations"] = [{"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                              for stat in snapshot.statistics("lineno")[:top_entries]]
+
+    with open(prefix + "-profile.json", 'w') as fp:
+        json.dump(summary, fp, indent=4)
+    print("build_profiler: wrote {}.prof and {}-profile.json".format(prefix, prefix))
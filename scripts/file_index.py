@@ -0,0 +1,55 @@
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# Helpers of the folders shared by concurrent builds and indexed in a JSON
+# file, used by artifacts_store.py and packer_cache.py.
+################################################################################
+
+import fcntl
+import hashlib
+import json
+import os
+
+
+def sha256(path):
+    m = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            m.update(data)
+    return m.hexdigest()
+
+
+class FileLock():
+    """
+    Exclusive flock on path, serializes the read-modify-write of an index between builds.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.fp = open(self.path, 'a')
+        fcntl.flock(self.fp, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fp, fcntl.LOCK_UN)
+        self.fp.close()
+        return False
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def save_json(path, data):
+    with open(path + ".tmp", 'w') as fp:
+        json.dump(data, fp, indent=4)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: goss_results.py --log_file FILE --output_dir DIR [FLAGS]
+#  Extracts the JSON results of the goss validation from the packer log and
+#  writes them to DIR/goss_results.json, along with DIR/goss_summary.json
+#  holding the duration per resource type and the slowest checks.
+################################################################################
+
+import argparse
+import gzip
+import json
+import os
+import re
+
+# Output of the provisioners forwarded by packer, e.g.
+# 2024/01/01 10:00:00 ui:     vsphere-iso.vsphere: "resource-type": "Service",
+output_regex = re.compile(r' ui: +[^:=]+: ?(.*)$')
+# Start of the goss provisioner, e.g.
+# 2024/01/01 10:00:00 ui: ==> vsphere-iso.vsphere: Provisioning with Goss
+goss_start_regex = re.compile(r' ui: ==> [^:]+: Provisioning with Goss', re.IGNORECASE)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to extract the goss validation results and timings from a packer debug log')
+    parser.add_argument('--log_file', required=True,
+                        help='Packer log file generated with PACKER_LOG enabled, can be gzip compressed')
+    parser.add_argument('--output_dir', required=True,
+                        help='Folder where goss_results.json and goss_summary.json are written')
+    parser.add_argument('--top', required=False, type=int, default=20,
+                        help='Number of slowest checks to report, default value is 20')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = extract_results(args.log_file)
+    if results is None:
+        print("goss_results: no goss JSON results found in {}".format(args.log_file))
+        return
+    summary = summarize(results, args.top)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "goss_results.json"), 'w') as fp:
+        json.dump(results, fp, indent=4)
+    with open(os.path.join(args.output_dir, "goss_summary.json"), 'w') as fp:
+        json.dump(summary, fp, indent=4)
+    print_summary(summary)
+
+
+def open_log(log_file):
+    if log_file.endswith('.gz'):
+        return gzip.open(log_file, 'rt', errors='replace')
+    return open(log_file, 'r', errors='replace')
+
+
+def extract_results(log_file):
+    """
+    Collect the output following every goss provisioner run and return the
+    last JSON document with goss results, None when there is none.
+    """
+    runs = []
+    lines = None
+    with open_log(log_file) as fp:
+        for line in fp:
+            line = line.rstrip('\n')
+            if goss_start_regex.search(line):
+                lines = []
+                runs.append(lines)
+            elif lines is not None:
+                match = output_regex.search(line)
+                if match:
+                    lines.append(match.group(1))
+
+    decoder = json.JSONDecoder()
+    for run in reversed(runs):
+        text = "\n".join(run)
+        results = None
+        position = text.find('{')
+        while position != -1:
+            try:
+                document, end = decoder.raw_decode(text, position)
+            except ValueError:
+                position = text.find('{', position + 1)
+                continue
+            if isinstance(document, dict) and "results" in document and "summary" in document:
+                results = document
+            position = text.find('{', end)
+        if results is not None:
+            return results
+    return None
+
+
+def summarize(results, top):
+    """
+    Goss reports the durations in nanoseconds, the summary uses seconds.
+    """
+    checks = []
+    resource_types = {}
+    for result in results["results"]:
+        seconds = result.get("duration", 0) / 1e9
+        check = {
+            "resource_type": result.get("resource-type"),
+            "resource_id": result.get("resource-id"),
+            "property": result.get("property"),
+            "successful": result.get("successful"),
+            "skipped": result.get("skipped", False),
+            "seconds": seconds,
+        }
+        checks.append(check)
+        resource_type = resource_types.setdefault(check["resource_type"], {"checks": 0, "seconds": 0})
+        resource_type["checks"] += 1
+        resource_type["seconds"] += seconds
+    checks.sort(key=lambda check: check["seconds"], reverse=True)
+    return {
+        "total_seconds": results["summary"].get("total-duration", 0) / 1e9,
+        "test_count": results["summary"].get("test-count", len(checks)),
+        "failed_count": results["summary"].get("failed-count", 0),
+        "resource_types": resource_types,
+        "slowest": checks[:top],
+        "failed": [check for check in checks if not check["successful"] and not check["skipped"]],
+    }
+
+
+def print_summary(summary):
+    print("Goss validated {} checks in {:.1f} seconds, {} failed".format(
+        summary["test_count"], summary["total_seconds"], summary["failed_count"]))
+    for resource_type, totals in sorted(summary["resource_types"].items(), key=lambda item: item[1]["seconds"],
+                                        reverse=True):
+        print("  {:<16} {:>5} checks {:>9.2f}s".format(resource_type, totals["checks"], totals["seconds"]))
+    print("Slowest checks:")
+    for check in summary["slowest"]:
+        print("  {:>9.2f}s  {} {} {}".format(check["seconds"], check["resource_type"], check["resource_id"],
+                                               check["property"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: packer_cache.py --cache_dir DIR [FLAGS] run -- COMMAND
+#  Runs COMMAND (the packer build) against a packer cache folder shared by
+#  several builder containers.
+#
+#  Every build holds a shared lock on the cache folder while it runs. A build
+#  that gets the lock exclusively, i.e. no other build is running, also drops
+#  the modified entries, removes files left over by interrupted downloads and
+#  evicts the least recently used entries above --max_size_gb. The SHA256 of
+#  an entry is verified again when its size or modification time changed and
+#  every --verify_interval_days, not on every build.
+#
+#  Files downloaded by the build are added to index.json with their SHA256 and
+#  counted as misses, when the build failed only the downloads completed
+#  according to the packer log are added. Entries that already existed and are
+#  referenced in the packer log are counted as hits.
+################################################################################
+
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+
+import file_index
+
+INDEX_FILE = "index.json"
+BUILD_LOCK_FILE = ".build.lock"
+INDEX_LOCK_FILE = ".index.lock"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to share the packer cache folder between builds')
+    parser.add_argument('--cache_dir', required=True,
+                        help='Packer cache folder, used as PACKER_CACHE_DIR')
+    parser.add_argument('--max_size_gb', type=float, default=50,
+                        help='Maximum size of the cache, default value is 50')
+    parser.add_argument('--packer_log', required=False, default=None,
+                        help='Packer log file used to find the cache entries used by the build')
+    parser.add_argument('--outfile', required=False, default=None,
+                        help='Path to the JSON file with the cache statistics of the build')
+    parser.add_argument('--verify_interval_days', type=float, default=7,
+                        help='Days after which the SHA256 of unchanged entries is verified again, 0 never verifies '
+                             'them again, default value is 7')
+    sub_parsers = parser.add_subparsers(dest='subparser_name')
+    run_group = sub_parsers.add_parser("run")
+    run_group.add_argument('command', nargs=argparse.REMAINDER,
+                           help='Command running the packer build')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.subparser_name != "run" or not args.command:
+        print("packer_cache: missing command to run")
+        sys.exit(2)
+    command = args.command[1:] if args.command[0] == '--' else args.command
+    sys.exit(run(args, command))
+
+
+def is_cache_file(name):
+    return not (name.startswith('.') or name == INDEX_FILE or name.endswith('.lock'))
+
+
+def load_index(cache_dir):
+    return file_index.load_json(os.path.join(cache_dir, INDEX_FILE),
+                                {"entries": {}, "hits": 0, "misses": 0, "evictions": 0})
+
+
+def save_index(cache_dir, index):
+    file_index.save_json(os.path.join(cache_dir, INDEX_FILE), index)
+
+
+class IndexLock(file_index.FileLock):
+    """
+    Serializes the read-modify-write of index.json between builds.
+    """
+    def __init__(self, cache_dir):
+        super().__init__(os.path.join(cache_dir, INDEX_LOCK_FILE))
+
+
+def remove_entry(cache_dir, index, name):
+    index["entries"].pop(name, None)
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def verify(cache_dir, index, verify_interval_days=7):
+    """
+    Drop the modified and unindexed files, only called while no other build is running.
+    Entries are only hashed when their modification time changed or their last
+    verification is older than verify_interval_days, the cache holds several GB of ISOs.
+    """
+    removed = []
+    now = time.time()
+    for name, entry in list(index["entries"].items()):
+        path = os.path.join(cache_dir, name)
+        if not os.path.exists(path):
+            index["entries"].pop(name)
+            removed.append(name)
+            continue
+        stat = os.stat(path)
+        if stat.st_size != entry["size"]:
+            remove_entry(cache_dir, index, name)
+            removed.append(name)
+            continue
+        verified = entry.get("verified", entry["added"])
+        if int(stat.st_mtime) == entry["mtime"] and \
+                (not verify_interval_days or now - verified < verify_interval_days * 86400):
+            continue
+        if file_index.sha256(path) != entry["sha256"]:
+            remove_entry(cache_dir, index, name)
+            removed.append(name)
+            continue
+        entry.update({"mtime": int(stat.st_mtime), "verified": now})
+    for name in os.listdir(cache_dir):
+        if is_cache_file(name) and name not in index["entries"] and os.path.isfile(os.path.join(cache_dir, name)):
+            # Left over by an interrupted or failed download
+            remove_entry(cache_dir, index, name)
+            removed.append(name)
+    return removed
+
+
+def evict(cache_dir, index, max_size):
+    evicted = []
+    total = sum(entry["size"] for entry in index["entries"].values())
+    for name, entry in sorted(index["entries"].items(), key=lambda item: item[1]["last_used"]):
+        if total <= max_size:
+            break
+        remove_entry(cache_dir, index, name)
+        total -= entry["size"]
+        evicted.append(name)
+    return evicted
+
+
+def used_entries(packer_log, names):
+    """
+    Names of the cache entries referenced in the packer log.
+    """
+    used = set()
+    if not packer_log or not os.path.exists(packer_log) or not names:
+        return used
+    with open(packer_log, 'r', errors='replace') as fp:
+        for line in fp:
+            for name in names:
+                if name in line:
+                    used.add(name)
+    return used
+
+
+def completed_downloads(packer_log, names):
+    """
+    Names of the files packer reported as downloaded in the log, packer prints
+    "<url> => <path>" once the download finished and its checksum matched.
+    """
+    completed = set()
+    if not packer_log or not os.path.exists(packer_log) or not names:
+        return completed
+    with open(packer_log, 'r', errors='replace') as fp:
+        for line in fp:
+            if " => " not in line:
+                continue
+            path = line.rsplit(" => ", 1)[1].strip()
+            if os.path.basename(path) in names:
+                completed.add(os.path.basename(path))
+    return completed
+
+
+def run(args, command):
+    cache_dir = args.cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    stats = {"cache_dir": cache_dir, "hits": [], "misses": [], "removed": [], "evicted": []}
+
+    build_lock = open(os.path.join(cache_dir, BUILD_LOCK_FILE), 'a')
+    try:
+        fcntl.flock(build_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with IndexLock(cache_dir):
+            index = load_index(cache_dir)
+            stats["removed"] = verify(cache_dir, index, args.verify_interval_days)
+            save_index(cache_dir, index)
+        fcntl.flock(build_lock, fcntl.LOCK_SH)
+    except BlockingIOError:
+        print("packer_cache: other builds are using {}, skipping verification".format(cache_dir))
+        fcntl.flock(build_lock, fcntl.LOCK_SH)
+
+    with IndexLock(cache_dir):
+        existing = set(load_index(cache_dir)["entries"])
+
+    start = time.time()
+    rc = subprocess.call(command)
+    stats["build_seconds"] = time.time() - start
+
+    # Hash the new files before taking the index lock, they can be several GB
+    new_files = [name for name in os.listdir(cache_dir)
+                 if is_cache_file(name) and name not in existing and os.path.isfile(os.path.join(cache_dir, name))
+                 and not os.path.exists(os.path.join(cache_dir, name + ".lock"))]
+    if rc != 0:
+        # Keep the downloads that completed before the build failed
+        new_files = completed_downloads(args.packer_log, set(new_files))
+    new_entries = {}
+    for name in new_files:
+        path = os.path.join(cache_dir, name)
+        stat = os.stat(path)
+        new_entries[name] = {"size": stat.st_size, "mtime": int(stat.st_mtime),
+                             "sha256": file_index.sha256(path)}
+    used = used_entries(args.packer_log, existing)
+
+    now = time.time()
+    with IndexLock(cache_dir):
+        index = load_index(cache_dir)
+        for name, entry in new_entries.items():
+            if name in index["entries"]:
+                # Indexed by a concurrent build in the meantime
+                continue
+            entry.update({"added": now, "verified": now, "last_used": now, "hits": 0})
+            index["entries"][name] = entry
+            stats["misses"].append(name)
+        for name in used:
+            if name in index["entries"]:
+                index["entries"][name]["last_used"] = now
+                index["entries"][name]["hits"] += 1
+                stats["hits"].append(name)
+        index["hits"] += len(stats["hits"])
+        index["misses"] += len(stats["misses"])
+        save_index(cache_dir, index)
+
+    fcntl.flock(build_lock, fcntl.LOCK_UN)
+    try:
+        fcntl.flock(build_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with IndexLock(cache_dir):
+            index = load_index(cache_dir)
+            stats["evicted"] = evict(cache_dir, index, int(args.max_size_gb * 1024 ** 3))
+            index["evictions"] += len(stats["evicted"])
+            save_index(cache_dir, index)
+    except BlockingIOError:
+        print("packer_cache: other builds are using {}, skipping eviction".format(cache_dir))
+    finally:
+        build_lock.close()
+
+    stats["entries"] = len(index["entries"])
+    stats["size_bytes"] = sum(entry["size"] for entry in index["entries"].values())
+    stats["total_hits"] = index["hits"]
+    stats["total_misses"] = index["misses"]
+    print("packer_cache: {} hits, {} misses, {} evicted, {} entries using {} bytes".format(
+        len(stats["hits"]), len(stats["misses"]), len(stats["evicted"]), stats["entries"], stats["size_bytes"]))
+    if args.outfile:
+        with open(args.outfile, 'w') as fp:
+            json.dump(stats, fp, indent=4)
+    return rc
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+
+timestamp_regex = re.compile(r'^(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) ')
+# Messages printed by the builders and provisioners, e.g.
+# 2024/01/01 10:00:00 ui: ==> vsphere-iso.vsphere: Waiting for SSH to become available...
+step_regex = re.compile(r' ui: ==> [^:]+: (.+)$')
+# Ansible output forwarded by the ansible provisioner, e.g.
+# 2024/01/01 10:00:00 ui:     vsphere-iso.vsphere: TASK [node : Install packages] ****
+ansible_task_regex = re.compile(r' ui: +[^:]+: TASK \[(.+?)\] \**$')
+ansible_end_regex = re.compile(r' ui: +[^:]+: (PLAY \[.*|PLAY RECAP.*)$')
+# Files fetched by packer, e.g. the OS ISO, are logged once they are in the packer cache
+# 2024/01/01 10:00:00 [INFO] https://host/os.iso?checksum=sha256:... => /image-builder/packer_cache/<hash>.iso
+download_regex = re.compile(r' \S+://\S+ => (\S+)$')
+
+# Phase of the build a builder step belongs to, first match wins.
+phase_patterns = [
+    ("vm_boot", re.compile(r'^(Creating VM|Customizing hardware|Mounting ISO|Adding configuration parameters|'
+                           r'Set boot order|Powering on|Waiting \d+s for boot|Typing boot command|Starting HTTP server|'
+                           r'Waiting for IP|IP address)')),
+    ("ssh_wait", re.compile(r'^(Waiting for SSH|Connected to SSH)')),
+    ("goss", re.compile(r'^(Provisioning with Goss|Goss)', re.IGNORECASE)),
+    ("provisioner", re.compile(r'^Provisioning with')),
+    ("shutdown", re.compile(r'^(Executing shutdown command|Waiting for VM to shut down|Deleting Floppy|'
+                            r'Eject CD-ROM|Clear boot order|VM stopped|Power off)')),
+    ("export", re.compile(r'^(Exporting|Creating snapshot|Destroying VM|Running post-processor|'
+                          r'Convert VM into template|Clone)')),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to extract a per provisioner and per task timeline from a packer debug log')
+    parser.add_argument('--log_file', required=True,
+                        help='Packer log file generated with PACKER_LOG enabled, can be gzip compressed')
+    parser.add_argument('--outfile', required=True,
+                        help='Path to the JSON summary')
+    parser.add_argument('--top', required=False, type=int, default=20,
+                        help='Number of slowest steps to report, default value is 20')
+    parser.add_argument('--compress', action='store_true',
+                        help='Compress the log file once it is analyzed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    summary = analyze_log(args.log_file, args.top)
+    with open(args.outfile, 'w') as fp:
+        json.dump(summary, fp, indent=4)
+    print_summary(summary)
+    if args.compress and not args.log_file.endswith('.gz'):
+        compress_log(args.log_file)
+
+
+def open_log(log_file):
+    if log_file.endswith('.gz'):
+        return gzip.open(log_file, 'rt', errors='replace')
+    return open(log_file, 'r', errors='replace')
+
+
+def get_phase(message):
+    for phase, pattern in phase_patterns:
+        if pattern.match(message):
+            return phase
+    return "other"
+
+
+def close_entry(entries, entry, end):
+    if entry is not None:
+        entry["duration"] = (end - entry.pop("start")).total_seconds()
+        entries.append(entry)
+    return None
+
+
+def analyze_log(log_file, top):
+    """
+    Read the packer log line by line and build the timeline. A builder step
+    lasts until the next builder step, an ansible task lasts until the next
+    task, play or builder step.
+    """
+    steps = []
+    tasks = []
+    downloads = set()
+    current_step = None
+    current_task = None
+    first_timestamp = None
+    timestamp = None
+
+    with open_log(log_file) as fp:
+        for line in fp:
+            match = timestamp_regex.match(line)
+            if not match:
+                continue
+            timestamp = datetime.strptime(match.group(1), '%Y/%m/%d %H:%M:%S')
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            line = line.rstrip('\n')
+
+            match = download_regex.search(line)
+            if match:
+                downloads.add(match.group(1))
+                continue
+
+            match = ansible_task_regex.search(line)
+            if match:
+                current_task = close_entry(tasks, current_task, timestamp)
+                current_task = {"name": match.group(1), "start": timestamp}
+                continue
+            if ansible_end_regex.search(line):
+                current_task = close_entry(tasks, current_task, timestamp)
+                continue
+
+            match = step_regex.search(line)
+            if match:
+                message = match.group(1).strip()
+                current_task = close_entry(tasks, current_task, timestamp)
+                current_step = close_entry(steps, current_step, timestamp)
+                current_step = {"name": message, "phase": get_phase(message), "start": timestamp}
+
+    if timestamp is not None:
+        close_entry(tasks, current_task, timestamp)
+        close_entry(steps, current_step, timestamp)
+
+    # Provisioner steps of the goss provisioner are reported under goss
+    # and every other step keeps the phase of the previous classified step.
+    phases = {}
+    phase = "other"
+    for step in steps:
+        if step["phase"] == "other":
+            step["phase"] = phase
+        phase = step["phase"]
+        phases[phase] = phases.get(phase, 0) + step["duration"]
+
+    provisioners = {}
+    provisioner = None
+    for step in steps:
+        if step["name"].startswith("Provisioning with"):
+            provisioner = step["name"][len("Provisioning with"):].strip(" .:")
+        elif step["phase"] not in ("provisioner", "goss"):
+            provisioner = None
+        if provisioner is not None:
+            provisioners[provisioner] = provisioners.get(provisioner, 0) + step["duration"]
+
+    slowest = sorted([{"type": "step", "name": step["name"], "duration": step["duration"]} for step in steps] +
+                     [{"type": "ansible_task", "name": task["name"], "duration": task["duration"]} for task in tasks],
+                     key=lambda entry: entry["duration"], reverse=True)[:top]
+
+    return {
+        "log_file": os.path.basename(log_file),
+        "start": first_timestamp.isoformat() if first_timestamp else None,
+        "end": timestamp.isoformat() if timestamp else None,
+        "total_seconds": (timestamp - first_timestamp).total_seconds() if first_timestamp else 0,
+        "phases": phases,
+        "provisioners": provisioners,
+        "steps": steps,
+        "ansible_tasks_count": len(tasks),
+        "ansible_tasks_seconds": sum(task["duration"] for task in tasks),
+        "slowest": slowest,
+        "downloads": sorted(downloads),
+    }
+
+
+def print_summary(summary):
+    print("Packer build took {} seconds".format(summary["total_seconds"]))
+    for phase, duration in sorted(summary["phases"].items(), key=lambda item: item[1], reverse=True):
+        print("  {:<12} {:>8.0f}s".format(phase, duration))
+    print("Slowest steps:")
+    for entry in summary["slowest"]:
+        print("  {:>8.0f}s {:<13} {}".format(entry["duration"], entry["type"], entry["name"]))
+
+
+def compress_log(log_file):
+    """
+    Compress the log file with gzip and remove the original.
+    """
+    with open(log_file, 'rb') as src, gzip.open(log_file + '.gz', 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(log_file)
+    print("Compressed {} to {}.gz".format(log_file, log_file))
+
+
+if __name__ == '__main__':
+    main()
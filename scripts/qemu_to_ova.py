@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+################################################################################
+# usage: qemu_to_ova.py --image_builder_root DIR --os_type OS --output_dir DIR
+#  Turns the qcow2 disk of a QEMU build into the same OVA layout as the vSphere
+#  builds. The disk is converted to a stream optimized VMDK and the packer
+#  manifest the OVA post-processor of the vSphere builds writes is generated
+#  from the packer variables, then image-build-ova.py creates the OVA.
+################################################################################
+
+import argparse
+import json
+import os
+import subprocess
+import time
+
+QCOW2_MAGIC = b'QFI\xfb'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to build the node image OVA from the qcow2 disk of a QEMU build')
+    parser.add_argument('--image_builder_root', required=True,
+                        help='Image builder capi folder, e.g. /image-builder/images/capi')
+    parser.add_argument('--os_type', required=True,
+                        help='OS type of the build, e.g. photon-5')
+    parser.add_argument('--output_dir', required=True,
+                        help='Packer output folder of the QEMU build')
+    parser.add_argument('--packer_var_files', required=True,
+                        help='Comma separated packer variable files passed to the build, later files win')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    packer_vars = load_packer_vars(args.image_builder_root, args.os_type, args.packer_var_files.split(','))
+    qcow2 = find_qcow2(args.output_dir)
+    vmdk = convert_disk(qcow2, args.output_dir, packer_vars.get("build_name", args.os_type))
+    write_manifest(args.output_dir, packer_vars, vmdk)
+
+    hack_dir = os.path.join(args.image_builder_root, "hack")
+    ova_args = ["python3", os.path.join(hack_dir, "image-build-ova.py"),
+                "--vmx", packer_vars.get("vmx_version", "21"),
+                "--ovf_template", os.path.join(hack_dir, "ovf_template.xml"),
+                "--eula_file", get_eula_file(args.image_builder_root, args.output_dir, packer_vars),
+                "--vmdk_file", os.path.basename(vmdk),
+                args.output_dir]
+    print("qemu_to_ova: {}".format(" ".join(ova_args)))
+    subprocess.check_call(ova_args)
+
+
+def load_packer_vars(image_builder_root, os_type, packer_var_files):
+    """
+    Merge the variables the OVA builds are run with: the common configuration,
+    the OVA OS definition holding the OVF metadata and the rendered variables.
+    """
+    packer_vars = {}
+    config_dir = os.path.join(image_builder_root, "packer", "config")
+    var_files = sorted(os.path.join(config_dir, name) for name in os.listdir(config_dir) if name.endswith(".json"))
+    var_files += [os.path.join(image_builder_root, "packer", "ova", "packer-common.json"),
+                  os.path.join(image_builder_root, "packer", "ova", "{}.json".format(os_type))]
+    var_files += [path for path in packer_var_files if path]
+    for path in var_files:
+        if os.path.exists(path):
+            with open(path, 'r') as fp:
+                packer_vars.update(json.load(fp))
+    return packer_vars
+
+
+def find_qcow2(output_dir):
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as fp:
+                if fp.read(4) == QCOW2_MAGIC:
+                    return path
+    raise Exception("No qcow2 disk found in {}".format(output_dir))
+
+
+def convert_disk(qcow2, output_dir, build_name):
+    vmdk = os.path.join(output_dir, "{}-disk-0.vmdk".format(build_name))
+    print("qemu_to_ova: converting {} to {}".format(qcow2, vmdk))
+    subprocess.check_call(["qemu-img", "convert", "-p", "-O", "vmdk", "-o", "subformat=streamOptimized",
+                           qcow2, vmdk])
+    return vmdk
+
+
+def write_manifest(output_dir, packer_vars, vmdk):
+    """
+    Same custom_data as the manifest post-processor of the vSphere builds.
+    """
+    now = time.time()
+    custom_data = {
+        "build_date": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now)),
+        "build_timestamp": str(int(now)),
+        "build_name": packer_vars.get("build_name"),
+        "os_name": packer_vars.get("os_display_name"),
+        "guest_os_type": packer_vars.get("guest_os_type"),
+        "ib_version": os.environ.get("IB_VERSION", packer_vars.get("ib_version", "")),
+        "disk_size": packer_vars.get("disk_size"),
+        "distro_name": packer_vars.get("distro_name"),
+        "distro_version": packer_vars.get("distro_version"),
+        "distro_arch": packer_vars.get("distro_arch", "amd64"),
+        "firmware": packer_vars.get("firmware", "bios"),
+        "kubernetes_cni_semver": packer_vars.get("kubernetes_cni_semver"),
+        "containerd_version": packer_vars.get("containerd_version"),
+        "kubernetes_semver": packer_vars.get("kubernetes_semver"),
+        "kubernetes_source_type": packer_vars.get("kubernetes_source_type"),
+        "kubernetes_typed_version": packer_vars.get("kubernetes_typed_version"),
+        "disable_hypervisor": packer_vars.get("disable_hypervisor", "false"),
+    }
+    manifest = {
+        "builds": [{
+            "name": "qemu",
+            "builder_type": "qemu",
+            "build_time": int(now),
+            "files": [{"name": os.path.basename(vmdk), "size": os.path.getsize(vmdk)}],
+            "artifact_id": packer_vars.get("build_version", custom_data["build_name"]),
+            "custom_data": custom_data,
+        }],
+    }
+    with open(os.path.join(output_dir, "packer-manifest.json"), 'w') as fp:
+        json.dump(manifest, fp, indent=4)
+
+
+def get_eula_file(image_builder_root, output_dir, packer_vars):
+    eula_file = packer_vars.get("eula_file")
+    if eula_file:
+        eula_file = os.path.join(image_builder_root, eula_file)
+        if os.path.exists(eula_file):
+            return eula_file
+    eula_file = os.path.join(output_dir, "ovf_eula.txt")
+    open(eula_file, 'a').close()
+    return eula_file
+
+
+if __name__ == '__main__':
+    main()
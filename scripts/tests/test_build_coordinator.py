@@ -0,0 +1,103 @@
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# usage: python3 -m unittest discover -s scripts/tests
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+spec = importlib.util.spec_from_file_location("build_coordinator", os.path.join(ROOT, "hack", "build-coordinator.py"))
+build_coordinator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(build_coordinator)
+
+VERSION = "v1.32.0+vmware.1"
+
+
+def worker(name, builder_images=(VERSION,), artifacts_servers=(), warm_pool=None, running=0, queue_depth=0,
+           queue_limit=1, reachable=True):
+    result = build_coordinator.Worker(name, "http://{}:8090".format(name), 8090, queue_limit)
+    result.status = {"reachable": reachable, "builder_images": list(builder_images),
+                     "artifacts_servers": list(artifacts_servers), "warm_pool": warm_pool or {},
+                     "running": ["job"] * running, "queue_depth": queue_depth}
+    return result
+
+
+class RouteTest(unittest.TestCase):
+    def route(self, *workers, assigned=None):
+        selected = build_coordinator.route({"kubernetes_version": VERSION}, list(workers), assigned or {})
+        return selected.name if selected else None
+
+    def test_requires_builder_image(self):
+        self.assertIsNone(self.route(worker("w1", builder_images=[]), worker("w2", reachable=False)))
+        self.assertEqual(self.route(worker("w1", builder_images=[]), worker("w2")), "w2")
+
+    def test_preference_order(self):
+        # The artifacts server is preferred over the warm builder containers, which are preferred over the load
+        self.assertEqual(self.route(worker("w1", warm_pool={VERSION: ["c"]}, running=0),
+                                    worker("w2", artifacts_servers=[VERSION], running=3)), "w2")
+        self.assertEqual(self.route(worker("w1", running=0),
+                                    worker("w2", warm_pool={VERSION: ["c"]}, running=3)), "w2")
+        self.assertEqual(self.route(worker("w1", running=2), worker("w2", running=1)), "w2")
+        # Jobs routed in the same round count as load
+        self.assertEqual(self.route(worker("w1", running=1, queue_limit=3), worker("w2", running=2, queue_limit=3),
+                                    assigned={"w1": 2}), "w2")
+
+    def test_queue_limit(self):
+        self.assertIsNone(self.route(worker("w1", queue_depth=1)))
+        self.assertEqual(self.route(worker("w1", queue_depth=1, queue_limit=2)), "w1")
+        # Jobs routed in the same round count against the queue of the worker
+        self.assertIsNone(self.route(worker("w1", queue_limit=2), assigned={"w1": 2}))
+        self.assertEqual(self.route(worker("w1", artifacts_servers=[VERSION]), worker("w2"), assigned={"w1": 1}),
+                         "w2")
+
+    def test_has_builder_image(self):
+        self.assertTrue(build_coordinator.has_builder_image(VERSION, [worker("w1", queue_depth=5)]))
+        self.assertFalse(build_coordinator.has_builder_image(VERSION, [worker("w1", reachable=False),
+                                                                       worker("w2", builder_images=[])]))
+
+
+class DispatchTest(unittest.TestCase):
+    def test_job_without_builder_image_fails_after_route_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            args = argparse.Namespace(worker=["w1=http://w1:8090"], image_artifacts_path=os.path.join(tmp, "image"),
+                                      state_dir=os.path.join(tmp, "state"), agent_port=8090, worker_queue=1,
+                                      route_timeout=60)
+            coordinator = build_coordinator.Coordinator(args)
+            coordinator.workers[0].status = worker("w1", builder_images=[]).status
+            recent, old = coordinator.submit({"kubernetes_version": [VERSION, "v1.31.0+vmware.1"],
+                                              "os_target": "photon-5", "artifacts_container_port": 8081})
+            old["submitted"] = time.time() - 120
+
+            coordinator.dispatch()
+
+            self.assertEqual(recent["status"], build_coordinator.JOB_QUEUED)
+            self.assertIn("No reachable worker with the builder image", recent["waiting"])
+            self.assertEqual(old["status"], build_coordinator.JOB_FAILED)
+            self.assertIn("No reachable worker with the builder image", old["error"])
+
+
+class ExpandTest(unittest.TestCase):
+    def test_job_per_version_and_target(self):
+        jobs = build_coordinator.expand({"kubernetes_version": [VERSION, "v1.31.0+vmware.1"],
+                                         "os_target": ["photon-5", "ubuntu-2204-efi"],
+                                         "artifacts_container_port": {VERSION: 8081, "v1.31.0+vmware.1": 8082}})
+        self.assertEqual(sorted((job["kubernetes_version"], job["os_target"], job["artifacts_container_port"])
+                                for job in jobs),
+                         [("v1.31.0+vmware.1", "photon-5", "8082"), ("v1.31.0+vmware.1", "ubuntu-2204-efi", "8082"),
+                          (VERSION, "photon-5", "8081"), (VERSION, "ubuntu-2204-efi", "8081")])
+        self.assertEqual(len({job["id"] for job in jobs}), 4)
+
+    def test_missing_port(self):
+        with self.assertRaises(ValueError):
+            build_coordinator.expand({"kubernetes_version": [VERSION], "os_target": "photon-5",
+                                      "artifacts_container_port": {"v1.31.0+vmware.1": 8082}})
+
+
+if __name__ == '__main__':
+    unittest.main()
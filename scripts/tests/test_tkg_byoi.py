@@ -0,0 +1,198 @@
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# usage: python3 -m unittest discover -s scripts/tests
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+import tkg_byoi  # noqa: E402
+
+OLD_TKR_NAME = "v1.32.0---vmware.1-fips-vkr.1"
+PACKAGES = ["antrea", "calico", "capabilities", "gateway-api", "guest-cluster-auth-service", "metrics-server",
+            "pinniped", "secretgen-controller", "vsphere-cpi", "vsphere-pv-csi"]
+
+
+def write_yaml(path, *docs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fp:
+        yaml.dump_all(docs, fp)
+
+
+def write_tkr_metadata(folder):
+    """
+    Minimal extracted unified-tkr-vsphere.tar.gz with a TKR, CBT, OSImage, addon config and packages.
+    """
+    config = os.path.join(folder, "config")
+    write_yaml(os.path.join(config, "TanzuKubernetesRelease.yml"), {
+        "kind": tkg_byoi.tkr_api_kind, "metadata": {"name": OLD_TKR_NAME},
+        "spec": {"kubernetes": {"version": "v1.32.0+vmware.1"}, "version": "v1.32.0+vmware.1", "osImages": []}})
+    write_yaml(os.path.join(config, "OSImage-photon.yml"), {
+        "kind": tkg_byoi.osimage_api_kind, "metadata": {"name": "photon"},
+        "spec": {"os": {"name": "photon", "version": "5", "arch": "amd64"}, "image": {"ref": {"name": "photon"}}}})
+    write_yaml(os.path.join(config, "ClusterBootstrapTemplate.yml"), {
+        "kind": tkg_byoi.cbt_api_kind, "metadata": {"name": OLD_TKR_NAME},
+        "spec": dict({addon: {"valuesFrom": {"providerRef": {"name": "{}-{}".format(addon, OLD_TKR_NAME)}}}
+                      for addon in ["cni", "cpi", "csi", "kapp"]},
+                     additionalPackages=[{"valuesFrom": {"secretRef": "capabilities-" + OLD_TKR_NAME}}])})
+    write_yaml(os.path.join(config, "AntreaConfig.yml"), {
+        "kind": "AntreaConfig", "metadata": {"name": "antrea-" + OLD_TKR_NAME}})
+    for package in PACKAGES:
+        write_yaml(os.path.join(folder, "packages", package, "package.yml"), {
+            "kind": tkg_byoi.package_api_kind,
+            "spec": {"refName": "{}.tanzu.vmware.com".format(package), "template": {"spec": {"fetch": [
+                {"imgpkgBundle": {"image": "localhost:5000/tkg/packages/core/{}:v1".format(package)}}]}}}})
+    os.makedirs(os.path.join(folder, "packages", "kapp-controller"))
+    with open(os.path.join(folder, "packages", "kapp-controller", "package.yml"), 'w') as fp:
+        fp.write("kind: Package\nspec:\n  refName: kapp-controller.tanzu.vmware.com\n  template:\n"
+                 "    image: localhost:5000/tkg/packages/core/kapp-controller:v0.50@sha256:0\n")
+
+
+class SetupTest(unittest.TestCase):
+    def test_setup_with_shared_tkr_metadata_source(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "tkr-metadata-cache", "digest")
+            overlay = os.path.join(tmp, "tkr-metadata")
+            write_tkr_metadata(source)
+            kubernetes_config = os.path.join(tmp, "kubernetes_config.json")
+            with open(kubernetes_config, 'w') as fp:
+                json.dump({"kubernetes": "v1.32.0+vmware.1", "image_version": "v1.32.0", "etcd": "v3.5.16",
+                           "coredns": "v1.11.3", "docker_distribution": "v2.8"}, fp)
+            os.makedirs(os.path.join(tmp, "ovas"))
+            args = tkg_byoi.parse_args([
+                "setup", "--kubernetes_config", kubernetes_config, "--os_type", "photon-5",
+                "--host_ip", "127.0.0.1", "--default_config_folder", os.path.join(ROOT, "packer-variables"),
+                "--tkr_metadata_folder", overlay, "--tkr_metadata_source", source, "--tkr_suffix", "byoi",
+                "--dest_config", tmp, "--ova_destination_folder", os.path.join(tmp, "ovas"),
+                "--ova_ts_suffix", "20260101000000"])
+
+            context = tkg_byoi.setup(args)
+
+            self.assertEqual(context.jinja_args_map["kapp_controller_localhost_path"],
+                             "localhost:5000/tkg/packages/core/kapp-controller:v0.50")
+            with open(os.path.join(overlay, "config", "TanzuKubernetesRelease.yml"), 'r') as fp:
+                self.assertEqual(yaml.safe_load(fp)["metadata"]["name"], "v1.32.0---vmware.1-byoi")
+            self.assertTrue(os.path.islink(os.path.join(overlay, "packages")))
+            # The shared source is left untouched
+            with open(os.path.join(source, "config", "TanzuKubernetesRelease.yml"), 'r') as fp:
+                self.assertEqual(yaml.safe_load(fp)["metadata"]["name"], OLD_TKR_NAME)
+
+
+class PerformanceProfileTest(unittest.TestCase):
+    def test_profile_overrides_goss_default(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            args = argparse.Namespace(os_type="photon-5", dest_config=tmp)
+            packer_vars = {"performance_profile": "high-throughput", "ansible_user_vars": "",
+                           "goss_vars_file": os.path.join(ROOT, "goss", "goss-vars.yaml")}
+            context = tkg_byoi.ByoiContext(args)
+            context.packer_vars = packer_vars
+
+            tkg_byoi.apply_performance_profile(context)
+
+            with open(packer_vars["goss_vars_file"], 'r') as fp:
+                goss_vars = yaml.safe_load(fp)
+            self.assertEqual(goss_vars["performance_profile"], "high-throughput")
+            self.assertIn("high-throughput", goss_vars["performance_profiles"])
+
+    def test_default_goss_vars_define_profile(self):
+        with open(os.path.join(ROOT, "goss", "goss-vars.yaml"), 'r') as fp:
+            goss_vars = yaml.safe_load(fp)
+        self.assertEqual(goss_vars["performance_profile"], "")
+        self.assertFalse(goss_vars["boot_profile"])
+
+    def test_boot_profile_enables_goss_check(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            args = argparse.Namespace(os_type="ubuntu-2204-efi", dest_config=tmp)
+            context = tkg_byoi.ByoiContext(args)
+            context.packer_vars = {"goss_vars_file": os.path.join(ROOT, "goss", "goss-vars.yaml")}
+
+            with mock.patch.dict(os.environ, {"BOOT_PROFILE": "true"}):
+                tkg_byoi.apply_boot_profile(context)
+
+            with open(context.packer_vars["goss_vars_file"], 'r') as fp:
+                self.assertTrue(yaml.safe_load(fp)["boot_profile"])
+
+
+class CopyFileTest(unittest.TestCase):
+    def test_copy_replaces_hardlinked_destination(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src, dst, store_object = [os.path.join(tmp, name) for name in ["src.ova", "dst.ova", "object"]]
+            with open(src, 'w') as fp:
+                fp.write("new")
+            with open(store_object, 'w') as fp:
+                fp.write("old")
+            os.link(store_object, dst)
+
+            tkg_byoi.copy_file(src, dst)
+
+            with open(dst, 'r') as fp:
+                self.assertEqual(fp.read(), "new")
+            with open(store_object, 'r') as fp:
+                self.assertEqual(fp.read(), "old")
+            self.assertEqual(sorted(os.listdir(tmp)), ["dst.ova", "object", "src.ova"])
+
+
+class CopyOvaTest(unittest.TestCase):
+    def write_build(self, root, ova_ts_suffix, content):
+        """
+        Packer output folder of a photon-5 build whose files all contain content.
+        """
+        output = os.path.join(root, "output", "photon-5-kube-v1.32.0-{}".format(ova_ts_suffix))
+        os.makedirs(output)
+        for filename in ["photon-5-v1.32.0---vmware.1.ova", "package_list.json", "kernel.config",
+                         "os_manifest.json", "kernel_tunables.tgz", "repo_sources.tgz", "goss_results.json"]:
+            with open(os.path.join(output, filename), 'w') as fp:
+                fp.write(content)
+
+    def test_concurrent_builds_keep_their_own_sidecars(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            write_tkr_metadata(os.path.join(tmp, "tkr-metadata"))
+            kubernetes_config = os.path.join(tmp, "kubernetes_config.json")
+            with open(kubernetes_config, 'w') as fp:
+                json.dump({"kubernetes": "v1.32.0+vmware.1"}, fp)
+            ovas = os.path.join(tmp, "ovas")
+            os.makedirs(ovas)
+            store = os.path.join(tmp, "store")
+
+            def copy_ova_args(ova_ts_suffix):
+                self.write_build(tmp, ova_ts_suffix, "build " + ova_ts_suffix)
+                return tkg_byoi.parse_args([
+                    "copy_ova", "--kubernetes_config", kubernetes_config, "--os_type", "photon-5",
+                    "--tkr_metadata_folder", os.path.join(tmp, "tkr-metadata"), "--ova_destination_folder", ovas,
+                    "--ova_ts_suffix", ova_ts_suffix, "--image_builder_root", tmp, "--artifacts_store", store])
+
+            # The second build copies its files while the first one is being added to the store
+            add_build = tkg_byoi.artifacts_store.add_build
+            def add_build_with_concurrent_build(*args):
+                if args[1].endswith("1"):
+                    tkg_byoi.copy_ova(copy_ova_args("2"))
+                return add_build(*args)
+
+            with mock.patch.object(tkg_byoi.artifacts_store, "add_build", add_build_with_concurrent_build):
+                tkg_byoi.copy_ova(copy_ova_args("1"))
+
+            for ova_ts_suffix in ["1", "2"]:
+                build = os.path.join(store, "builds", "photon-5-v1.32.0---vmware.1-" + ova_ts_suffix)
+                self.assertEqual(sorted(os.listdir(build)), sorted([
+                    "photon.ova", "package_list.json", "kernel.config", "os_manifest.json",
+                    "kernel_tunables.tgz", "repo_sources.tgz", "goss_results.json"]))
+                for filename in os.listdir(build):
+                    with open(os.path.join(build, filename), 'r') as fp:
+                        self.assertEqual(fp.read(), "build " + ova_ts_suffix)
+            # The ovas folder has the files of the last build that finished
+            with open(os.path.join(ovas, "package_list.json"), 'r') as fp:
+                self.assertEqual(fp.read(), "build 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+# usage: python3 -m unittest discover -s scripts/tests
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import random
+import struct
+import tarfile
+import tempfile
+import unittest
+import zlib
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+spec = importlib.util.spec_from_file_location("tkgs_ova_delta", os.path.join(ROOT, "hack", "tkgs-ova-delta.py"))
+tkgs_ova_delta = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tkgs_ova_delta)
+
+SECTOR_SIZE = tkgs_ova_delta.SECTOR_SIZE
+GRAIN_SIZE = 4096
+GRAINS = 8
+# Marker type of a grain table followed by its metadata sectors
+VMDK_MARKER_GT = 1
+
+
+def pad(data):
+    return data + b'\0' * (-len(data) % SECTOR_SIZE)
+
+
+def grain(lba, seed):
+    """
+    Grain marker with its data, zlib level 0 keeps the size of every grain the
+    same so the VMDK and its tar header only change through the grain contents.
+    """
+    data = random.Random(seed).randbytes(GRAIN_SIZE)
+    compressed = zlib.compress(data, 0)
+    return pad(struct.pack('<QI', lba, len(compressed)) + compressed)
+
+
+def stream_optimized_vmdk(seeds):
+    """
+    Minimal stream-optimized sparse extent: header, one grain per seed, a grain
+    table marker and the end of stream marker.
+    """
+    header = struct.pack(tkgs_ova_delta.VMDK_HEADER_FORMAT, tkgs_ova_delta.VMDK_MAGIC, 3, 0x30001,
+                         len(seeds) * GRAIN_SIZE // SECTOR_SIZE, GRAIN_SIZE // SECTOR_SIZE, 0, 0, 512, 0, 0, 1)
+    grains = [grain(lba * GRAIN_SIZE // SECTOR_SIZE, seed) for lba, seed in enumerate(seeds)]
+    grain_table = pad(struct.pack(tkgs_ova_delta.VMDK_MARKER_FORMAT, 1, 0, VMDK_MARKER_GT)) + b'\1' * SECTOR_SIZE
+    eos = pad(struct.pack(tkgs_ova_delta.VMDK_MARKER_FORMAT, 0, 0, tkgs_ova_delta.VMDK_MARKER_EOS))
+    return pad(header) + b''.join(grains) + grain_table + eos, grains
+
+
+def write_ova(path, vmdk):
+    with tarfile.open(path, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        for name, data in [("photon-5.ovf", b"<Envelope/>\n" * 100), ("photon-5-disk1.vmdk", vmdk)]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1700000000
+            tar.addfile(info, io.BytesIO(data))
+
+
+class OvaDeltaTest(unittest.TestCase):
+    def test_apply_rebuilds_target_from_changed_grains(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base, target, delta, rebuilt = [os.path.join(tmp, name) for name in [
+                "base.ova", "target.ova", "delta.tar", "rebuilt.ova"]]
+            base_seeds = list(range(GRAINS))
+            target_seeds = list(base_seeds)
+            target_seeds[2] = 100
+            target_seeds[5] = 101
+            write_ova(base, stream_optimized_vmdk(base_seeds)[0])
+            target_vmdk, target_grains = stream_optimized_vmdk(target_seeds)
+            write_ova(target, target_vmdk)
+
+            tkgs_ova_delta.create_delta(base, target, delta)
+            tkgs_ova_delta.apply_delta(base, delta, rebuilt)
+
+            with open(target, 'rb') as expected, open(rebuilt, 'rb') as actual:
+                self.assertEqual(actual.read(), expected.read())
+            with tarfile.open(delta, mode='r:') as tar:
+                recipe = json.load(tar.extractfile(tkgs_ova_delta.DELTA_RECIPE_NAME))
+            self.assertEqual(sorted(digest for digest, _, _ in recipe["new_chunks"]),
+                             sorted(hashlib.sha256(target_grains[index]).hexdigest() for index in [2, 5]))
+
+    def test_identical_ovas_need_no_new_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base, target, delta, rebuilt = [os.path.join(tmp, name) for name in [
+                "base.ova", "target.ova", "delta.tar", "rebuilt.ova"]]
+            vmdk = stream_optimized_vmdk(range(GRAINS))[0]
+            write_ova(base, vmdk)
+            write_ova(target, vmdk)
+
+            tkgs_ova_delta.create_delta(base, target, delta)
+            tkgs_ova_delta.apply_delta(base, delta, rebuilt)
+
+            with tarfile.open(delta, mode='r:') as tar:
+                self.assertEqual(json.load(tar.extractfile(tkgs_ova_delta.DELTA_RECIPE_NAME))["new_chunks"], [])
+            with open(rebuilt + ".sha256", 'r') as fp:
+                self.assertEqual(fp.read(), tkgs_ova_delta.sha256(target))
+
+
+if __name__ == '__main__':
+    unittest.main()
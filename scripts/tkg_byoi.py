@@ -4,16 +4,18 @@
 import argparse
 import json
 import os
+import re
 import shutil
 import semver
+import tempfile
 
 import yaml
 from jinja2 import Environment, BaseLoader
 
-# Dictionary to store the Jinja Variables that stores data
-# about kubernetes version and URLs
-jinja_args_map = {}
-packer_vars = {}
+import artifacts_store
+import build_profiler
+
+default_image_builder_root = "/image-builder/images/capi"
 
 tkr_api_kind = "TanzuKubernetesRelease"
 osimage_api_kind = "OSImage"
@@ -23,8 +25,24 @@ package_api_kind = "Package"
 max_k8s_object_name_length = 63
 max_tkr_suffix_length = 8
 
+# Packer variables passed to the ansible role as extra variables when not empty
+ansible_packer_variables = ["containerd_max_concurrent_downloads", "containerd_image_pull_progress_timeout",
+                            "registry_log_level", "registry_blobdescriptor_cache"]
+
 
-def parse_args():
+class ByoiContext():
+    """
+    State of a single node image setup, allows several OS targets and
+    Kubernetes versions to be prepared in the same process.
+    """
+    def __init__(self, args):
+        self.args = args
+        # Jinja variables that store data about kubernetes version and URLs
+        self.jinja_args_map = {}
+        self.packer_vars = {}
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description='Script to setup the Packer Variables for TKG BYOI')
     sub_parsers = parser.add_subparsers(
@@ -44,6 +62,9 @@ def parse_args():
                              help='Path to default packer variable configuration folder')
     setup_group.add_argument('--tkr_metadata_folder', required=True,
                              help='Path to TKR metadata')
+    setup_group.add_argument('--tkr_metadata_source', required=False,
+                             help='Path to the extracted TKR metadata shared by the builds of the release, '
+                                  'the updated metadata is written to --tkr_metadata_folder')
     setup_group.add_argument('--tkr_suffix', required=False,
                              help='Suffix to be added to the TKR, OVA and OSImage')
     setup_group.add_argument('--dest_config', required=True,
@@ -58,6 +79,9 @@ def parse_args():
     setup_group.add_argument('--override_package_repositories', required=False,
                              default=None,
                              help='Comma delimited string containing the names of files to override the image containing repository definitions. The files should be given as absolute paths')
+    setup_group.add_argument('--image_builder_root', required=False,
+                             default=default_image_builder_root,
+                             help='Image builder root folder, default value is {}'.format(default_image_builder_root))
 
     ova_copy_group = sub_parsers.add_parser("copy_ova")
     ova_copy_group.add_argument('--kubernetes_config', required=True,
@@ -72,7 +96,13 @@ def parse_args():
                                 help='Destination folder to copy the OVA after changing the name')
     ova_copy_group.add_argument('--ova_ts_suffix', required=True,
                                 help='Suffix to be attached to generate the OVA name')
-    args = parser.parse_args()
+    ova_copy_group.add_argument('--image_builder_root', required=False,
+                                default=default_image_builder_root,
+                                help='Image builder root folder, default value is {}'.format(default_image_builder_root))
+    ova_copy_group.add_argument('--artifacts_store', required=False,
+                                default=None,
+                                help='Content addressed store folder where the OVA and the other build files are added')
+    args = parser.parse_args(argv)
     return args
 
 
@@ -87,26 +117,31 @@ def main():
 def setup(args):
     """
     Parse and template the Jinja files present in the packer-variables folder.
+    Returns the ByoiContext holding the Jinja arguments and packer variables.
     """
-    global jinja_args_map
-
-    populate_jinja_args(args)
+    context = ByoiContext(args)
+    populate_jinja_args(context)
 
-    render_default_config(args)
-    json.dump(packer_vars, open(os.path.join(
-        args.dest_config, 'packer-variables.json'), 'w'), indent=4)
+    render_default_config(context)
+    forward_ansible_packer_variables(context)
+    apply_performance_profile(context)
+    apply_boot_profile(context)
+    with open(os.path.join(args.dest_config, 'packer-variables.json'), 'w') as fp:
+        json.dump(context.packer_vars, fp, indent=4)
 
-    update_tkr_metadata(args)
+    with build_profiler.span("update_tkr_metadata"):
+        update_tkr_metadata(args)
+    return context
 
 
-def populate_jinja_args(args):
+def populate_jinja_args(context):
     """
     Populate the key value pairs for Jinja templates based on the kubernetes configuration
     file downloaded from the artifacts container.
     """
-    global jinja_args_map
-
-    jinja_args_map = vars(args)
+    args = context.args
+    jinja_args_map = context.jinja_args_map
+    jinja_args_map.update(vars(args))
     kubernetes_args = {}
     with open(args.kubernetes_config, 'r') as fp:
         kubernetes_args = json.loads(fp.read())
@@ -133,6 +168,10 @@ def populate_jinja_args(args):
     jinja_args_map["use_artifact_server_goss"] = False
     if semver.Version.parse(kubernetes_series).compare("1.31.0") >= 0:
         jinja_args_map["use_artifact_server_goss"] = True
+    # Number of goss checks validated concurrently, goss defaults to 50
+    jinja_args_map["goss_max_concurrent"] = os.environ.get("GOSS_MAX_CONCURRENT", "")
+    # Node performance profile, empty keeps the OS defaults
+    jinja_args_map["performance_profile"] = os.environ.get("PERFORMANCE_PROFILE", "")
 
     # capabilities-package is not present for TKrs starting v1.31.x. capabilities_package_present can be
     # used to determine if carvel package of capabilites should be present depending on the TKr version.
@@ -155,7 +194,8 @@ def get_images_local_host_path(args):
     TKR metadata that will be used for by imgpkg to upload the
     thick tar files to local docker registry during the image build.
     """
-    packages_folder = os.path.join(args.tkr_metadata_folder, "packages")
+    # The overlay in tkr_metadata_folder is only written by update_tkr_metadata
+    packages_folder = os.path.join(args.tkr_metadata_source or args.tkr_metadata_folder, "packages")
     localhost_paths = {}
     kapp_key_name = ''
     kapp_file = ''
@@ -204,7 +244,7 @@ def copy_ova(args):
     """
     Copy the OVA from output folder to destination folder after changing the OVA name.
     """
-    default_ova_destination_folder = '/image-builder/images/capi/output/{}-kube-{}-{}/'
+    default_ova_destination_folder = os.path.join(args.image_builder_root, 'output', '{}-kube-{}-{}/')
     config_folder = os.path.join(args.tkr_metadata_folder, "config")
     new_ova_name = ''
     for filename in os.listdir(config_folder):
@@ -219,8 +259,7 @@ def copy_ova(args):
                     new_ova_name = "{}.ova".format(
                         yaml_doc["spec"]["image"]["ref"]["name"])
     if not new_ova_name:
-        print("Matching OSImage Spec not found in metadata")
-        exit(1)
+        raise Exception("Matching OSImage Spec not found in metadata")
 
     old_ova_name = ''
     with open(args.kubernetes_config, 'r') as fp:
@@ -231,103 +270,165 @@ def copy_ova(args):
         old_ova_name = "{}-{}.ova".format(args.os_type,
                                           kubernetes_args["kubernetes"].replace('+', '---'))
 
-    new_path = os.path.join(args.ova_destination_folder, new_ova_name)
-    old_path = os.path.join(default_ova_destination_folder, old_ova_name)
-    print("Copying OVA from {} to {}".format(old_path, new_path))
-    shutil.copyfile(old_path, new_path)
+    # Files of the build by their name in the destination folder, they are
+    # taken from the packer output folder of the build which is not shared
+    sources = {new_ova_name: os.path.join(default_ova_destination_folder, old_ova_name)}
 
     # Do the below only for linux based OSes
     # We are assuming here that if its not windows based, its linux based (since we do not generate for MacOS)
     if not args.os_type.startswith("windows"):
-        # Copy the package list
-        old_path = os.path.join(default_ova_destination_folder, "package_list.json")
-        new_path = os.path.join(args.ova_destination_folder, "package_list.json")
-        print("Copying package list file from {} to {}".format(old_path, new_path))
-        shutil.copyfile(old_path, new_path)
-
-        # Copy the kernel config file
-        old_path = os.path.join(default_ova_destination_folder, "kernel.config")
-        new_path = os.path.join(args.ova_destination_folder, "kernel.config")
-        print("Copying kernel config file from {} to {}".format(old_path, new_path))
-        shutil.copyfile(old_path, new_path)
-
-        # Copy the OS manifest file
-        old_path = os.path.join(default_ova_destination_folder, "os_manifest.json")
-        new_path = os.path.join(args.ova_destination_folder, "os_manifest.json")
-        print("Copying OS manifest file from {} to {}".format(old_path, new_path))
-        shutil.copyfile(old_path, new_path)
-
-        # Copy the Kernel Tunable details
-        old_path = os.path.join(default_ova_destination_folder, "kernel_tunables.tgz")
-        new_path = os.path.join(args.ova_destination_folder, "kernel_tunables.tgz")
-        print("Copying kernel tunables from {} to {}".format(old_path, new_path))
-        shutil.copyfile(old_path, new_path)
-
-        # Copy the Source repo details
-        old_path = os.path.join(default_ova_destination_folder, "repo_sources.tgz")
-        new_path = os.path.join(args.ova_destination_folder, "repo_sources.tgz")
-        print("Copying repo source details from {} to {}".format(old_path, new_path))
-        shutil.copyfile(old_path, new_path)
-        
+        # Package list, kernel config, OS manifest, kernel tunables and source repo details
+        for filename in ["package_list.json", "kernel.config", "os_manifest.json", "kernel_tunables.tgz",
+                         "repo_sources.tgz"]:
+            sources[filename] = os.path.join(default_ova_destination_folder, filename)
+
+        # Performance and boot profiles, image unpack and slimming reports, only generated when
+        # enabled, and the goss results with the summary of the slowest checks
+        for filename in ["performance_profile.json", "boot_profile.json", "image_unpack.json", "image_slim.json",
+                         "goss_results.json", "goss_summary.json"]:
+            old_path = os.path.join(default_ova_destination_folder, filename)
+            if os.path.exists(old_path):
+                sources[filename] = old_path
+
+    build_folder = None
+    if args.artifacts_store:
+        build_id = "{}-{}-{}".format(args.os_type, kubernetes_args["kubernetes"].replace('+', '---'), args.ova_ts_suffix)
+        artifacts_store.add_build(args.artifacts_store, build_id, sources, {
+            "os_type": args.os_type,
+            "kubernetes_version": kubernetes_args["kubernetes"],
+            "tkr_suffix": args.tkr_suffix,
+            "ova_ts_suffix": args.ova_ts_suffix,
+            "ova": new_ova_name,
+            # Set by build-scheduler.py to find the build of a job
+            "job_id": os.environ.get("BUILD_JOB_ID", ""),
+        })
+        build_folder = os.path.join(args.artifacts_store, "builds", build_id)
+        print("Added build {} to the artifacts store {}".format(build_id, args.artifacts_store))
+
+    for filename, old_path in sources.items():
+        new_path = os.path.join(args.ova_destination_folder, filename)
+        print("Copying {} to {}".format(old_path, new_path))
+        if build_folder is None:
+            copy_file(old_path, new_path)
+            continue
+        try:
+            artifacts_store.link(os.path.join(build_folder, filename), new_path)
+        except OSError:
+            # Destination folder on another file system than the store
+            copy_file(old_path, new_path)
+
     print("Copying completed")
 
 
+def copy_file(src, dst):
+    """
+    Copy through a temporary file so an existing dst, which can be a hardlink
+    to an artifacts store object, is replaced instead of overwritten. The
+    temporary file is unique, concurrent builds can share the folder of dst.
+    """
+    fd, tmp_file = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(dst)), dir=os.path.dirname(dst))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_file)
+        shutil.copymode(src, tmp_file)
+        os.replace(tmp_file, dst)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def load_tkr_config(config_folder):
+    """
+    Parse the TKR metadata config files once, returns the file name -> YAML documents.
+    """
+    config = {}
+    for filename in sorted(os.listdir(config_folder)):
+        with open(os.path.join(config_folder, filename), 'r') as fp:
+            config[filename] = list(yaml.safe_load_all(fp))
+    return config
+
+
 def update_tkr_metadata(args):
     """
     Reads the TKR metadata like Addon Config, TKR, CBT and Package objects
     that are downloaded from the artifacts containers and updates the TKR,
     CBT and Addon config objects name based on the <kubernetes_version>-<tkr_suffix>
+
+    The objects are renamed in memory. When tkr_metadata_source is set it is
+    left untouched, the updated config files are written to tkr_metadata_folder
+    and the other folders are linked from the source, so the builds of the same
+    release share one extracted metadata tree.
     """
-    config_folder = os.path.join(args.tkr_metadata_folder, "config")
+    source_folder = args.tkr_metadata_source or args.tkr_metadata_folder
+    config = load_tkr_config(os.path.join(source_folder, "config"))
     kubernetes_version = None
     old_tkr_name = None
-    tkr_file = None
-    cbt_file = None
-    osimage_files = []
-    addons_files = []
-    for filename in os.listdir(config_folder):
-        file = os.path.join(config_folder, filename)
-        with open(file, 'r') as fp:
-            yaml_docs = yaml.safe_load_all(fp)
-            for yaml_doc in yaml_docs:
-                if yaml_doc["kind"] == tkr_api_kind:
-                    # kubernetes version contains + which is not a supported character
-                    # so replace + with ---
-                    kubernetes_version = yaml_doc["spec"]["kubernetes"]["version"].replace(
-                        '+', '---')
-                    tkr_file = file
-                    old_tkr_name = yaml_doc["metadata"]["name"]
-                elif yaml_doc["kind"] == osimage_api_kind:
-                    osimage_files.append(file)
-                elif yaml_doc["kind"] == cbt_api_kind:
-                    cbt_file = file
-                else:
-                    if file not in addons_files:
-                        addons_files.append(file)
+    tkr_doc = None
+    cbt_doc = None
+    osimage_docs = []
+    addon_docs = []
+    for yaml_docs in config.values():
+        for yaml_doc in yaml_docs:
+            if yaml_doc["kind"] == tkr_api_kind:
+                # kubernetes version contains + which is not a supported character
+                # so replace + with ---
+                kubernetes_version = yaml_doc["spec"]["kubernetes"]["version"].replace(
+                    '+', '---')
+                tkr_doc = yaml_doc
+                old_tkr_name = yaml_doc["metadata"]["name"]
+            elif yaml_doc["kind"] == osimage_api_kind:
+                osimage_docs.append(yaml_doc)
+            elif yaml_doc["kind"] == cbt_api_kind:
+                cbt_doc = yaml_doc
+            else:
+                addon_docs.append(yaml_doc)
 
     new_osimages = []
-    for osimage_file in osimage_files:
-        new_osimage_name = ''
-        with open(osimage_file, 'r') as fp:
-            yaml_doc = yaml.safe_load(fp)
-            # Create new OSImage name based on the OS Name, version and architecture.
-            new_osimage_name = format_name(args.tkr_suffix,
-                                           yaml_doc["spec"]["os"]["name"],
-                                           yaml_doc["spec"]["os"]["version"].replace(
-                                               '.', ''),
-                                           yaml_doc["spec"]["os"]["arch"],
-                                           kubernetes_version)
-            new_osimages.append({"name": new_osimage_name})
-            if yaml_doc["spec"]["os"]["name"].lower() in args.os_type.lower():
-                check_ova_file(new_osimage_name, args.ova_destination_folder)
-        update_osimage(osimage_file, new_osimage_name)
+    for osimage_doc in osimage_docs:
+        # Create new OSImage name based on the OS Name, version and architecture.
+        new_osimage_name = format_name(args.tkr_suffix,
+                                       osimage_doc["spec"]["os"]["name"],
+                                       osimage_doc["spec"]["os"]["version"].replace(
+                                           '.', ''),
+                                       osimage_doc["spec"]["os"]["arch"],
+                                       kubernetes_version)
+        new_osimages.append({"name": new_osimage_name})
+        if osimage_doc["spec"]["os"]["name"].lower() in args.os_type.lower():
+            check_ova_file(new_osimage_name, args.ova_destination_folder)
+        update_osimage(osimage_doc, new_osimage_name)
 
     new_tkr_name = format_name(args.tkr_suffix, kubernetes_version)
-    update_tkr(tkr_file, new_tkr_name, new_osimages)
-    update_cbt(cbt_file, new_tkr_name, old_tkr_name, new_tkr_name)
+    update_tkr(tkr_doc, new_tkr_name, new_osimages)
+    update_cbt(cbt_doc, new_tkr_name, old_tkr_name, new_tkr_name)
+
+    for addon_doc in addon_docs:
+        update_addon_config(addon_doc, old_tkr_name, new_tkr_name)
+
+    write_tkr_metadata(source_folder, args.tkr_metadata_folder, config)
+
 
-    for addon_file in addons_files:
-        update_addon_config(addon_file, old_tkr_name, new_tkr_name)
+def write_tkr_metadata(source_folder, overlay_folder, config):
+    """
+    Write the updated config files to the overlay folder through temporary files
+    and atomic renames, the other entries of the source folder are linked. The
+    files are updated in place when both folders are the same.
+    """
+    config_folder = os.path.join(overlay_folder, "config")
+    os.makedirs(config_folder, exist_ok=True)
+    if not os.path.samefile(source_folder, overlay_folder):
+        for name in os.listdir(source_folder):
+            link = os.path.join(overlay_folder, name)
+            if name == "config" or (os.path.exists(link) and not os.path.islink(link)):
+                continue
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(os.path.join(os.path.abspath(source_folder), name), link)
+
+    for filename, yaml_docs in config.items():
+        file = os.path.join(config_folder, filename)
+        with open(file + ".tmp", 'w') as fp:
+            yaml.dump_all(yaml_docs, fp)
+        os.replace(file + ".tmp", file)
 
 
 def check_ova_file(new_osimage_name, ova_destination_folder):
@@ -341,57 +442,39 @@ def check_ova_file(new_osimage_name, ova_destination_folder):
                 "OVA {}.ova already exists in the OVA folder".format(new_osimage_name))
 
 
-def update_addon_config(addon_file, old_tkr_name, new_tkr_name):
+def update_addon_config(yaml_doc, old_tkr_name, new_tkr_name):
     """
     Update the Addon Config object name. (For updating the data on CBT refer to update_cbt function)
     """
-    addon_data = []
-    with open(addon_file, 'r') as os_fp:
-        temp_addon_data = yaml.safe_load_all(os_fp)
-        for yaml_doc in temp_addon_data:
-            old_name = yaml_doc["metadata"]["name"]
-            new_name = old_name.replace(old_tkr_name, new_tkr_name)
-            yaml_doc["metadata"]["name"] = new_name
-            print("{} name changed from {} to {}".format(
-                yaml_doc["kind"], old_name, new_name))
-            addon_data.append(yaml_doc)
-
-    with open(addon_file, 'w') as os_fp:
-        yaml.dump_all(addon_data, os_fp)
+    old_name = yaml_doc["metadata"]["name"]
+    new_name = old_name.replace(old_tkr_name, new_tkr_name)
+    yaml_doc["metadata"]["name"] = new_name
+    print("{} name changed from {} to {}".format(
+        yaml_doc["kind"], old_name, new_name))
 
 
-def update_osimage(osimage_file, osimage_name):
+def update_osimage(osimage_data, osimage_name):
     """
     Update OSImage object with the new name
     """
-    osimage_data = ''
-    with open(osimage_file, 'r') as os_fp:
-        osimage_data = yaml.safe_load(os_fp)
     osimage_data["metadata"]["name"] = osimage_name
     osimage_data["spec"]["image"]["ref"]["name"] = osimage_name
     print("New OSImage Name for {} is {}".format(
         osimage_data["spec"]["os"]["name"], osimage_name))
-    with open(osimage_file, 'w') as os_fp:
-        yaml.dump(osimage_data, os_fp)
 
 
-def update_tkr(tkr_file, tkr_name, osimages):
+def update_tkr(tkr_data, tkr_name, osimages):
     """
     Update the TKR object with the new name based on kubernetes and suffix.
     New name format is <kuberneter_version>-<tkr_suffix>
     """
-    tkr_data = ''
-    with open(tkr_file, 'r') as fp:
-        tkr_data = yaml.safe_load(fp)
     tkr_data["metadata"]["name"] = tkr_name
     tkr_data["spec"]["osImages"] = osimages
     tkr_data["spec"]["version"] = tkr_name.replace('---', '+')
-    with open(tkr_file, 'w') as fp:
-        yaml.dump(tkr_data, fp)
     print("New TKR Name:", tkr_name)
 
 
-def update_cbt(cbt_file, cbt_name, old_tkr_name, new_tkr_name):
+def update_cbt(cbt_data, cbt_name, old_tkr_name, new_tkr_name):
     """
     Updates the CBT with new data like
     - Name of CBT.
@@ -400,9 +483,6 @@ def update_cbt(cbt_file, cbt_name, old_tkr_name, new_tkr_name):
     - Updates the Package secret names like capabilites, guest cluster auth service
       from old TKR reference to new TKR name reference.
     """
-    cbt_data = ''
-    with open(cbt_file, 'r') as fp:
-        cbt_data = yaml.safe_load(fp)
     cbt_data["metadata"]["name"] = cbt_name
     for addon in ["cni", "cpi", "csi", "kapp"]:
         cbt_data["spec"][addon]["valuesFrom"]["providerRef"]["name"] = \
@@ -414,8 +494,6 @@ def update_cbt(cbt_file, cbt_name, old_tkr_name, new_tkr_name):
                 cbt_data["spec"]["additionalPackages"][index]["valuesFrom"]["secretRef"] = \
                     cbt_data["spec"]["additionalPackages"][index]["valuesFrom"]["secretRef"].replace(old_tkr_name,
                                                                                                      new_tkr_name)
-    with open(cbt_file, 'w') as fp:
-        yaml.dump(cbt_data, fp)
     print("New CBT Name:", cbt_name)
 
 
@@ -438,14 +516,9 @@ def format_name(suffix, *default_values):
 
 def render_additional_packer_variables(additional_packer_variables, os_type):
     """
-    Creates a single JSON object after parses all files then
-    applies the Jinja2 templating using jinja_args_map dictionary.
+    Creates a single JSON object after parses all the additional packer variable files.
     """
     output = {}
-    env = Environment(
-        extensions=['jinja2_time.TimeExtension'],
-        loader=BaseLoader
-    )
     if additional_packer_variables is not None:
         additional_packer_var_files = additional_packer_variables.split(",")
         for variable_file in additional_packer_var_files:
@@ -456,14 +529,13 @@ def render_additional_packer_variables(additional_packer_variables, os_type):
     if os_type.startswith("windows")  and output.get("windows_admin_password") is None:
         windows_admin_password = os.environ.get("WINDOWS_ADMIN_PASSWORD")
         if windows_admin_password is None:
-            print("Either set `{}' in packer variables or set '{}' environment variable for OS type '{}'.` ".format("windows_admin_password", "WINDOWS_ADMIN_PASSWORD", os_type))
-            exit(1)
+            raise Exception("Either set `{}' in packer variables or set '{}' environment variable for OS type '{}'.` ".format("windows_admin_password", "WINDOWS_ADMIN_PASSWORD", os_type))
         output["windows_admin_password"] = windows_admin_password
     print("Additional Packer Variables: ", json.dumps(output, indent=4))
     return output
 
 
-def render_folder_and_append(folder, os_type):
+def render_folder_and_append(folder, os_type, jinja_args_map):
     """
     Creates a single JSON object after parses all files on a folder then
     applies the Jinja2 templating using jinja_args_map dictionary.
@@ -486,7 +558,7 @@ def render_folder_and_append(folder, os_type):
     for variable_file in os.listdir(folder):
         common_file = os.path.join(folder, variable_file)
         if os.path.isfile(common_file):
-            with open(common_file, 'r') as fp:
+            with open(common_file, 'r') as fp, build_profiler.span("render {}".format(variable_file)):
                 temp = env.from_string(fp.read())
                 output.update(json.loads(temp.render(jinja_args_map)))
 
@@ -495,21 +567,77 @@ def render_folder_and_append(folder, os_type):
             folder, '-'.join(os_type_tokens[0:len(os_type_tokens) - i]))
         if os.path.isdir(platform_directory):
             for platform_file in os.listdir(platform_directory):
-                with open(os.path.join(platform_directory, platform_file)) as fp:
+                with open(os.path.join(platform_directory, platform_file)) as fp, \
+                        build_profiler.span("render {}".format(os.path.join(os.path.basename(platform_directory), platform_file))):
                     temp = env.from_string(fp.read())
                     output.update(json.loads(temp.render(jinja_args_map)))
 
     return output
 
 
-def render_default_config(args):
+def render_default_config(context):
+    args = context.args
+    packer_vars = context.packer_vars
     packer_vars.update(render_folder_and_append(
-        args.default_config_folder, args.os_type))
+        args.default_config_folder, args.os_type, context.jinja_args_map))
     packer_vars.update(render_extra_repos(args.override_package_repositories))
     packer_vars.update(render_additional_packer_variables(
         args.additional_packer_variables, args.os_type))
 
 
+def forward_ansible_packer_variables(context):
+    """
+    Append the packer variables read by the ansible role to ansible_user_vars,
+    so they can be overridden through the additional packer variable files.
+    """
+    packer_vars = context.packer_vars
+    if context.args.os_type.startswith("windows"):
+        return
+    for name in ansible_packer_variables:
+        if packer_vars.get(name):
+            packer_vars["ansible_user_vars"] += " {}={}".format(name, packer_vars[name])
+
+
+def apply_performance_profile(context):
+    """
+    Pass the performance_profile packer variable to the ansible role and to goss,
+    through a copy of the goss vars file holding the selected profile.
+    """
+    packer_vars = context.packer_vars
+    performance_profile = packer_vars.get("performance_profile", "")
+    if not performance_profile or context.args.os_type.startswith("windows"):
+        return
+    packer_vars["ansible_user_vars"] += " performance_profile={}".format(performance_profile)
+    goss_vars_file = set_goss_var(context, "performance_profile", '"{}"'.format(performance_profile))
+    print("Performance profile {} applied, goss vars file {}".format(performance_profile, goss_vars_file))
+
+
+def apply_boot_profile(context):
+    """
+    Enable the boot time goss check when BOOT_PROFILE is set, the ansible role
+    then waits for the boot to finish before the checks run.
+    """
+    if os.environ.get("BOOT_PROFILE", "") != "true" or context.args.os_type.startswith("windows"):
+        return
+    set_goss_var(context, "boot_profile", "true")
+
+
+def set_goss_var(context, name, value):
+    """
+    Set a top level variable of the goss vars file in a copy of the file and
+    return the path of the copy.
+    """
+    packer_vars = context.packer_vars
+    goss_vars_file = os.path.join(context.args.dest_config, "goss-vars.yaml")
+    with open(packer_vars["goss_vars_file"], 'r') as fp:
+        goss_vars = fp.read()
+    with open(goss_vars_file, 'w') as fp:
+        fp.write(re.sub(r'^{}: .*$'.format(name), '{}: {}'.format(name, value), goss_vars, count=1,
+                        flags=re.MULTILINE))
+    packer_vars["goss_vars_file"] = goss_vars_file
+    return goss_vars_file
+
+
 def render_extra_repos(comma_sep_repo_list):
     output = {}
     if comma_sep_repo_list is not None:
@@ -526,4 +654,4 @@ def render_extra_repos(comma_sep_repo_list):
 
 
 if __name__ == "__main__":
-    main()
+    build_profiler.run(main, "tkg_byoi")
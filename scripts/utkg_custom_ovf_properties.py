@@ -17,69 +17,84 @@ import io
 import gzip
 import yaml
 
-custom_ovf_properties = {}
-version_maps = {}
-componentList = ""
-config_data_list = {}
-tkg_core_directory = "/image-builder/images/capi/tkr-metadata"
-config_directory = join(tkg_core_directory, 'config')
-packages_directory = join(tkg_core_directory, 'packages')
+import build_profiler
+
+default_image_builder_root = "/image-builder/images/capi"
 localhost_path = 'localhost:5000'
 
 
-def set_versions(args):
-    global version_maps
+# str_presenter helps you to format string
+def str_presenter(dumper, data):
+    if len(data.splitlines()) > 1:
+        return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|')
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
 
-    kubernetes_config = {}
-    with open(args.kubernetes_config, 'r') as fp:
-        kubernetes_config = json.loads(fp.read())
 
-    version_maps = {
-        "image": kubernetes_config["image_version"],
-        "k8s": kubernetes_config["kubernetes"],
-        "cloudInit": "22.4.2",
-        "coredns": kubernetes_config["coredns"],
-        "etcd": kubernetes_config["etcd"],
-    }
+class LiteralDumper(yaml.Dumper):
+    """
+    Dumper writing multi line strings as literal blocks, kept separate from
+    yaml.Dumper so the representer does not leak to other callers.
+    """
 
 
-def substitute_data(value, tkr_version):
-    subMap = {
-        'IMAGE_VERSION': version_maps['image'],
-        'CLOUD_INIT_VERSION': version_maps['cloudInit'],
-        'ETCD_VERSION': version_maps['etcd'].replace("+", "_"),
-        'COREDNS_VERSION': version_maps['coredns'].replace("+", "_"),
-        'KUBERNETES_VERSION': version_maps['k8s'],
-        'COMPATIBILITY_7_0_0_10100': 'true',
-        'COMPATIBILITY_7_0_0_10200': 'true',
-        'COMPATIBILITY_7_0_0_10300': 'true',
-        'COMPATIBILITY_VC_7_0_0_1_MP3': 'true',
-        'DIST_VERSION': tkr_version
-    }
-    value = string.Template(value).substitute(subMap)
-    value = json.dumps(json.loads(value))
-    return value
+LiteralDumper.add_representer(str, str_presenter)
 
 
-def fetch_addon_packages():
-    addon_packages = []
+def is_leaf(value):
+    return not isinstance(value, (dict, list)) and not (isinstance(value, str) and len(value.splitlines()) > 1)
 
-    for root, subdirectories, _ in os.walk(packages_directory):
-        for subdirectory in subdirectories:
-            addon_packages.append(join(packages_directory, subdirectory))
 
-    return addon_packages
+# leaf_presenters write the maps and lists holding only single line scalars in flow style
+def dict_leaf_presenter(dumper, data):
+    return dumper.represent_mapping('tag:yaml.org,2002:map', data,
+                                    flow_style=all(is_leaf(value) for value in data.values()))
 
 
-def downloadUtkgAddonFiles():
-    addon_packages = fetch_addon_packages()
-    return addon_packages
+def list_leaf_presenter(dumper, data):
+    return dumper.represent_sequence('tag:yaml.org,2002:seq', data, flow_style=all(is_leaf(value) for value in data))
+
+
+class CompactDumper(yaml.SafeDumper):
+    """
+    Dumper of the compact encoder, multi line strings are literal blocks and
+    the leaf maps and lists are written in flow style.
+    """
+
+
+class PlainScalar(str):
+    """
+    Unquoted scalar resolved as a bool, int, float or timestamp, kept as its
+    original text so canonicalization does not change values such as 1.10.
+    """
+
+
+PLAIN_SCALAR_TAGS = ['tag:yaml.org,2002:bool', 'tag:yaml.org,2002:int', 'tag:yaml.org,2002:float',
+                     'tag:yaml.org,2002:timestamp']
+PLAIN_SCALAR_TAG = 'tag:byoi,2025:plain'
+
+
+class CanonicalLoader(yaml.SafeLoader):
+    """
+    Loader of the compact encoder, the unquoted bool, int, float and timestamp
+    scalars are loaded as PlainScalar.
+    """
+
+
+CanonicalLoader.yaml_implicit_resolvers = {
+    first: [(PLAIN_SCALAR_TAG if tag in PLAIN_SCALAR_TAGS else tag, regexp) for tag, regexp in resolvers]
+    for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()}
+CanonicalLoader.add_constructor(PLAIN_SCALAR_TAG, lambda loader, node: PlainScalar(loader.construct_scalar(node)))
+
+
+def plain_scalar_presenter(dumper, data):
+    return dumper.represent_scalar(dumper.resolve(yaml.ScalarNode, data, (True, False)), data)
+
+
+CompactDumper.add_representer(str, str_presenter)
+CompactDumper.add_representer(PlainScalar, plain_scalar_presenter)
+CompactDumper.add_representer(dict, dict_leaf_presenter)
+CompactDumper.add_representer(list, list_leaf_presenter)
 
-# str_presenter helps you to format string
-def str_presenter(dumper, data):
-    if len(data.splitlines()) > 1:
-        return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|')
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
 
 def convert_to_xml(data):
     t = Text()
@@ -87,53 +102,276 @@ def convert_to_xml(data):
     return t.toxml()
 
 
-def create_non_addon_ovf_properties():
-    tkr_version, _ = fetch_tkr_data()
-    filenames = ["/image-builder/images/capi/vmware-system.guest.kubernetes.distribution.image.version.json",
-                 "/image-builder/images/capi/vmware-system.compatibilityoffering.json"]
-
-    for file in filenames:
-        with open(file) as f:
-            data = json.dumps(json.load(f))
-            data = substitute_data(data, tkr_version)
-            key = Path(file).stem
-            custom_ovf_properties[key] = convert_to_xml(data)
-
-def create_non_addon_VKr_constraints_ovf_properties():
-    filenames = [ join(tkg_core_directory,"vmware-system.kr.destination-semver-constraint.json"),
-                  join(tkg_core_directory,"vmware-system.kr.override-k8s-semver-version.json")]
-    for file in filenames:
-        try:
+class CustomOvfProperties():
+    """
+    Generates the custom OVF properties of a single node image. The state is
+    kept on the instance so several images can be processed in the same process.
+    """
+    def __init__(self, kubernetes_config, image_builder_root=default_image_builder_root,
+                 tkr_metadata_folder=None, compact=False):
+        self.image_builder_root = image_builder_root
+        self.compact = compact
+        self.size_report = []
+        self.tkg_core_directory = tkr_metadata_folder or join(image_builder_root, 'tkr-metadata')
+        self.config_directory = join(self.tkg_core_directory, 'config')
+        self.packages_directory = join(self.tkg_core_directory, 'packages')
+        self.custom_ovf_properties = {}
+        self.version_maps = {}
+        self.config_data_list = {}
+        self.set_versions(kubernetes_config)
+
+    def set_versions(self, kubernetes_config_file):
+        kubernetes_config = {}
+        with open(kubernetes_config_file, 'r') as fp:
+            kubernetes_config = json.loads(fp.read())
+
+        self.version_maps = {
+            "image": kubernetes_config["image_version"],
+            "k8s": kubernetes_config["kubernetes"],
+            "cloudInit": "22.4.2",
+            "coredns": kubernetes_config["coredns"],
+            "etcd": kubernetes_config["etcd"],
+        }
+
+    def generate(self):
+        """
+        Generate all the custom OVF properties and return them.
+        """
+        self.create_utkg_tkr_metadata_ovf_properties()
+        self.create_non_addon_ovf_properties()
+        self.create_non_addon_VKr_constraints_ovf_properties()
+        return self.custom_ovf_properties
+
+    def encode(self, data, name, is_yaml=True, addon=False):
+        """
+        Compress and base64 encode a property value and record its sizes. The
+        compact encoder canonicalizes the addon YAML before compressing it.
+        """
+        compact = self.compact and addon
+        entry = {"name": name, "compact": compact, "raw_bytes": len(data.encode('utf-8'))}
+        if self.compact:
+            entry["default_encoded_bytes"] = len(compress_and_base64_encode(data))
+            if compact and is_yaml:
+                data = canonicalize_yaml(data)
+            entry["canonical_bytes"] = len(data.encode('utf-8'))
+        encoded_data = compress_and_base64_encode(data, compact)
+        entry["encoded_bytes"] = len(encoded_data)
+        self.size_report.append(entry)
+        return encoded_data
+
+    def set_inner_data(self, data, name, version, addon=False):
+        return set_inner_data(data, name, version, encode=lambda text: self.encode(text, name, addon=addon))
+
+    def get_size_report(self):
+        """
+        Return the sizes of the encoded properties and of the OVF property values.
+        """
+        totals = {key: sum(entry.get(key, 0) for entry in self.size_report)
+                  for key in ["raw_bytes", "canonical_bytes", "default_encoded_bytes", "encoded_bytes"]
+                  if all(key in entry for entry in self.size_report)}
+        return {
+            "compact": self.compact,
+            "properties": self.size_report,
+            "totals": totals,
+            "ovf_property_bytes": sum(len(value) for value in self.custom_ovf_properties.values()),
+        }
+
+    def substitute_data(self, value, tkr_version):
+        version_maps = self.version_maps
+        subMap = {
+            'IMAGE_VERSION': version_maps['image'],
+            'CLOUD_INIT_VERSION': version_maps['cloudInit'],
+            'ETCD_VERSION': version_maps['etcd'].replace("+", "_"),
+            'COREDNS_VERSION': version_maps['coredns'].replace("+", "_"),
+            'KUBERNETES_VERSION': version_maps['k8s'],
+            'COMPATIBILITY_7_0_0_10100': 'true',
+            'COMPATIBILITY_7_0_0_10200': 'true',
+            'COMPATIBILITY_7_0_0_10300': 'true',
+            'COMPATIBILITY_VC_7_0_0_1_MP3': 'true',
+            'DIST_VERSION': tkr_version
+        }
+        value = string.Template(value).substitute(subMap)
+        value = json.dumps(json.loads(value))
+        return value
+
+    def fetch_addon_packages(self):
+        addon_packages = []
+
+        for root, subdirectories, _ in os.walk(self.packages_directory):
+            for subdirectory in subdirectories:
+                addon_packages.append(join(self.packages_directory, subdirectory))
+
+        return addon_packages
+
+    def downloadUtkgAddonFiles(self):
+        addon_packages = self.fetch_addon_packages()
+        return addon_packages
+
+    def create_non_addon_ovf_properties(self):
+        tkr_version, _ = self.fetch_tkr_data()
+        filenames = [join(self.image_builder_root, "vmware-system.guest.kubernetes.distribution.image.version.json"),
+                     join(self.image_builder_root, "vmware-system.compatibilityoffering.json")]
+
+        for file in filenames:
             with open(file) as f:
-                data = json.dumps(json.load(f)).replace('"','')
+                data = json.dumps(json.load(f))
+                data = self.substitute_data(data, tkr_version)
                 key = Path(file).stem
-                custom_ovf_properties[key] = convert_to_xml(compress_and_base64_encode(data))
+                self.custom_ovf_properties[key] = convert_to_xml(data)
+
+    def create_non_addon_VKr_constraints_ovf_properties(self):
+        filenames = [ join(self.tkg_core_directory,"vmware-system.kr.destination-semver-constraint.json"),
+                      join(self.tkg_core_directory,"vmware-system.kr.override-k8s-semver-version.json")]
+        for file in filenames:
+            try:
+                with open(file) as f:
+                    data = json.dumps(json.load(f)).replace('"','')
+                    key = Path(file).stem
+                    self.custom_ovf_properties[key] = convert_to_xml(self.encode(data, key, is_yaml=False))
+            except IOError:
+                print("couldn't find/read file: ",file)
+        #  special case to add static resources to ovf properties
+        static_resources_file = join(self.tkg_core_directory,"static-resources","vmware-system.kr.addon.staticresources.yaml")
+        try:
+            with open(static_resources_file, 'r') as file:
+                tkr_version, _ = self.fetch_tkr_data()
+                documents = list(yaml.safe_load_all(file))
+                data = yaml.dump_all(documents,Dumper=LiteralDumper,sort_keys=False,default_flow_style=False)
+                inner_data = self.set_inner_data(data, "staticresources", tkr_version, addon=True)
+                key = Path(static_resources_file).stem
+                self.custom_ovf_properties[key] = inner_data
         except IOError:
-            print("couldn't find/read file: ",file)
-    #  special case to add static resources to ovf properties
-    static_resources_file = join(tkg_core_directory,"static-resources","vmware-system.kr.addon.staticresources.yaml")
-    try:
-        with open(static_resources_file, 'r') as file:
-            tkr_version, _ = fetch_tkr_data()
-            yaml.add_representer(str,str_presenter)
-            documents = list(yaml.safe_load_all(file))
-            data = yaml.dump_all(documents,sort_keys=False,default_flow_style=False)
-            inner_data = set_inner_data(data, "staticresources", tkr_version)
-            key = Path(static_resources_file).stem
-            custom_ovf_properties[key] = inner_data
-    except IOError:
-        print("couldn't find/read static-resources file: ",static_resources_file)
-
-
-# fetch tkr apiversion and tkr version
-def fetch_tkr_data():
-    tkr_filename = "TanzuKubernetesRelease.yml"
-    with open(join(config_directory, tkr_filename), 'r') as file:
-        info = yaml.safe_load(file)
-        tkr_version = info["spec"]["version"]
-        api_version = info["apiVersion"]
-        file.close()
-    return tkr_version, api_version
+            print("couldn't find/read static-resources file: ",static_resources_file)
+
+    # fetch tkr apiversion and tkr version
+    def fetch_tkr_data(self):
+        tkr_filename = "TanzuKubernetesRelease.yml"
+        with open(join(self.config_directory, tkr_filename), 'r') as file:
+            info = yaml.safe_load(file)
+            tkr_version = info["spec"]["version"]
+            api_version = info["apiVersion"]
+            file.close()
+        return tkr_version, api_version
+
+    # fetch images path from the package CR
+    def fetch_image_path(self):
+        _, repo_url = self.fetch_tkr_data()
+        image_repo = ""
+        image_path_list = []
+        localhost_image_path_list = []
+        addon_packages = self.fetch_addon_packages()
+
+        with open(join(self.image_builder_root, "tkr-bom.yaml"), 'r') as file:
+            info = yaml.safe_load(file)
+            image_repo = info['imageConfig']['imageRepository']
+            tkg_core_package = info['components']['tkg-core-packages'][0]['images']
+
+        for addon_package in addon_packages:
+            package_name = addon_package.split("/")[-1]
+            image_path = fetch_addon_image_name(info, image_repo, tkg_core_package, package_name)
+            image_path_list.append(image_path)
+            if "kapp-controller" in addon_package:
+                localhost_image = fetch_kapp_controller_localhost_image(addon_package)
+                localhost_image_path_list.append(localhost_image)
+                continue
+            localhost_image = image_path.replace(image_path.split('/')[0], localhost_path)
+            localhost_image_path_list.append(":".join(localhost_image.split(":")[:-1]))
+
+        return image_path_list, localhost_image_path_list
+
+    # parse the data from config CR for each addon
+    def append_addon_config(self, data, addon_package):
+        if addon_package in self.config_data_list:
+            filename = self.config_data_list[addon_package]
+            self.config_data_list.pop(addon_package)
+            with open(filename, 'r') as file:
+                content = file.read()
+                if not content.endswith("\n"):
+                    content += "\n"
+                data = data + "---\n" + content
+
+        return data
+
+    def create_utkg_tkr_metadata_ovf_properties(self):
+        config_directory = self.config_directory
+        config_data_list = self.config_data_list
+        custom_ovf_properties = self.custom_ovf_properties
+        addon_packages = self.downloadUtkgAddonFiles()
+
+        # map config CR with corresponding Addon Package
+        for filename in os.listdir(config_directory):
+            is_addon = False
+            for addon_package in addon_packages:
+                addon_name = re.sub('[^A-Za-z0-9]+', '', Path(addon_package).stem.split(".")[0])
+                if "pv-csi" in addon_package:
+                    addon_name = "csi"
+
+                if addon_name in filename.lower():
+                    config_data_list[addon_package] = join(config_directory, filename)
+                    is_addon = True
+                    break
+            if not is_addon:
+                config_data_list[filename] = join(config_directory, filename)
+
+        # fetch TKR version
+        tkr_version, _ = self.fetch_tkr_data()
+
+        # add the custom_ovf_property for given list of addons
+        for addon_package in addon_packages:
+            data, info = fetch_file_contents(addon_package)
+            data = self.append_addon_config(data, addon_package)
+            add_on_version = info["spec"]["version"]
+
+            addon_name = Path(addon_package).stem.split(".")[0]
+            inner_data = self.set_inner_data(data, addon_name, add_on_version, addon=True)
+
+            # Renaming the guest-cluster-auth-service to gc-auth-service as the name of the add on becomes
+            # more than 63 chars which is not permissible for VirtualMachineImage Name
+            if addon_name == "guest-cluster-auth-service":
+                addon_name = "gc-auth-service"
+
+            if validate_addon_key_length("vmware-system.guest.kubernetes.addons." + addon_name):
+                custom_ovf_properties[f"vmware-system.guest.kubernetes.addons.{addon_name}"] = inner_data
+
+        # add OSImage, ClusterBootstrapTemplate and TanzuKubernetesRelease
+        osi_images_list = []
+        isOsimage = False
+
+        for filename in config_data_list.values():
+            data = ""
+
+            with open(filename, 'r') as file:
+                content = file.read()
+                if not content.endswith("\n"):
+                    content += "\n"
+                data = data + "---\n" + content
+
+                info = yaml.safe_load(content)
+                if "OSImage" in filename:
+                    osi_content = {}
+                    osi_content["name"] = info["metadata"]["name"]
+                    osi_content["value"] = self.encode(data, osi_content["name"])
+                    osi_images_list.append(osi_content)
+                    isOsimage = True
+                    continue
+
+                else:
+                    metadata_version = tkr_version
+                    if "ClusterBootstrapTemplate" in filename:
+                        split_version = info["metadata"]["name"]
+                        # Fetching the short version in order to maintain the max key limit(63 characters) in the ovf
+                        # property
+                        metadata_name = "tkr.cbt"
+                    else:
+                        metadata_name = "tkr"
+
+            inner_data = self.set_inner_data(data, info["metadata"]["name"], metadata_version)
+
+            if validate_addon_key_length("vmware-system." + metadata_name):
+                custom_ovf_properties[f"vmware-system.{metadata_name}"] = inner_data
+
+        if isOsimage:
+            custom_ovf_properties[f"vmware-system.tkr.osi"] = convert_to_xml(json.dumps(osi_images_list))
 
 
 def fetch_addon_image_name(info, image_repo, tkg_core_package, package_name):
@@ -173,33 +411,6 @@ def fetch_kapp_controller_localhost_image(addon_package):
     return localhost_path.split('@')[0]
 
 
-# fetch images path from the package CR
-def fetch_image_path():
-    _, repo_url = fetch_tkr_data()
-    image_repo = ""
-    image_path_list = []
-    localhost_image_path_list = []
-    addon_packages = fetch_addon_packages()
-
-    with open("/image-builder/images/capi/tkr-bom.yaml", 'r') as file:
-        info = yaml.safe_load(file)
-        image_repo = info['imageConfig']['imageRepository']
-        tkg_core_package = info['components']['tkg-core-packages'][0]['images']
-
-    for addon_package in addon_packages:
-        package_name = addon_package.split("/")[-1]
-        image_path = fetch_addon_image_name(info, image_repo, tkg_core_package, package_name)
-        image_path_list.append(image_path)
-        if "kapp-controller" in addon_package:
-            localhost_image = fetch_kapp_controller_localhost_image(addon_package)
-            localhost_image_path_list.append(localhost_image)
-            continue
-        localhost_image = image_path.replace(image_path.split('/')[0], localhost_path)
-        localhost_image_path_list.append(":".join(localhost_image.split(":")[:-1]))
-
-    return image_path_list, localhost_image_path_list
-
-
 # parse the data from package and packageMetadata CR for each addon
 def fetch_file_contents(addon_package):
     data = ""
@@ -217,20 +428,6 @@ def fetch_file_contents(addon_package):
     return data, info
 
 
-# parse the data from config CR for each addon
-def append_addon_config(data, addon_package):
-    if addon_package in config_data_list:
-        filename = config_data_list[addon_package]
-        config_data_list.pop(addon_package)
-        with open(filename, 'r') as file:
-            content = file.read()
-            if not content.endswith("\n"):
-                content += "\n"
-            data = data + "---\n" + content
-
-    return data
-
-
 # validate if the key length is less than 62, DO NOT CHANGE THIS LIMIT
 # as this limitation comes from VirtualMachine Image name
 def validate_addon_key_length(key):
@@ -239,9 +436,19 @@ def validate_addon_key_length(key):
     return True
 
 
-# compress the addon value yamls and encode to base64
-def compress_and_base64_encode(text):
+# canonicalize the addon value yamls, drops the comments and the formatting
+def canonicalize_yaml(text):
+    documents = [document for document in yaml.load_all(text, Loader=CanonicalLoader) if document is not None]
+    return yaml.dump_all(documents, Dumper=CompactDumper, sort_keys=False, explicit_start=True,
+                         width=float("inf"))
+
+
+# compress the addon value yamls and encode to base64, the compact encoding
+# uses the maximum level and a zero mtime so the output is deterministic
+def compress_and_base64_encode(text, compact=False):
     data = bytes(text, 'utf-8')
+    if compact:
+        return str(base64.b64encode(gzip.compress(data, compresslevel=9, mtime=0)), 'utf-8')
     with io.BytesIO() as buff:
         g = gzip.GzipFile(fileobj=buff, mode='wb')
         g.write(data)
@@ -250,10 +457,11 @@ def compress_and_base64_encode(text):
         return str(base64.b64encode(buff.getvalue()), 'utf-8')
 
 
-def set_inner_data(data, name, version):
+def set_inner_data(data, name, version, encode=compress_and_base64_encode):
     inner_data = {}
 
-    encoded_data = compress_and_base64_encode(data)
+    with build_profiler.span("compress {}".format(name)):
+        encoded_data = encode(data)
     inner_data["name"] = name
     inner_data["type"] = "inline"
     inner_data["version"] = version
@@ -263,106 +471,53 @@ def set_inner_data(data, name, version):
     return inner_data
 
 
-def create_utkg_tkr_metadata_ovf_properties():
-    addon_packages = downloadUtkgAddonFiles()
-
-    # map config CR with corresponding Addon Package
-    for filename in os.listdir(config_directory):
-        is_addon = False
-        for addon_package in addon_packages:
-            addon_name = re.sub('[^A-Za-z0-9]+', '', Path(addon_package).stem.split(".")[0])
-            if "pv-csi" in addon_package:
-                addon_name = "csi"
-
-            if addon_name in filename.lower():
-                config_data_list[addon_package] = join(config_directory, filename)
-                is_addon = True
-                break
-        if not is_addon:
-            config_data_list[filename] = join(config_directory, filename)
-
-    # fetch TKR version
-    tkr_version, _ = fetch_tkr_data()
-
-    # add the custom_ovf_property for given list of addons
-    for addon_package in addon_packages:
-        data, info = fetch_file_contents(addon_package)
-        data = append_addon_config(data, addon_package)
-        add_on_version = info["spec"]["version"]
-
-        addon_name = Path(addon_package).stem.split(".")[0]
-        inner_data = set_inner_data(data, addon_name, add_on_version)
-
-        # Renaming the guest-cluster-auth-service to gc-auth-service as the name of the add on becomes
-        # more than 63 chars which is not permissible for VirtualMachineImage Name
-        if addon_name == "guest-cluster-auth-service":
-            addon_name = "gc-auth-service"
-
-        if validate_addon_key_length("vmware-system.guest.kubernetes.addons." + addon_name):
-            custom_ovf_properties[f"vmware-system.guest.kubernetes.addons.{addon_name}"] = inner_data
-
-    # add OSImage, ClusterBootstrapTemplate and TanzuKubernetesRelease
-    osi_images_list = []
-    isOsimage = False
-
-    for filename in config_data_list.values():
-        data = ""
-
-        with open(filename, 'r') as file:
-            content = file.read()
-            if not content.endswith("\n"):
-                content += "\n"
-            data = data + "---\n" + content
-
-            info = yaml.safe_load(content)
-            if "OSImage" in filename:
-                osi_content = {}
-                osi_content["name"] = info["metadata"]["name"]
-                osi_content["value"] = compress_and_base64_encode(data)
-                osi_images_list.append(osi_content)
-                isOsimage = True
-                continue
-
-            else:
-                metadata_version = tkr_version
-                if "ClusterBootstrapTemplate" in filename:
-                    split_version = info["metadata"]["name"]
-                    # Fetching the short version in order to maintain the max key limit(63 characters) in the ovf
-                    # property
-                    metadata_name = "tkr.cbt"
-                else:
-                    metadata_name = "tkr"
-
-        inner_data = set_inner_data(data, info["metadata"]["name"], metadata_version)
+def write_properties_to_file(custom_ovf_properties, filename):
+    with open(filename, 'w') as f:
+        f.write(json.dumps(custom_ovf_properties))
 
-        if validate_addon_key_length("vmware-system." + metadata_name):
-            custom_ovf_properties[f"vmware-system.{metadata_name}"] = inner_data
 
-    if isOsimage:
-        custom_ovf_properties[f"vmware-system.tkr.osi"] = convert_to_xml(json.dumps(osi_images_list))
+def write_size_report(size_report, filename):
+    with open(filename, 'w') as f:
+        f.write(json.dumps(size_report, indent=4))
 
 
-def write_properties_to_file(filename):
-    with open(filename, 'w') as f:
-        f.write(json.dumps(custom_ovf_properties))
+def generate_custom_ovf_properties(kubernetes_config, image_builder_root=default_image_builder_root,
+                                   tkr_metadata_folder=None, compact=False, size_report_file=None):
+    """
+    Generate the custom OVF properties for the given Kubernetes configuration JSON.
+    """
+    custom_ovf_properties = CustomOvfProperties(kubernetes_config, image_builder_root, tkr_metadata_folder, compact)
+    properties = custom_ovf_properties.generate()
+    if size_report_file:
+        write_size_report(custom_ovf_properties.get_size_report(), size_report_file)
+    return properties
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description='Script to generate OVF properties')
     parser.add_argument('--kubernetes_config', required=True,
                         help='Kubernetes related configuration JSON')
     parser.add_argument('--outfile',
                         help='Path to output file')
-    args = parser.parse_args()
-
-    set_versions(args)
-    create_utkg_tkr_metadata_ovf_properties()
-    create_non_addon_ovf_properties()
-    create_non_addon_VKr_constraints_ovf_properties()
-    write_properties_to_file(args.outfile)
+    parser.add_argument('--image_builder_root', required=False,
+                        default=default_image_builder_root,
+                        help='Image builder root folder, default value is {}'.format(default_image_builder_root))
+    parser.add_argument('--tkr_metadata_folder', required=False,
+                        default=None,
+                        help='TKR metadata folder, default value is tkr-metadata under the image builder root')
+    parser.add_argument('--compact', action='store_true',
+                        help='Canonicalize the addon YAML and compress it at the maximum level with a zero mtime')
+    parser.add_argument('--size_report', required=False,
+                        default=None,
+                        help='Path to the JSON report of the property sizes before and after encoding')
+    args = parser.parse_args(argv)
+
+    custom_ovf_properties = generate_custom_ovf_properties(
+        args.kubernetes_config, args.image_builder_root, args.tkr_metadata_folder, args.compact, args.size_report)
+    write_properties_to_file(custom_ovf_properties, args.outfile)
     print(custom_ovf_properties)
 
 
 if __name__ == '__main__':
-    main()
+    build_profiler.run(main, "utkg_custom_ovf_properties")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+# © Broadcom. All Rights Reserved.
+# The term “Broadcom” refers to Broadcom Inc. and/or its subsidiaries.
+# SPDX-License-Identifier: MPL-2.0
+
+import argparse
+import glob
+import json
+import os
+import struct
+import zlib
+
+SECTOR_SIZE = 512
+VMDK_MAGIC = b'KDMV'
+VMDK_HEADER_FORMAT = '<4sIIQQQQIQQQ'
+VMDK_MARKER_FORMAT = '<QII'
+# Grain markers only carry the LBA and the compressed size
+VMDK_GRAIN_MARKER_SIZE = 12
+VMDK_MARKER_EOS = 0
+VMDK_FLAG_COMPRESSED = 1 << 16
+# Grain table entry of a grain that is not allocated, or a zero grain without data
+VMDK_GTE_UNALLOCATED = 0
+VMDK_GTE_ZERO = 1
+# Block size used when scanning VMDKs that are not stream-optimized
+RAW_GRAIN_SIZE = 65536
+
+GPT_SIGNATURE = b'EFI PART'
+GPT_HEADER_FORMAT = '<8sIIIIQQQQ16sQII'
+GPT_ENTRY_FORMAT = '<16s16sQQQ72s'
+MBR_SIGNATURE = b'\x55\xaa'
+MBR_ENTRY_FORMAT = '<B3sB3sII'
+
+guest_disk_usage_file = "disk_usage.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Script to report the allocated, zero and compressed space of the VMDKs generated by packer')
+    parser.add_argument('--output_dir', required=True,
+                        help='Packer output folder containing the VMDK files')
+    parser.add_argument('--outfile', required=True,
+                        help='Path to the JSON report')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = analyze_output_dir(args.output_dir)
+    with open(args.outfile, 'w') as fp:
+        json.dump(report, fp, indent=4)
+    print_summary(report)
+
+
+def analyze_output_dir(output_dir):
+    """
+    Analyze all the VMDKs in the packer output folder and attach the directory
+    sizes gathered by the ansible-finalize role when present.
+    """
+    report = {"vmdks": []}
+    for vmdk_file in sorted(glob.glob(os.path.join(output_dir, "*.vmdk"))):
+        report["vmdks"].append(analyze_vmdk(vmdk_file))
+
+    disk_usage_file = os.path.join(output_dir, guest_disk_usage_file)
+    if os.path.exists(disk_usage_file):
+        with open(disk_usage_file, 'r') as fp:
+            report["guest_disk_usage"] = json.load(fp)
+    return report
+
+
+def analyze_vmdk(vmdk_file):
+    with open(vmdk_file, 'rb') as fp:
+        header = fp.read(struct.calcsize(VMDK_HEADER_FORMAT))
+        if header[:4] == VMDK_MAGIC:
+            _, _, flags, capacity, grain_size, _, _, num_gtes_per_gt, _, gd_offset, overhead = \
+                struct.unpack(VMDK_HEADER_FORMAT, header)
+            if flags & VMDK_FLAG_COMPRESSED:
+                return analyze_stream_optimized(fp, vmdk_file, capacity, grain_size, overhead)
+            return analyze_sparse(fp, vmdk_file, capacity, grain_size, num_gtes_per_gt, gd_offset)
+        return analyze_raw(fp, vmdk_file)
+
+
+def analyze_stream_optimized(fp, vmdk_file, capacity, grain_size, overhead):
+    """
+    Walk the grain markers of a stream-optimized VMDK. Grains that are not
+    present in the stream are unallocated, grains present in the stream that
+    decompress to zeros are reclaimable.
+    """
+    grain_bytes = grain_size * SECTOR_SIZE
+    zero_grain = bytes(grain_bytes)
+    marker_size = struct.calcsize(VMDK_MARKER_FORMAT)
+    file_size = os.path.getsize(vmdk_file)
+    grains = []
+    partitions = []
+
+    position = overhead * SECTOR_SIZE
+    while position + marker_size <= file_size:
+        fp.seek(position)
+        lba, data_size, marker_type = struct.unpack(VMDK_MARKER_FORMAT, fp.read(marker_size))
+        if data_size > 0:
+            fp.seek(position + VMDK_GRAIN_MARKER_SIZE)
+            data = zlib.decompress(fp.read(data_size))
+            if lba == 0:
+                partitions = parse_partition_table(data)
+            grains.append((lba, data_size, data == zero_grain[:len(data)]))
+            length = VMDK_GRAIN_MARKER_SIZE + data_size
+        elif marker_type == VMDK_MARKER_EOS:
+            break
+        else:
+            length = SECTOR_SIZE + lba * SECTOR_SIZE
+        position += -(-length // SECTOR_SIZE) * SECTOR_SIZE
+
+    return build_report(vmdk_file, capacity, grain_size, grains, partitions)
+
+
+def analyze_sparse(fp, vmdk_file, capacity, grain_size, num_gtes_per_gt, gd_offset):
+    """
+    Walk the grain directory and grain tables of an uncompressed sparse VMDK.
+    Grains without a grain table entry are unallocated, allocated grains that
+    only hold zeros are reclaimable.
+    """
+    grain_bytes = grain_size * SECTOR_SIZE
+    zero_grain = bytes(grain_bytes)
+    gt_count = -(-capacity // (grain_size * num_gtes_per_gt))
+    grains = []
+    partitions = []
+
+    fp.seek(gd_offset * SECTOR_SIZE)
+    gd = struct.unpack('<{}I'.format(gt_count), fp.read(4 * gt_count))
+    for gt_index, gt_offset in enumerate(gd):
+        if gt_offset == 0:
+            continue
+        fp.seek(gt_offset * SECTOR_SIZE)
+        gt = struct.unpack('<{}I'.format(num_gtes_per_gt), fp.read(4 * num_gtes_per_gt))
+        for gte_index, grain_offset in enumerate(gt):
+            if grain_offset in (VMDK_GTE_UNALLOCATED, VMDK_GTE_ZERO):
+                continue
+            lba = (gt_index * num_gtes_per_gt + gte_index) * grain_size
+            if lba >= capacity:
+                break
+            fp.seek(grain_offset * SECTOR_SIZE)
+            data = fp.read(grain_bytes)
+            if lba == 0:
+                partitions = parse_partition_table(data)
+            grains.append((lba, len(data), data == zero_grain[:len(data)]))
+
+    return build_report(vmdk_file, capacity, grain_size, grains, partitions)
+
+
+def analyze_raw(fp, vmdk_file):
+    """
+    Fallback for flat disks, every block is considered allocated.
+    """
+    grain_size = RAW_GRAIN_SIZE // SECTOR_SIZE
+    zero_grain = bytes(RAW_GRAIN_SIZE)
+    grains = []
+    partitions = []
+    fp.seek(0)
+    lba = 0
+    while True:
+        data = fp.read(RAW_GRAIN_SIZE)
+        if not data:
+            break
+        if lba == 0:
+            partitions = parse_partition_table(data)
+        grains.append((lba, len(data), data == zero_grain[:len(data)]))
+        lba += grain_size
+    capacity = lba
+    return build_report(vmdk_file, capacity, grain_size, grains, partitions)
+
+
+def parse_partition_table(data):
+    """
+    Returns the list of partitions from a GPT or MBR partition table stored in
+    the first grain of the disk.
+    """
+    partitions = []
+    gpt_header = data[SECTOR_SIZE:SECTOR_SIZE + struct.calcsize(GPT_HEADER_FORMAT)]
+    if gpt_header[:8] == GPT_SIGNATURE:
+        fields = struct.unpack(GPT_HEADER_FORMAT, gpt_header)
+        entries_lba, entries_count, entry_size = fields[10], fields[11], fields[12]
+        for index in range(entries_count):
+            start = entries_lba * SECTOR_SIZE + index * entry_size
+            entry = data[start:start + struct.calcsize(GPT_ENTRY_FORMAT)]
+            if len(entry) < struct.calcsize(GPT_ENTRY_FORMAT):
+                break
+            type_guid, _, first_lba, last_lba, _, name = struct.unpack(GPT_ENTRY_FORMAT, entry)
+            if type_guid == bytes(16):
+                continue
+            partitions.append({
+                "index": index + 1,
+                "name": name.decode('utf-16-le').rstrip('\x00'),
+                "start_lba": first_lba,
+                "end_lba": last_lba,
+            })
+    elif data[510:512] == MBR_SIGNATURE:
+        for index in range(4):
+            start = 446 + index * 16
+            _, _, partition_type, _, first_lba, sectors = struct.unpack(MBR_ENTRY_FORMAT, data[start:start + 16])
+            if partition_type == 0:
+                continue
+            partitions.append({
+                "index": index + 1,
+                "name": "type-0x%02x" % partition_type,
+                "start_lba": first_lba,
+                "end_lba": first_lba + sectors - 1,
+            })
+    return partitions
+
+
+def build_report(vmdk_file, capacity, grain_size, grains, partitions):
+    grain_bytes = grain_size * SECTOR_SIZE
+    for partition in partitions:
+        partition.update({"allocated_grains": 0, "zero_grains": 0, "compressed_bytes": 0})
+    unpartitioned = {"allocated_grains": 0, "zero_grains": 0, "compressed_bytes": 0}
+
+    allocated = 0
+    zero = 0
+    compressed_bytes = 0
+    for lba, size, is_zero in grains:
+        allocated += 1
+        zero += int(is_zero)
+        compressed_bytes += size
+        region = unpartitioned
+        for partition in partitions:
+            if partition["start_lba"] <= lba <= partition["end_lba"]:
+                region = partition
+                break
+        region["allocated_grains"] += 1
+        region["zero_grains"] += int(is_zero)
+        region["compressed_bytes"] += size
+
+    total_grains = -(-capacity // grain_size)
+    return {
+        "vmdk": os.path.basename(vmdk_file),
+        "file_size_bytes": os.path.getsize(vmdk_file),
+        "capacity_bytes": capacity * SECTOR_SIZE,
+        "grain_size_bytes": grain_bytes,
+        "total_grains": total_grains,
+        "allocated_grains": allocated,
+        "unallocated_grains": total_grains - allocated,
+        "zero_grains": zero,
+        "reclaimable_bytes": zero * grain_bytes,
+        "compressed_bytes": compressed_bytes,
+        "partitions": partitions,
+        "unpartitioned": unpartitioned,
+    }
+
+
+def print_summary(report):
+    for vmdk in report["vmdks"]:
+        print("VMDK {}: {} of {} grains allocated, {} zero grains ({} MiB reclaimable), {} MiB compressed".format(
+            vmdk["vmdk"], vmdk["allocated_grains"], vmdk["total_grains"], vmdk["zero_grains"],
+            vmdk["reclaimable_bytes"] // (1024 * 1024), vmdk["compressed_bytes"] // (1024 * 1024)))
+        for partition in vmdk["partitions"]:
+            print("  partition {} ({}): {} grains allocated, {} zero grains, {} MiB compressed".format(
+                partition["index"], partition["name"], partition["allocated_grains"],
+                partition["zero_grains"], partition["compressed_bytes"] // (1024 * 1024)))
+    for entry in report.get("guest_disk_usage", [])[:10]:
+        print("  {:>10} KiB {}".format(entry["size_kb"], entry["path"]))
+
+
+if __name__ == '__main__':
+    main()